@@ -1,7 +1,7 @@
 import os
 import sys
-import zipfile
 
+import chunk_splitter
 from meta import find_event_column_index
 
 def check(gz_fname:str) -> None:
@@ -9,10 +9,9 @@ def check(gz_fname:str) -> None:
         lines = fp.readlines()
     GOLDSTEINSCALE_INDEX = find_event_column_index('GoldsteinScale')
 
-    base_name = os.path.basename(gz_fname)[:-4] # -4 => -len('.zip')
-    with zipfile.ZipFile(gz_fname, 'r') as archive:
-        blob:bytes = archive.read(base_name)
-        for line_index, line in enumerate(blob.split(b'\n')):
+    with chunk_splitter.open_zip_member(gz_fname) as member:
+        csv_lines = chunk_splitter.split_stream_to_lines(member)
+        for line_index, line in enumerate(csv_lines):
             if line == b'':
                 continue
             cols = line.split(b'\t')
@@ -25,7 +24,7 @@ def check(gz_fname:str) -> None:
             except (SystemExit, KeyboardInterrupt):
                 raise
             except:
-                print (f'Offending line {line_index+1}: {str(line,'utf-8')}')
+                print (f'Offending line {line_index+1}: {str(line, "utf-8")}')
                 raise
                 
                 
@@ -1,7 +1,16 @@
+from __future__ import annotations
+
+import contextlib
+import os
 import re
+import typing
+import zipfile
 
 head_re = re.compile(b'\n\\d{14}-\\d+\t\\d{14}\t\\d+\t')
 
+# Amount of decompressed data pulled from an archive member at a time.
+READ_SIZE:int = 4 * 1024 * 1024
+
 def split_to_chunks(blob: bytes):
     pos = 0
     while 1:
@@ -16,6 +25,117 @@ def split_to_chunks(blob: bytes):
         pos = span_start +1
 
 
+def split_stream_to_chunks(fp: typing.BinaryIO,
+                           read_size: int = READ_SIZE,
+                           ) -> typing.Generator[bytes, None, None]:
+    """Same as split_to_chunks() but reads 'fp' 'read_size' bytes at a
+    time, so only the record being assembled has to fit in memory."""
+    pending = b''
+    search_from = 0
+    while block := fp.read(read_size):
+        buf = pending + block
+        pos = 0
+        while 1:
+            match = head_re.search(buf, max(pos, search_from))
+            if match is None:
+                break
+            span_start = match.start()
+            yield buf[pos:span_start]
+            pos = span_start + 1
+        pending = buf[pos:]
+        # A header cut by the end of 'buf' can only begin at the last
+        # newline, as headers contain none themselves.
+        last_newline = pending.rfind(b'\n')
+        search_from = last_newline if 0 <= last_newline else len(pending)
+    if pending:
+        yield pending
+
+
+def split_stream_to_lines(fp: typing.BinaryIO,
+                          read_size: int = READ_SIZE,
+                          ) -> typing.Generator[bytes, None, None]:
+    """Yields the lines of 'fp' without their terminating newline, as
+    blob.split(b'\\n') would, minus the empty piece after the final one."""
+    pending = b''
+    while block := fp.read(read_size):
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+def find_record_start(fp: typing.BinaryIO, pos: int,
+                      read_size: int = READ_SIZE) -> int | None:
+    """The offset of the first newline at or after 'pos' that is followed
+    by a record header, i.e. where split_to_chunks() would cut, or None
+    if there is none."""
+    # Enough of the previous block to hold a header cut by the block end
+    overlap = 64
+    fp.seek(pos)
+    buf = b''
+    buf_start = pos
+    while block := fp.read(read_size):
+        buf += block
+        match = head_re.search(buf)
+        if match is not None:
+            return buf_start + match.start()
+        keep = min(len(buf), overlap)
+        buf_start += len(buf) - keep
+        buf = buf[len(buf) - keep:]
+    return None
+
+
+def find_record_ranges(fp: typing.BinaryIO, parts: int,
+                       read_size: int = READ_SIZE,
+                       ) -> list[tuple[int, int, int]]:
+    """Splits the records of 'fp' into at most 'parts' byte ranges of
+    about the same size, as (start, end, newlines before start). A range
+    stops short of the newline before the next record header, so that
+    split_to_chunks() gives the same records for each range as it does
+    for that part of the whole file."""
+    fp.seek(0, os.SEEK_END)
+    size = fp.tell()
+    cuts: list[int] = []
+    for k in range(1, parts):
+        target = max(size * k // parts, cuts[-1] + 1 if cuts else 0)
+        cut = find_record_start(fp, target, read_size)
+        if cut is None:
+            break
+        cuts.append(cut)
+    ranges = []
+    newlines = 0
+    fp.seek(0)
+    for start, end in zip([0] + [cut + 1 for cut in cuts], cuts + [size]):
+        remaining = start - fp.tell()
+        while 0 < remaining:
+            block = fp.read(min(read_size, remaining))
+            if not block:
+                break
+            newlines += block.count(b'\n')
+            remaining -= len(block)
+        ranges.append((start, end, newlines))
+    return ranges
+
+
+def zip_member_size(zip_path: str) -> int:
+    """The decompressed size of the CSV inside a GDELT zip file."""
+    base_name = os.path.basename(zip_path)[:-4] # name without '.zip'
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        return archive.getinfo(base_name).file_size
+
+
+@contextlib.contextmanager
+def open_zip_member(zip_path: str) -> typing.Generator[typing.BinaryIO,
+                                                       None, None]:
+    """Opens the CSV inside a GDELT zip file, which is named after the
+    archive without its '.zip' suffix, for streaming decompression."""
+    base_name = os.path.basename(zip_path)[:-4] # name without '.zip'
+    with zipfile.ZipFile(zip_path, 'r') as archive:
+        with archive.open(base_name) as member:
+            yield typing.cast(typing.BinaryIO, member)
+
+
 
 if __name__ == '__main__':
     # with open('20150219174500.gkg.csv', 'rb') as f:
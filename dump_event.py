@@ -1,7 +1,7 @@
-import os
 import sys
-import zipfile
+import typing
 
+import chunk_splitter
 import meta
 
 first_entry = True
@@ -18,31 +18,24 @@ def dump_event(line:bytes) -> None:
         print (f'{tag:<{max_taglen}}: {value}')
     
 
-def dump_events_in_lines(lines:list[bytes], line_indices:list[int]) -> None:
-    enumerated_lines = list(enumerate(lines))
-    if len(line_indices) == 0:
-        # dump all lines if no line indices are specified.
-        line_indices = list(range(len(lines)))
-    else:
-        line_indices.sort()
-    # Reverse lists to avoid pop(0) which has O(n) complexity.
-    enumerated_lines.reverse()
-    line_indices.reverse()
-    while len(enumerated_lines) and len(line_indices):
-        if enumerated_lines[-1][0] == line_indices[-1]:
-            dump_event(enumerated_lines[-1][1])
-            line_indices.pop()
-        enumerated_lines.pop()
+def dump_events_in_lines(lines:typing.Iterable[bytes],
+                         line_indices:list[int]) -> None:
+    # dump all lines if no line indices are specified.
+    wanted = set(line_indices)
+    last_index = max(wanted, default=None)
+    for index, line in enumerate(lines):
+        if not wanted or index in wanted:
+            dump_event(line)
+        if last_index is not None and last_index <= index:
+            # Stop decompressing once the last requested line is seen.
+            break
 
 
 def dump_events(gz_filepath:str, line_indices:list[int]) -> None:
     assert gz_filepath.endswith('.zip')
-    base_name = os.path.basename(gz_filepath)[:-4] # -4 => -len('.zip')
-    with zipfile.ZipFile(gz_filepath, 'r') as archive:
-        lines = [x for x in archive.read(base_name).split(b'\n')]
-        if lines[-1] == b'':
-            lines.pop()
-        dump_events_in_lines(lines, line_indices)
+    with chunk_splitter.open_zip_member(gz_filepath) as member:
+        dump_events_in_lines(chunk_splitter.split_stream_to_lines(member),
+                             line_indices)
     
 
 def main(src_spec) -> None:
@@ -0,0 +1,137 @@
+"""
+The pieces of an in-process replacement for MongoImport: rows of a GDELT
+TSV file are typed with a field file and turned into documents, and each
+file's load is timed. events_import and mentions_import put them together
+into pipelines that write the documents with unordered bulk inserts.
+"""
+from __future__ import annotations
+
+import dataclasses
+import io
+import os
+import typing
+import zipfile
+
+DEFAULT_FIELD_FILE:str = os.path.join(os.path.dirname(__file__),
+                                      'gdelt_field_file.ff')
+MENTIONS_FIELD_FILE:str = os.path.join(os.path.dirname(__file__),
+                                       'gdelt_mentions_field_file.ff')
+
+# Both field file formats in the tree: mongoimport's 'Name.int64()' lines
+# and the '[Name]' / 'type=int' pairs of GDELT.ff.
+FIELD_TYPES = {
+    'int64': int, 'int32': int, 'int': int,
+    'double': float, 'float': float,
+    'string': None, 'str': None, 'auto': None,
+}
+
+Field = tuple[str, typing.Callable[[bytes], object] | None]
+
+
+def read_field_file(path: str = DEFAULT_FIELD_FILE) -> list[Field]:
+    """Returns (name, converter) for each column in 'path', where the
+    converter is None for string columns."""
+    fields: list[Field] = []
+    with open(path) as ff:
+        lines = [line.strip() for line in ff if line.strip()]
+    if lines and lines[0].startswith('['):
+        for header, type_line in zip(lines[::2], lines[1::2]):
+            name = header.strip('[]')
+            key, _, type_name = type_line.partition('=')
+            if key != 'type':
+                raise ValueError(f"{path}: expected 'type=' after "
+                                 f"'{header}', got '{type_line}'")
+            fields.append((name, FIELD_TYPES[type_name]))
+    else:
+        for line in lines:
+            name, _, type_name = line.partition('.')
+            fields.append((name, FIELD_TYPES[type_name.rstrip('()')]))
+    return fields
+
+
+class RowError(ValueError):
+    """A required column of a row is empty or doesn't convert."""
+
+
+def compile_row_parser(fields: list[Field],
+                       required: typing.Collection[str] = (),
+                       ) -> typing.Callable[[list[bytes]], dict]:
+    """Returns a function turning the tab separated values of a row into a
+    document. Like mongoimport --parseGrace=skipField, a typed value that
+    doesn't convert (an empty one included) is left out of the document,
+    unless its column is in 'required', in which case RowError is
+    raised."""
+    plan = tuple(fields)
+
+    def parse(vec: list[bytes]) -> dict:
+        doc = {}
+        for (name, convert), value in zip(plan, vec):
+            if convert is None:
+                doc[name] = value.decode('utf-8', 'replace')
+            elif value:
+                try:
+                    doc[name] = convert(value)
+                except ValueError:
+                    pass
+        return doc
+
+    if not required:
+        return parse
+
+    # The same loop, checking as it converts so that validation costs no
+    # extra pass over the row.
+    strict_plan = tuple((name, convert, name in required)
+                        for name, convert in fields)
+
+    def parse_strict(vec: list[bytes]) -> dict:
+        doc = {}
+        for (name, convert, must), value in zip(strict_plan, vec):
+            if convert is None:
+                doc[name] = value.decode('utf-8', 'replace')
+            elif value:
+                try:
+                    doc[name] = convert(value)
+                except ValueError:
+                    if must:
+                        raise RowError(
+                            f"bad {name} '{value.decode('utf-8', 'replace')}'")
+            elif must:
+                raise RowError(f'empty {name}')
+        return doc
+
+    return parse_strict
+
+
+@dataclasses.dataclass
+class LoadStats:
+    filename: str
+    lines: int = 0
+    inserted: int = 0
+    rejected: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def add(self, other: LoadStats) -> None:
+        self.lines += other.lines
+        self.inserted += other.inserted
+        self.rejected += other.rejected
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+
+    def __str__(self) -> str:
+        seconds = max(self.seconds, 1e-9)
+        return (f'{self.filename}: {self.inserted} inserted, '
+                f'{self.rejected} rejected of {self.lines} lines '
+                f'in {self.seconds:.2f}s ({self.lines / seconds:.0f} lines/s, '
+                f'{self.bytes / seconds / 1e6:.1f} MB/s)')
+
+
+def read_lines(path: str) -> typing.Iterator[bytes]:
+    """The lines of a CSV file, or of the one member of a zipped one."""
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(archive.namelist()[0]) as member:
+                yield from io.BufferedReader(member, 1024 * 1024)
+    else:
+        with open(path, 'rb') as input_file:
+            yield from input_file
@@ -1,23 +1,18 @@
+import collections
 import hashlib
 import os
-import sys
+import shutil
+import threading
 import zipfile
+from concurrent import futures
 from enum import Enum
-from typing import List
+from typing import Callable, Iterator, List, NamedTuple, Optional
 
 from requests import exceptions
 
 #from gdelttools.mongoimport import MongoImport
-from gdelttools.web import WebDownload
-
-
-def compute_md5(file):
-    hasher = hashlib.md5()
-    with open(file, 'rb') as input:
-        buf = input.read()
-        hasher.update(buf)
-
-    return hasher.hexdigest()
+from gdelttools import masterindex, web
+from gdelttools.web import WebDownload, DownloadVerificationError
 
 
 class GDELTChecksumError(ValueError):
@@ -84,26 +79,39 @@ class GDELTFile:
         return self._csv_filename
 
     def download_file(self):
-        print(f"{self.url} --> ", end="")
-        self._zip_filename = self._wd.download_url(self.url)
-        if not self.is_valid_checksum():
-            raise GDELTChecksumError(self.url)
-        print(f"{self.zip_filename}")
+        # The MD5 and size are checked as the zip streams in, so a bad
+        # download never lands under zip_filename.
+        try:
+            self._zip_filename = self._wd.download_url(self.url, self.zip_filename,
+                                                       hasher=hashlib.md5(),
+                                                       expected_digest=self.md5,
+                                                       expected_size=self.size)
+        except DownloadVerificationError as e:
+            raise GDELTChecksumError(str(e)) from e
+        # One print per file so that concurrent downloads don't interleave
+        print(f"{self.url} --> {self.zip_filename}")
         return self.zip_filename
 
-    def is_valid_checksum(self):
-        computed_md5 = compute_md5(self._zip_filename)
-        return computed_md5 == self.md5
-
-    def process_zip_file(self, overwrite: bool = True):
+    def process_zip_file(self, overwrite: bool = True, extract: bool = True):
         #
         # If overwrite download and extract
         # else
+        #
+        # Without extract the zip is left as it is, for readers that can
+        # stream it, and its name is returned instead of the CSV's.
         if overwrite:
             self._zip_filename = self.download_file()
+            if not extract:
+                return self.zip_filename
             self._csv_filename = self.extract_csv_file()
             return self.csv_filename
 
+        elif not extract:
+            if os.path.exists(self.zip_filename):
+                print(f"{self.zip_filename} exists")
+            else:
+                self._zip_filename = self.download_file()
+            return self.zip_filename
         elif os.path.exists(self.csv_filename):
             print(f"{self.csv_filename} exists")
         elif os.path.exists(self.zip_filename):
@@ -115,17 +123,31 @@ class GDELTFile:
             self._csv_filename = self.extract_csv_file()
         return self._csv_filename
 
+    UNZIP_CHUNK_SIZE = 1024 * 1024
+
     @staticmethod
-    def unzip(filename: str):
+    def unzip(filename: str, chunk_size: int = UNZIP_CHUNK_SIZE):
+        """
+        Extracts the one member of filename into the current directory,
+        chunk_size bytes at a time so that memory use doesn't grow with
+        the member. The member only appears under its own name once it is
+        complete.
+        """
         zfilename = None
         with zipfile.ZipFile(filename) as archive:
             if len(archive.namelist()) > 1:
                 raise GDELTZipError(f"More than one file in archive: {filename}")
             for zfilename in archive.namelist():
-                text = archive.read(zfilename)  # .decode(encoding="utf-8")
                 print(f"extracting: '{zfilename}'")
-                with open(zfilename, "wb") as output_file:
-                    output_file.write(text)
+                tmp_filename = zfilename + ".tmp"
+                try:
+                    with archive.open(zfilename) as member, open(tmp_filename, "wb") as output_file:
+                        shutil.copyfileobj(member, output_file, chunk_size)
+                except BaseException:
+                    if os.path.exists(tmp_filename):
+                        os.unlink(tmp_filename)
+                    raise
+                os.replace(tmp_filename, zfilename)
         return zfilename
 
     def extract_csv_file(self):
@@ -134,53 +156,164 @@ class GDELTFile:
 
     @classmethod
     def get_input_files(cls, f: str, last : int):
-        lines = []
+        if last > 0:
+            # Three files per set (gkg, export, mentions), read through the
+            # index rather than by loading the whole masterfile.
+            return [entry.line for entry in masterindex.open_index(f).last(last * 3)]
         with open(f, "r") as input_file:
-            for input_line in input_file:
-                lines.append(input_line)
-            if last > 0:
-                section = len(lines) - (last * 3)  # three files per set, gkg, export, mentions
-                lines = lines[section:]  # slice the last days
-        return lines
+            return input_file.readlines()
 
 
-def download_gdelt_files(file_list: List[str], last=None, filter:GDELTFilter=GDELTFilter.all,  overwrite=False):
+class GDELTDownloadResult(NamedTuple):
+    gdelt_file: GDELTFile
+    filename: Optional[str] = None  # the CSV, or the zip if not extracting
+    error: Optional[Exception] = None
 
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class ByteBudget:
+    """
+    Caps the bytes downloads have in flight. A file bigger than the whole
+    budget is let through once nothing else is in flight, so that it can't
+    block forever.
+    """
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self, size: int):
+        with self._cond:
+            self._cond.wait_for(lambda: self._in_flight == 0 or
+                                        self._in_flight + size <= self._limit)
+            self._in_flight += size
+
+    def release(self, size: int):
+        with self._cond:
+            self._in_flight -= size
+            self._cond.notify_all()
+
+
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_INFLIGHT_BYTES = 256 * 1024 * 1024
+
+
+def select_gdelt_files(file_list: List[str], last=None,
+                       filter: GDELTFilter = GDELTFilter.all) -> List[GDELTFile]:
     if last is None or last < 0:
         last = 0
 
-    csv_files: List[str] = []
+    gdelt_files: List[GDELTFile] = []
     for f in file_list:
-        lines = GDELTFile.get_input_files(f, last)
-        # with open(f, "r") as input_file:
-        #     for input_line in input_file:
-        #         lines.append(input_line)
-        #
-        #     if last > 0:
-        #         section = len(lines) - (last * 3)  # three files per set, gkg, exports, mentions
-        #         lines = lines[section:]  # slice the last days
-
-        #importer = MongoImport()
-        for l in lines:
-            try:
-                size, md5, zipurl = l.split()
-                gdelt_file = GDELTFile(zipurl, int(size), md5, filter)
-                # print(f"{size}:{sha}:{zip}")
-                if (gdelt_file.filter.value in zipurl) or (gdelt_file.filter == GDELTFilter.all):
-                    f = gdelt_file.process_zip_file(overwrite)
-                    #importer.command(f)
-                    csv_files.append(f)
-
-            except zipfile.BadZipfile as e:
-                print(gdelt_file.zip_filename)
-                print(e)
-                sys.exit(1)
-            except exceptions.HTTPError as e:
-                print(f"Error for {zipurl}")
-                print(e)
-                sys.exit(1)
-            except GDELTChecksumError as e:
-                print(f"'{gdelt_file.md5}' checksum for {gdelt_file.url} doesn't match\n"
-                      f" checksum for {gdelt_file.zip_filename}")
-                sys.exit(1)
+        for l in GDELTFile.get_input_files(f, last):
+            size, md5, zipurl = l.split()
+            gdelt_file = GDELTFile(zipurl, int(size), md5, filter)
+            if (gdelt_file.filter.value in zipurl) or (gdelt_file.filter == GDELTFilter.all):
+                gdelt_files.append(gdelt_file)
+    return gdelt_files
+
+
+def fetch_gdelt_file(gdelt_file: GDELTFile, overwrite=False, extract=True) -> GDELTDownloadResult:
+    try:
+        return GDELTDownloadResult(gdelt_file, gdelt_file.process_zip_file(overwrite, extract))
+    except (zipfile.BadZipfile, GDELTZipError, GDELTChecksumError,
+            exceptions.RequestException, OSError) as e:
+        return GDELTDownloadResult(gdelt_file, error=e)
+
+
+def fetch_gdelt_files(gdelt_files: List[GDELTFile], overwrite=False,
+                      workers: int = DEFAULT_WORKERS,
+                      max_inflight_bytes: int = DEFAULT_MAX_INFLIGHT_BYTES,
+                      ordered=True, extract=True) -> Iterator[GDELTDownloadResult]:
+    """
+    Downloads (and extracts) gdelt_files on a pool of worker threads, keeping
+    at most max_inflight_bytes (by masterfile size) downloading at once.
+    Yields one result per file, in masterfile order if ordered is set and
+    in order of completion if not. A failure is reported in its own result
+    and doesn't stop the other downloads.
+    """
+    if workers <= 1:
+        for gdelt_file in gdelt_files:
+            yield fetch_gdelt_file(gdelt_file, overwrite, extract)
+        return
+
+    web.ensure_pool_maxsize(workers)
+    budget = ByteBudget(max_inflight_bytes)
+
+    def fetch(gdelt_file: GDELTFile):
+        try:
+            return fetch_gdelt_file(gdelt_file, overwrite, extract)
+        finally:
+            budget.release(gdelt_file.size)
+
+    pending: collections.deque = collections.deque()
+
+    def finished():
+        if ordered:
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+        else:
+            for future in [f for f in pending if f.done()]:
+                pending.remove(future)
+                yield future.result()
+
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for gdelt_file in gdelt_files:
+            budget.acquire(gdelt_file.size)
+            pending.append(executor.submit(fetch, gdelt_file))
+            yield from finished()
+        while pending:
+            if ordered:
+                pending[0].result()
+            else:
+                futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            yield from finished()
+
+
+def report_download_error(result: GDELTDownloadResult):
+    gdelt_file = result.gdelt_file
+    e = result.error
+    if isinstance(e, GDELTChecksumError):
+        print(f"'{gdelt_file.md5}' checksum for {gdelt_file.url} doesn't match\n"
+              f" checksum for {gdelt_file.zip_filename}")
+    elif isinstance(e, (zipfile.BadZipfile, GDELTZipError)):
+        print(gdelt_file.zip_filename)
+        print(e)
+    else:
+        print(f"Error for {gdelt_file.url}")
+        print(e)
+
+
+def download_gdelt_files(file_list: List[str], last=None, filter:GDELTFilter=GDELTFilter.all,  overwrite=False,
+                         workers: int = DEFAULT_WORKERS,
+                         max_inflight_bytes: int = DEFAULT_MAX_INFLIGHT_BYTES,
+                         extract=True,
+                         on_error: Optional[Callable[[GDELTDownloadResult], None]] = None):
+    """
+    Returns the CSV files that downloaded and extracted cleanly, in
+    masterfile order, or the zip files if extract is False. Files that
+    failed are reported, passed to on_error if given, and left out.
+    """
+    csv_files: List[str] = []
+    failed = 0
+    gdelt_files = select_gdelt_files(file_list, last, filter)
+    for result in fetch_gdelt_files(gdelt_files, overwrite, workers, max_inflight_bytes,
+                                    extract=extract):
+        if result.ok:
+            csv_files.append(result.filename)
+        else:
+            failed += 1
+            report_download_error(result)
+            if on_error is not None:
+                on_error(result)
+    if failed:
+        print(f"{failed} of {len(gdelt_files)} files failed to download")
     return csv_files
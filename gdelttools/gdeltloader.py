@@ -11,10 +11,10 @@ import sys
 import os
 import pymongo
 
-from gdelttools.gdeltfile import download_gdelt_files, GDELTFilter
+from gdelttools.gdeltfile import download_gdelt_files, GDELTFilter, DEFAULT_WORKERS, DEFAULT_MAX_INFLIGHT_BYTES
 from gdelttools.gdeltwebdata import GDELTWebData
+from gdelttools import web
 from gdelttools._version import __version__
-from gdelttools.mongoimport import MongoImport
 
 
 def main():
@@ -22,19 +22,15 @@ def main():
     parser = argparse.ArgumentParser(epilog=f"Version: {__version__}\n"
                                             f"More info : https://github.com/jdrumgoole/gdelttools ")
 
-    parser.add_argument("--host",
-                        help="MongoDB URI")
-
-    parser.add_argument("--database", default="GDELT2",
-                        help="Default database for loading [%(default)s]")
-
-    parser.add_argument("--collection", default="eventscsv",
-                        help="Default collection for loading [%(default)s]")
     parser.add_argument("--master",
                         default=False,
                         action="store_true",
                         help="GDELT master file [%(default)s]")
 
+    parser.add_argument("--sync", nargs="?", const="masterfilelist.txt", default=None,
+                        help="keep a local master file up to date, fetching only what was "
+                             "appended since the last sync [%(const)s]")
+
     parser.add_argument("--update",
                         default=False,
                         action="store_true",
@@ -51,7 +47,9 @@ def main():
                         help="download zip files from master or local file")
 
     parser.add_argument("--importdata", default=False, action="store_true",
-                        help="Import files into MongoDB")
+                        help="import the downloaded export and mentions files into the gdelt "
+                             "database of $MONGO_DB_HOST with events_import and mentions_import, "
+                             "which are beside this package in the repository")
     parser.add_argument("--metadata", action="store_true", default=False,
                         help="grab meta data files")
 
@@ -60,6 +58,27 @@ def main():
 
     parser.add_argument("--last", default=0, type=int, help="how many recent files to download default : [%(default)s] implies all files")
 
+    parser.add_argument("--no-extract", dest="extract", default=True, action="store_false",
+                        help="leave downloaded files zipped, --importdata reads them as they are")
+
+    parser.add_argument("--workers", default=DEFAULT_WORKERS, type=int,
+                        help="files to download and to import concurrently [%(default)s]")
+
+    parser.add_argument("--batch-size", default=1000, type=int,
+                        help="number of records per bulk insert [%(default)s]")
+
+    parser.add_argument("--batch-age", default=5.0, type=float,
+                        help="seconds a partial batch waits for more records [%(default)s]")
+
+    parser.add_argument("--no-validate", dest="validate", default=True, action="store_false",
+                        help="store lines even if required numbers are missing")
+
+    parser.add_argument("--no-ledger", dest="ledger", default=True, action="store_false",
+                        help="don't record imported files in the import ledger")
+
+    parser.add_argument("--max-inflight-mb", default=DEFAULT_MAX_INFLIGHT_BYTES // (1024 * 1024), type=int,
+                        help="cap on the megabytes being downloaded at once [%(default)s]")
+
     parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
     args = parser.parse_args()
 
@@ -83,6 +102,8 @@ def main():
             GDELTWebData.get_metadata()
 
         input_file_list = []
+        csv_files = []
+        failed = []
 
         if args.master:
             print(f"{GDELTWebData.master_url} ", end="")
@@ -90,6 +111,12 @@ def main():
             print(f"-> {filename}")
             input_file_list.append(filename)
 
+        if args.sync:
+            print(f"{GDELTWebData.master_url} ", end="")
+            filename, appended = GDELTWebData.sync_master_list(args.sync)
+            print(f"-> {filename} (+{appended} bytes)")
+            input_file_list.append(filename)
+
         if args.update:
             print(f"{GDELTWebData.update_url} ", end="")
             filename = GDELTWebData.get_update_list()
@@ -105,14 +132,41 @@ def main():
 
         if args.download:
             if len(input_file_list) > 0:
-                csv_files = download_gdelt_files(input_file_list, args.last, args.filter, args.overwrite)
+                csv_files = download_gdelt_files(input_file_list, args.last, args.filter, args.overwrite,
+                                                 workers=args.workers,
+                                                 max_inflight_bytes=args.max_inflight_mb * 1024 * 1024,
+                                                 extract=args.extract,
+                                                 on_error=failed.append)
+                print(f"HTTP: {web.connection_stats}")
             else:
                 print(f"No files listed for download")
 
         if args.importdata:
-            importer = MongoImport(database_name=args.database, collection_name=args.collection)
-            for f in csv_files:
-                importer.import_data(f)
+            # The importers are scripts at the top of the repository rather
+            # than part of the package.
+            import events_import
+            import mentions_import
+            import options
+
+            export_files = [f for f in csv_files if ".export." in f]
+            mention_files = [f for f in csv_files if ".mentions." in f]
+            skipped = len(csv_files) - len(export_files) - len(mention_files)
+            if skipped:
+                print(f"Skipping {skipped} files that are neither exports nor mentions")
+            opts = options.EventOptions(quiet=False, verbose=False, masterfile="",
+                                        lower_limit_ymdhms="19800101000000",
+                                        upper_limit_ymdhms="20500101000000",
+                                        dry_run=False, no_store=False,
+                                        batch_size=args.batch_size, num_workers=args.workers,
+                                        batch_age=args.batch_age, validate=args.validate,
+                                        ledger=args.ledger)
+            if export_files:
+                events_import.import_files(export_files, opts)
+            if mention_files:
+                mentions_import.import_files(mention_files, opts)
+
+        if failed:
+            sys.exit(1)
 
     except KeyboardInterrupt:
         print("Exiting...")
@@ -1,6 +1,9 @@
+import itertools
+import os
 from datetime import datetime
-from gdelttools.web import WebDownload
-import requests
+
+from gdelttools import masterindex
+from gdelttools.web import WebDownload, local_path
 
 
 class GDELTWebData:
@@ -13,17 +16,17 @@ class GDELTWebData:
     master_url = "http://data.gdeltproject.org/gdeltv2/masterfilelist.txt"
     update_url = "http://data.gdeltproject.org/gdeltv2/lastupdate.txt"
 
+    # Bytes of the local master list fetched again by a sync, to check that
+    # the remote one still starts with it
+    sync_overlap = 4096
+
     downloader = WebDownload()
 
     @classmethod
     def get_metadata(cls):
         # size and MD5 checksums to validate downloads
-        r = requests.get(cls.gdelt_md5_list, allow_redirects=True)
-        with open(cls.checksum_filename, "w") as output_file:
-            output_file.write(r.content.decode("utf-8"))
-        r = requests.get(cls.gdelt_file_sizes, allow_redirects=True)
-        with open(cls.size_filename, "w") as output_file:
-            output_file.write(r.content.decode("utf-8"))
+        cls.downloader.download_url(cls.gdelt_md5_list, cls.checksum_filename)
+        cls.downloader.download_url(cls.gdelt_file_sizes, cls.size_filename)
         return [cls.checksum_filename, cls.size_filename]
 
     @classmethod
@@ -34,3 +37,48 @@ class GDELTWebData:
     def get_master_list(cls, overwrite=False):
         return cls.downloader.download_url(cls.master_url)
 
+    @classmethod
+    def sync_master_list(cls, filename=None):
+        """
+        Brings a local copy of the master list up to date with a Range
+        request for what was appended to it since the last sync, then
+        indexes the new lines. The request starts sync_overlap bytes early
+        and the whole list is downloaded again if those don't match the
+        end of the local copy, i.e. if the remote list was rewritten.
+        Returns the filename and the number of bytes appended.
+        """
+        if filename is None:
+            filename = local_path(cls.master_url)
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        if size == 0:
+            return cls._download_master_list(filename)
+
+        overlap = min(size, cls.sync_overlap)
+        with open(filename, "rb") as local_copy:
+            local_copy.seek(size - overlap)
+            tail = local_copy.read()
+        chunks = cls.downloader.download_chunks(cls.master_url, size - overlap)
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= overlap:
+                break
+        if head[:overlap] != tail:
+            chunks.close()
+            return cls._download_master_list(filename)
+
+        # Everything written is a prefix of the remote list, so a sync
+        # that is cut short is carried on by the next one.
+        appended = 0
+        with open(filename, "ab") as local_copy:
+            for chunk in itertools.chain([head[overlap:]], chunks):
+                local_copy.write(chunk)
+                appended += len(chunk)
+        masterindex.open_index(filename)
+        return filename, appended
+
+    @classmethod
+    def _download_master_list(cls, filename):
+        cls.downloader.download_url(cls.master_url, filename)
+        masterindex.open_index(filename)
+        return filename, os.path.getsize(filename)
@@ -0,0 +1,264 @@
+"""
+A binary-searchable index of a GDELT masterfile list, so that selecting
+the files of a date range doesn't mean reading several hundred thousand
+lines each run.
+
+The index lives beside the masterfile (masterfilelist.txt.idx) and holds a
+fixed-size record per well-formed line: timestamp, type, size, md5 and the
+byte offset of the line, sorted by timestamp. Its header records how many
+bytes of the masterfile it covers, so an update only parses the lines
+appended since the last one. Updates of the same index are serialized
+by a lock on a file beside it (masterfilelist.txt.idx.lock).
+"""
+import os
+import struct
+import tempfile
+import zlib
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows, where updates go unlocked
+    fcntl = None
+
+# The type of a file is the index of the first suffix its URL ends with;
+# 0 is any other file. Translation files end with these suffixes too and
+# so have the same types, as they had when the masterfile was scanned.
+SUFFIXES = ("", ".export.CSV.zip", ".mentions.CSV.zip", ".gkg.csv.zip")
+
+MAGIC = b"GDMI"
+VERSION = 1
+# magic, version, number of records, masterfile bytes indexed, CRC of the
+# tail of those bytes (to notice a masterfile that was replaced)
+HEADER = struct.Struct("<4sHxxQQI4x")
+# timestamp, type, size, md5, offset of the line
+RECORD = struct.Struct("<QB7xQ16sQ")
+TAIL_BYTES = 256
+
+Timestamp = Union[str, int]
+
+
+def kind_of(url: str) -> int:
+    for kind in range(1, len(SUFFIXES)):
+        if url.endswith(SUFFIXES[kind]):
+            return kind
+    return 0
+
+
+class MasterfileEntry(NamedTuple):
+    timestamp: int
+    kind: int
+    size: int
+    md5: str
+    offset: int
+    url: str
+
+    @property
+    def line(self):
+        return f"{self.size} {self.md5} {self.url}\n"
+
+
+def parse_line(line: bytes, offset: int) -> Optional[Tuple]:
+    """The record of a masterfile line, or None if it is ill-formed."""
+    vec = line.split()
+    if len(vec) != 3:
+        return None
+    size, md5, url = vec
+    timestamp = url.rsplit(b"/", 1)[-1][:14]
+    if len(timestamp) != 14 or not timestamp.isdigit() or not size.isdigit() or len(md5) != 32:
+        return None
+    try:
+        digest = bytes.fromhex(md5.decode("ascii"))
+    except ValueError:
+        return None
+    return int(timestamp), kind_of(url.decode("utf-8", "replace")), int(size), digest, offset
+
+
+class MasterfileIndex:
+    """
+    The index of masterfile, kept in index_path (masterfile + '.idx' by
+    default). Call update() to index lines appended since the last update,
+    then select() the entries of a time range.
+    """
+
+    def __init__(self, masterfile: str, index_path: Optional[str] = None):
+        self._masterfile = masterfile
+        self._index_path = index_path or masterfile + ".idx"
+        self._read_header()
+
+    @property
+    def index_path(self):
+        return self._index_path
+
+    @property
+    def indexed_bytes(self):
+        return self._indexed_bytes
+
+    def __len__(self):
+        return self._count
+
+    def _read_header(self):
+        self._count, self._indexed_bytes, self._tail_crc = 0, 0, 0
+        try:
+            with open(self._index_path, "rb") as index_file:
+                header = index_file.read(HEADER.size)
+        except FileNotFoundError:
+            return
+        if len(header) < HEADER.size:
+            return
+        magic, version, count, indexed_bytes, tail_crc = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            return
+        self._count, self._indexed_bytes, self._tail_crc = count, indexed_bytes, tail_crc
+
+    def _tail_crc_of(self, masterfile, end: int) -> int:
+        start = max(0, end - TAIL_BYTES)
+        masterfile.seek(start)
+        return zlib.crc32(masterfile.read(end - start))
+
+    def update(self, msgout: Optional[Callable[[str], None]] = None) -> int:
+        """
+        Indexes the lines added to the masterfile since the last update and
+        returns their number. The whole masterfile is indexed again if it
+        has shrunk or changed before the point the index covers. A partial
+        last line is left for the next update; ill-formed lines are passed
+        to msgout.
+
+        The index is locked for the whole update, so that processes
+        updating it at once take turns rather than overwrite each other.
+        """
+        with open(self._index_path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Whoever held the lock before may have updated the index
+            self._read_header()
+            return self._update(msgout)
+
+    def _update(self, msgout: Optional[Callable[[str], None]]) -> int:
+        with open(self._masterfile, "rb") as masterfile:
+            masterfile.seek(0, os.SEEK_END)
+            size = masterfile.tell()
+            start = self._indexed_bytes
+            if size < start or self._tail_crc_of(masterfile, start) != self._tail_crc:
+                start = 0
+            masterfile.seek(start)
+            records = []
+            offset = start
+            for line in masterfile:
+                if not line.endswith(b"\n"):
+                    break
+                record = parse_line(line, offset)
+                if record is not None:
+                    records.append(record)
+                elif msgout and line.strip():
+                    msgout(f"ill-formed line: '{line.decode('utf-8', 'replace').rstrip()}' @ byte {offset}")
+                offset += len(line)
+            tail_crc = self._tail_crc_of(masterfile, offset)
+
+        if start == offset and start != 0:
+            return 0
+        records.sort()
+        if start == 0:
+            self._rewrite(records, offset, tail_crc)
+        elif self._count and records and records[0] < self._record(self._count - 1):
+            # Older than what is indexed already, so merge rather than append
+            self._rewrite(sorted(list(self._records(0, self._count)) + records), offset, tail_crc)
+        else:
+            self._append(records, offset, tail_crc)
+        return len(records)
+
+    def _rewrite(self, records: List[Tuple], indexed_bytes: int, tail_crc: int):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self._index_path)),
+                                        prefix=os.path.basename(self._index_path) + ".")
+        try:
+            with os.fdopen(fd, "wb") as index_file:
+                index_file.write(HEADER.pack(MAGIC, VERSION, len(records), indexed_bytes, tail_crc))
+                index_file.write(b"".join(RECORD.pack(*r) for r in records))
+            os.replace(tmp_path, self._index_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._count, self._indexed_bytes, self._tail_crc = len(records), indexed_bytes, tail_crc
+
+    def _append(self, records: List[Tuple], indexed_bytes: int, tail_crc: int):
+        # The header is written last, so records left by an interrupted
+        # update are beyond its count and get overwritten by the next.
+        count = self._count + len(records)
+        with open(self._index_path, "r+b") as index_file:
+            index_file.seek(HEADER.size + self._count * RECORD.size)
+            index_file.write(b"".join(RECORD.pack(*r) for r in records))
+            index_file.truncate()
+            index_file.flush()
+            os.fsync(index_file.fileno())
+            index_file.seek(0)
+            index_file.write(HEADER.pack(MAGIC, VERSION, count, indexed_bytes, tail_crc))
+        self._count, self._indexed_bytes, self._tail_crc = count, indexed_bytes, tail_crc
+
+    def _record(self, i: int) -> Tuple:
+        with open(self._index_path, "rb") as index_file:
+            index_file.seek(HEADER.size + i * RECORD.size)
+            return RECORD.unpack(index_file.read(RECORD.size))
+
+    def _records(self, start: int, stop: int) -> Iterator[Tuple]:
+        if stop <= start:
+            return
+        with open(self._index_path, "rb") as index_file:
+            index_file.seek(HEADER.size + start * RECORD.size)
+            data = index_file.read((stop - start) * RECORD.size)
+        yield from RECORD.iter_unpack(data)
+
+    def _bisect(self, index_file, timestamp: int) -> int:
+        """The position of the first record at or after timestamp."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            index_file.seek(HEADER.size + mid * RECORD.size)
+            if struct.unpack("<Q", index_file.read(8))[0] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _entries(self, records: Iterator[Tuple], suffix: Optional[str]) -> Iterator[MasterfileEntry]:
+        kind = SUFFIXES.index(suffix) if suffix in SUFFIXES[1:] else None
+        with open(self._masterfile, "rb") as masterfile:
+            for timestamp, record_kind, size, digest, offset in records:
+                if kind is not None and record_kind != kind:
+                    continue
+                masterfile.seek(offset)
+                url = masterfile.readline().split()[2].decode("utf-8", "replace")
+                if suffix and kind is None and not url.endswith(suffix):
+                    continue
+                yield MasterfileEntry(timestamp, record_kind, size, digest.hex(), offset, url)
+
+    def select(self, lower: Optional[Timestamp] = None, upper: Optional[Timestamp] = None,
+               suffix: Optional[str] = None) -> Iterator[MasterfileEntry]:
+        """
+        The entries with lower <= timestamp < upper (YYYYMMDDHHMMSS), in
+        time order, of the files whose URLs end with suffix if it is given.
+        """
+        with open(self._index_path, "rb") as index_file:
+            start = 0 if lower is None else self._bisect(index_file, int(lower))
+            stop = self._count if upper is None else self._bisect(index_file, int(upper))
+        yield from self._entries(self._records(start, stop), suffix)
+
+    def last(self, n: int, suffix: Optional[str] = None) -> List[MasterfileEntry]:
+        """The n most recent entries, oldest first."""
+        if n <= 0:
+            return []
+        if suffix is None:
+            return list(self._entries(self._records(max(0, self._count - n), self._count), None))
+        entries: List[MasterfileEntry] = []
+        stop = self._count
+        while stop > 0 and len(entries) < n:
+            start = max(0, stop - 4 * n)
+            entries[:0] = self._entries(self._records(start, stop), suffix)
+            stop = start
+        return entries[-n:]
+
+
+def open_index(masterfile: str, msgout: Optional[Callable[[str], None]] = None) -> MasterfileIndex:
+    """The index of masterfile, brought up to date."""
+    index = MasterfileIndex(masterfile)
+    index.update(msgout)
+    return index
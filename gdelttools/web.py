@@ -1,16 +1,19 @@
-
-import urllib
+import atexit
+import hashlib
 from io import BytesIO
 import os
+import threading
+import time
 
 import zipfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 
 def download_and_unzip(u: str):
-    url_file = urllib.request.urlopen(u)
-
-    with zipfile.ZipFile(BytesIO(url_file.read())) as my_zip_file:
+    with zipfile.ZipFile(BytesIO(b"".join(WebDownload().download_chunks(u)))) as my_zip_file:
         my_zip_file.extractall()
 
 
@@ -25,6 +28,149 @@ def skip_this_file(zip_filename: str, overwrite: bool = None):
         return os.path.exists(zip_filename) or os.path.exists(csv_filename)
 
 
+class DownloadVerificationError(ValueError):
+    pass
+
+
+# Failures worth retrying: the connection went away or the server is
+# overloaded. Anything else (404, 403, ...) won't get better by waiting.
+RETRYABLE_ERRORS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+RETRYABLE_STATUS = frozenset((408, 429, 500, 502, 503, 504))
+
+
+def is_retryable(e: BaseException):
+    if isinstance(e, requests.exceptions.HTTPError):
+        return e.response is not None and e.response.status_code in RETRYABLE_STATUS
+    return isinstance(e, RETRYABLE_ERRORS)
+
+
+class ConnectionStats:
+    """
+    Requests sent and connections opened by this process's session, to
+    check that keep-alive works: every request beyond the connections
+    opened went out over a reused one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    @property
+    def reused(self):
+        return self.requests - self.connections
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def __str__(self):
+        return (f"{self.requests} requests over {self.connections} connections "
+                f"({self.reused} reused)")
+
+
+connection_stats = ConnectionStats()
+
+
+# urllib3 reconnects a dropped connection object in place, so count
+# sockets opened rather than connection objects made.
+class CountingHTTPConnection(HTTPConnection):
+
+    def connect(self):
+        connection_stats.count_connection()
+        super().connect()
+
+
+class CountingHTTPSConnection(HTTPSConnection):
+
+    def connect(self):
+        connection_stats.count_connection()
+        super().connect()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CountingHTTPSConnection
+
+
+class CountingAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kw):
+        super().init_poolmanager(*args, **kw)
+        self.poolmanager.pool_classes_by_scheme = {"http": CountingHTTPConnectionPool,
+                                                   "https": CountingHTTPSConnectionPool}
+
+    def send(self, request, **kw):
+        connection_stats.count_request()
+        return super().send(request, **kw)
+
+
+# Hosts we keep connections to, and connections kept per host. The
+# latter should be at least the number of threads downloading at once.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+pool_maxsize = POOL_MAXSIZE
+session_lock = threading.Lock()
+session = None
+
+
+def get_session():
+    """
+    The keep-alive session all downloads in this process share. Worker
+    processes build their own on first use.
+    """
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = CountingAdapter(pool_connections=POOL_CONNECTIONS,
+                                      pool_maxsize=pool_maxsize)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+
+def ensure_pool_maxsize(maxsize: int):
+    """Grows the connection pools to hold maxsize connections per host."""
+    global pool_maxsize
+    if maxsize > pool_maxsize:
+        pool_maxsize = maxsize
+        close_session()
+
+
+def forget_session():
+    """
+    Drop the session without closing it. Used in forked children, where
+    the sockets still belong to the parent process.
+    """
+    global session, session_lock, connection_stats
+    session = None
+    session_lock = threading.Lock()
+    connection_stats = ConnectionStats()
+
+
+def close_session():
+    global session
+    with session_lock:
+        if session is not None:
+            session.close()
+            session = None
+
+
+os.register_at_fork(after_in_child=forget_session)
+atexit.register(close_session)
+
+
 def local_path(url):
     filename_with_args = url.split('/')[-1]
     filename = filename_with_args.split('?')[0]
@@ -34,42 +180,131 @@ def local_path(url):
 class WebDownload:
 
     CHUNK_SIZE = 1024 * 1024
+    RETRIES = 5
+    BACKOFF = 1.0
+    MAX_BACKOFF = 60.0
+    TIMEOUT = 60.0
 
-    def __init__(self, encoding = "utf-8", chunksize=None):
+    def __init__(self, encoding = "utf-8", chunksize=None, retries=None,
+                 backoff=None, max_backoff=None, timeout=None):
         self._encoding = encoding
         if chunksize:
             self._chunksize = chunksize
         else:
             self._chunksize = self.CHUNK_SIZE
+        self._retries = self.RETRIES if retries is None else retries
+        self._backoff = self.BACKOFF if backoff is None else backoff
+        self._max_backoff = self.MAX_BACKOFF if max_backoff is None else max_backoff
+        self._timeout = self.TIMEOUT if timeout is None else timeout
+
+    def backoff_delay(self, attempt: int):
+        return min(self._max_backoff, self._backoff * 2 ** attempt)
 
-    def download_chunks(self, url):
-        filename = local_path(url)
-        # NOTE the stream=True parameter below
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            for chunk in r.iter_content(chunk_size=self._chunksize):
-                if chunk:
-                    yield chunk
+    def download_chunks(self, url, offset=0):
+        """
+        Yields the body of url from byte offset on. A dropped connection or
+        a retryable status is retried with a Range request from where the
+        body had got to, up to retries times in a row, sleeping
+        backoff * 2**attempt (capped at max_backoff) in between.
+        """
+        attempt = 0
+        while True:
+            headers = {"Range": f"bytes={offset}-"} if offset else None
+            try:
+                # NOTE the stream=True parameter below
+                with get_session().get(url, stream=True, headers=headers,
+                                       timeout=self._timeout) as r:
+                    if offset and r.status_code == 416:
+                        return  # we already have all of it
+                    r.raise_for_status()
+                    # A server that ignores Range sends the whole body again
+                    skip = offset if offset and r.status_code != 206 else 0
+                    for chunk in r.iter_content(chunk_size=self._chunksize):
+                        if skip:
+                            if len(chunk) <= skip:
+                                skip -= len(chunk)
+                                continue
+                            chunk = chunk[skip:]
+                            skip = 0
+                        if chunk:
+                            offset += len(chunk)
+                            attempt = 0
+                            yield chunk
+                return
+            except requests.exceptions.RequestException as e:
+                if attempt >= self._retries or not is_retryable(e):
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                attempt += 1
 
     def download_lines(self, url):
-        filename = local_path(url)
-        # NOTE the stream=True parameter below
-        r = requests.get(url, stream=True)
+        pending = b""
+        for chunk in self.download_chunks(url):
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                line = line.rstrip(b"\r")
+                if line:
+                    yield f"{line.decode(self._encoding)}\n"
+        pending = pending.rstrip(b"\r")
+        if pending:
+            yield f"{pending.decode(self._encoding)}\n"
 
-        for line in r.iter_lines():
-            if line:
-                yield f"{line.decode(self._encoding)}\n"
+    def download_url(self, url, target_filename=None, hasher=None,
+                     expected_digest=None, expected_size=None):
+        """
+        Streams url to a temporary file next to target_filename, feeding
+        each chunk to hasher (e.g. hashlib.md5()) on the way, and renames
+        it into place only once the size and the hex digest match
+        expected_size and expected_digest, where they are given. Raises
+        DownloadVerificationError, leaving nothing behind, if they don't.
+        The digest is taken to be an MD5 when no hasher is given.
 
-    def download_url(self, url, target_filename=None):
+        The temporary file is only thrown away when its content is wrong or
+        the server refuses the url outright. After anything else, e.g. the
+        retries running out, the next call for the same target resumes
+        from its end, but only if it has a size or digest to check the
+        result against; without, a stale temporary file from an older
+        version of the url could be spliced in, so it starts over.
+        """
         if target_filename is None:
             filename = local_path(url)
         else:
             filename = target_filename
-        with open(filename, 'wb') as f:
-            for i, chunk in enumerate(self.download_chunks(url), 1):
-                f.write(chunk)
+        tmp_filename = filename + '.tmp'
+        if expected_digest is not None and hasher is None:
+            hasher = hashlib.md5()
+        size = 0
+        if os.path.exists(tmp_filename):
+            size = os.path.getsize(tmp_filename)
+            if expected_size is None and expected_digest is None:
+                os.unlink(tmp_filename)
+                size = 0
+            elif expected_size is not None and size > expected_size:
+                os.unlink(tmp_filename)
+                size = 0
+            elif hasher is not None:
+                with open(tmp_filename, 'rb') as f:
+                    for buf in iter(lambda: f.read(self._chunksize), b''):
+                        hasher.update(buf)
+        try:
+            with open(tmp_filename, 'ab') as f:
+                for chunk in self.download_chunks(url, size):
+                    f.write(chunk)
+                    size += len(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+            if expected_size is not None and size != expected_size:
+                raise DownloadVerificationError(
+                    f"{url}: got {size} bytes, expected {expected_size}")
+            if expected_digest is not None and hasher.hexdigest() != expected_digest:
+                raise DownloadVerificationError(
+                    f"{url}: {hasher.name} is {hasher.hexdigest()}, expected {expected_digest}")
+        except BaseException as e:
+            refused = isinstance(e, requests.exceptions.HTTPError) and not is_retryable(e)
+            useless = refused or isinstance(e, DownloadVerificationError) or size == 0
+            if useless and os.path.exists(tmp_filename):
+                os.unlink(tmp_filename)
+            raise
+        os.replace(tmp_filename, filename)
         return filename
-
-
-
-
@@ -1,6 +1,7 @@
 from __future__ import annotations
 import dataclasses
 import datetime
+import struct
 import typing
 
 import bson # type: ignore
@@ -23,6 +24,11 @@ SOURCE_JSTOR, SOURCE_NON_TEXTUAL = typing.get_args(SourceCollectionID)
 BsonMapping = typing.Mapping[str, typing.Any]
 
 class GdeltObject:
+    # Value classes are declared with slots=True: a GKG record can carry
+    # thousands of them, and a per-instance __dict__ would dominate the
+    # memory of a worker.
+    __slots__ = ()
+
     def serialize(self):
         return {field.name:getattr(self, field.name)
                 for field in dataclasses.fields(self.__class__)}
@@ -39,7 +45,7 @@ class GdeltObject:
         return class_(*args)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V1Count(GdeltObject):
     count_type: bytes
     count_as_bytes: bytes
@@ -61,7 +67,7 @@ class V1Count(GdeltObject):
         return GdeltObject.create(V1Count, row)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V21Count(V1Count):
     location_offset_within_document: int
 
@@ -70,7 +76,7 @@ class V21Count(V1Count):
         return GdeltObject.create(V21Count, row)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V15Tone(GdeltObject):
     tone: bytes
     positive_score: float
@@ -89,7 +95,7 @@ class V15Tone(GdeltObject):
         return GdeltObject.create(V15Tone, row)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V21Amount(GdeltObject):
     amount: int | float | str
     object_: bytes
@@ -100,7 +106,7 @@ class V21Amount(GdeltObject):
         return GdeltObject.create(V21Amount, row)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V1Location(GdeltObject):
     type: int
     fullname: bytes
@@ -114,7 +120,7 @@ class V1Location(GdeltObject):
     def deserialize(version:int, row:BsonMapping) -> V1Location:
         return GdeltObject.create(V1Location, row)
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V2EnhancedLocation(GdeltObject):
     type: int
     fullname: bytes
@@ -132,7 +138,7 @@ class V2EnhancedLocation(GdeltObject):
 
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V2EnhancedTheme(GdeltObject):
     theme: bytes
     offset: int
@@ -142,7 +148,7 @@ class V2EnhancedTheme(GdeltObject):
         return GdeltObject.create(V2EnhancedTheme, row)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V21EnhancedDate(GdeltObject):
     resolution: int
     month_as_bytes: bytes
@@ -166,7 +172,7 @@ class V21EnhancedDate(GdeltObject):
     def deserialize(version:int, row:BsonMapping) -> V21EnhancedDate:
         return GdeltObject.create(V21EnhancedDate, row)
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V2EnhancedPerson(GdeltObject):
     name: bytes
     offset: int
@@ -175,7 +181,7 @@ class V2EnhancedPerson(GdeltObject):
     def deserialize(version:int, row:BsonMapping) -> V2EnhancedPerson:
         return GdeltObject.create(V2EnhancedPerson, row)
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V2EnhancedOrganization(GdeltObject):
     name: bytes
     offset: int
@@ -184,7 +190,7 @@ class V2EnhancedOrganization(GdeltObject):
     def deserialize(version:int, row:BsonMapping) -> V2EnhancedOrganization:
         return GdeltObject.create(V2EnhancedOrganization, row)
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V2GCAM(GdeltObject):
     name: bytes
     offset: int
@@ -193,7 +199,7 @@ class V2GCAM(GdeltObject):
     def deserialize(version:int, row:BsonMapping) -> V2GCAM:
         return GdeltObject.create(V2GCAM, row)
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class V21Quotation(GdeltObject):
     offset: int
     length: int
@@ -275,6 +281,53 @@ def object_list_join(outer_delim: bytes,
         obj_field_delim.join([csv_bytes(v) for v in o.value_list()])
         for o in object_list)
 
+def as_is(version:int, value:typing.Any) -> typing.Any:
+    return value
+
+def decode_date(version:int, value:str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value)
+
+def decode_source_collection_id(version:int, value:int) -> SourceCollectionID:
+    return validate_as_SurceCollectionID(value)
+
+def list_decoder(class_: typing.Any
+                 ) -> typing.Callable[[int, list[BsonMapping]], list]:
+    def decode(version:int, rows:list[BsonMapping]) -> list:
+        return [class_.deserialize(version, row) for row in rows]
+    return decode
+
+# How GKG.deserialize() decodes each field, in the order of GKG's fields.
+GKG_FIELD_DECODERS: tuple[typing.Callable[[int, typing.Any], typing.Any], ...] = (
+    as_is,                                  # gkg_record_id
+    decode_date,                            # v1_date
+    decode_source_collection_id,            # v2_source_collection_identifier
+    as_is,                                  # v2_source_common_name
+    as_is,                                  # v2_document_identifier
+    list_decoder(V1Count),                  # v1_counts
+    list_decoder(V21Count),                 # v21_counts
+    as_is,                                  # v1_themes
+    list_decoder(V2EnhancedTheme),          # v2_enhanced_themes
+    list_decoder(V1Location),               # v1_locations
+    list_decoder(V2EnhancedLocation),       # v2_enhanced_locations
+    as_is,                                  # v1_persons
+    list_decoder(V2EnhancedPerson),         # v2_enhanced_persons
+    as_is,                                  # v1_organizations
+    list_decoder(V2EnhancedOrganization),   # v2_enhanced_organizations
+    V15Tone.deserialize,                    # v15_tone
+    list_decoder(V21EnhancedDate),          # v21_enhanced_dates
+    list_decoder(V2GCAM),                   # v2_gcams
+    as_is,                                  # v2_sharing_image
+    as_is,                                  # v21_related_images
+    as_is,                                  # v21_social_image_embeds
+    as_is,                                  # v21_social_video_embeds
+    as_is,                                  # v21_quotations
+    as_is,                                  # v21_all_names
+    list_decoder(V21Amount),                # v21_amounts
+    as_is,                                  # v21_translation_info
+    as_is,                                  # v2_extras_xml
+    )
+
+
 @dataclasses.dataclass
 class GKG:
     gkg_record_id: bytes                                #0
@@ -309,10 +362,17 @@ class GKG:
     v2_extras_xml: bytes
     
 
-    def to_bson(self) -> bson.son.SON:
+    def to_bson(self,
+                columns: typing.Collection[str] | None = None,
+                ) -> bson.son.SON:
+        """Returns the document to store. If 'columns' is given only those
+        fields are stored, and the document lists them under '__columns__'
+        to mark it as partial."""
         # print (dataclasses.fields(self.__class__))
         row: bson.son.SON = bson.son.SON()
         for field in dataclasses.fields(self.__class__):
+            if columns is not None and field.name not in columns:
+                continue
             value = getattr(self, field.name)
             if field.name in [
                 'v1_counts',
@@ -333,59 +393,27 @@ class GKG:
                 value = value.serialize()
             row[field.name] = value
         row['__version__'] = 1
+        if columns is not None:
+            row['__columns__'] = list(row.keys())[:-1]
         return row
 
     @staticmethod
     def deserialize(bson_value:bson.son.SON) -> 'GKG':
+        """Builds a GKG from a stored document. The fields a partial
+        document (see to_bson()) does not carry are set to None."""
         # print (f"{bson_value=}")
         version = bson_value['__version__']
         assert version == 1
-        vl = [bson_value[field.name] for field in dataclasses.fields(GKG)]
-        # print (f"{bson_value=}")
-        gkg = GKG(
-            vl[0],  # record id
-            datetime.datetime.fromisoformat(vl[1]), # v1_date
-            validate_as_SurceCollectionID(vl[2]),   # v2_source_collection_id
-            vl[3],                                  # v2_source_common_name
-            vl[4],                                  # document identifier
-            [V1Count.deserialize(version, args)
-             for args in vl[5]],                    # v1_counts
-            [V21Count.deserialize(version, args)
-             for args in vl[6]],                    # v21_counts
-            vl[7],                                  # v1_themes
-            [V2EnhancedTheme.deserialize(version, args)
-             for args in vl[8]],                    # v2_enhanced_themes
-            [V1Location.deserialize(version, args)
-             for args in vl[9]],                    # v1_locations
-            [V2EnhancedLocation.deserialize(version, args)
-             for args in  vl[10]],                  # v2_enhanced_locations
-            vl[11],                                 # v1_persons
-            [V2EnhancedPerson.deserialize(version, args)
-             for args in vl[12]],                   # v2_enhanced_persons
-            vl[13],                                 # v1_organizations
-            [V2EnhancedOrganization.deserialize(version, args)
-             for args in vl[14]],                   # v2_enhanced_organizations
-            V15Tone.deserialize(version, vl[15]),   # v15_tone
-            [V21EnhancedDate.deserialize(version, args)
-             for args in vl[16]],                   # v21_enhanced_dates
-            [V2GCAM.deserialize(version, args)
-             for args in vl[17]],                   # v2_gcam
-            vl[18],                                 # v2_sharing_image
-            vl[19],                                 # v2_related_image
-            vl[20],                                 # v21_social_image_embdeds
-            vl[21],                                 # v21_social_video_embdeds
-            vl[22],                                 # v21_quotations
-            vl[23],                                 # v21_all_names
-            [V21Amount.deserialize(version, args)   # v21_amounts
-             for args in vl[24]],
-            vl[25],                                 # v21_translation_info
-            vl[26],                                 # v2_extras_xml
-            )
-            
-        return gkg
-
+        columns = bson_value.get('__columns__')
+        vl = [decode(version, bson_value[field.name])
+              if columns is None or field.name in columns else None
+              for field, decode
+              in zip(dataclasses.fields(GKG), GKG_FIELD_DECODERS)]
+        return GKG(*vl)
 
     def to_csv(self) -> bytes:
+        """Rebuilds the source line. Needs all the fields, so it does not
+        work on a GKG deserialized from a partial document."""
         # for c in self.v1_counts:
         #     print (f"{c.count_as_bytes=} {c.count=}")
         return b'\t'.join([
@@ -418,3 +446,120 @@ class GKG:
             double_join(b';', b',', self.v21_translation_info),
             self.v2_extras_xml,
             ])
+
+
+assert len(GKG_FIELD_DECODERS) == len(dataclasses.fields(GKG))
+
+GKG_FIELD_INDEX: dict[str, int] = {
+    field.name: i for i, field in enumerate(dataclasses.fields(GKG))}
+
+
+# Sizes of the BSON element types whose size does not depend on the value.
+BSON_FIXED_SIZES = {
+    0x01: 8,    # double
+    0x06: 0,    # undefined
+    0x07: 12,   # ObjectId
+    0x08: 1,    # boolean
+    0x09: 8,    # UTC datetime
+    0x0A: 0,    # null
+    0x10: 4,    # int32
+    0x11: 8,    # timestamp
+    0x12: 8,    # int64
+    0x13: 16,   # decimal128
+    0x7F: 0,    # max key
+    0xFF: 0,    # min key
+    }
+
+def index_bson_elements(raw: bytes) -> dict[str, tuple[int, int]]:
+    """Maps each top-level key of an encoded document to the byte span of
+    its element, without decoding any value."""
+    spans: dict[str, tuple[int, int]] = {}
+    pos, end = 4, len(raw) - 1
+    while pos < end:
+        start = pos
+        element_type = raw[pos]
+        key_end = raw.index(b'\x00', pos + 1)
+        key = str(raw[pos + 1:key_end], 'utf-8')
+        pos = key_end + 1
+        if element_type in (0x02, 0x0D, 0x0E):     # string, code, symbol
+            pos += 4 + int.from_bytes(raw[pos:pos + 4], 'little')
+        elif element_type in (0x03, 0x04, 0x0F):   # document, array
+            pos += int.from_bytes(raw[pos:pos + 4], 'little')
+        elif element_type == 0x05:                 # binary
+            pos += 5 + int.from_bytes(raw[pos:pos + 4], 'little')
+        elif element_type == 0x0B:                 # regex
+            pos = raw.index(b'\x00', raw.index(b'\x00', pos) + 1) + 1
+        elif element_type == 0x0C:                 # DBPointer
+            pos += 4 + int.from_bytes(raw[pos:pos + 4], 'little') + 12
+        else:
+            pos += BSON_FIXED_SIZES[element_type]
+        spans[key] = (start, pos)
+    return spans
+
+
+class LazyGKG:
+    """A read-only GKG over a stored document, RawBSONDocument or bytes.
+
+    Only the positions of the top-level fields are worked out up front. A
+    field is decoded, with the same decoder GKG.deserialize() uses, the
+    first time it is read, and then kept on the instance. Readers that
+    look at a few fields of a large record never pay for the rest, e.g.
+    its thousands of GCAM entries.
+    """
+
+    CODEC_OPTIONS = bson.CodecOptions(document_class=bson.SON)
+
+    def __init__(self, document: bson.raw_bson.RawBSONDocument | bytes):
+        raw = getattr(document, 'raw', document)
+        self._raw = raw
+        self._spans = index_bson_elements(raw)
+        self._version = self._decode_element('__version__')
+        assert self._version == 1
+        self._columns = (self._decode_element('__columns__')
+                         if '__columns__' in self._spans else None)
+
+    def _decode_element(self, key: str) -> typing.Any:
+        start, end = self._spans[key]
+        element = self._raw[start:end]
+        document = struct.pack('<i', len(element) + 5) + element + b'\x00'
+        return bson.decode(document, self.CODEC_OPTIONS)[key]
+
+    def __getattr__(self, name: str) -> typing.Any:
+        index = GKG_FIELD_INDEX.get(name)
+        if index is None:
+            raise AttributeError(name)
+        if name in self._spans:
+            value = GKG_FIELD_DECODERS[index](self._version,
+                                              self._decode_element(name))
+        else:
+            # not stored in a partial document
+            value = None
+        setattr(self, name, value)
+        return value
+
+    @property
+    def is_partial(self) -> bool:
+        return self._columns is not None
+
+    def decode_all(self) -> None:
+        """Decodes the fields not read yet in one go, which is cheaper than
+        one by one when most of them are needed."""
+        undecoded = [name for name in GKG_FIELD_INDEX if name not in vars(self)]
+        if not undecoded:
+            return
+        document = bson.decode(self._raw, self.CODEC_OPTIONS)
+        for name in undecoded:
+            value = None
+            if name in document:
+                value = GKG_FIELD_DECODERS[GKG_FIELD_INDEX[name]](
+                    self._version, document[name])
+            setattr(self, name, value)
+
+    def to_gkg(self) -> GKG:
+        self.decode_all()
+        return GKG(*[getattr(self, field.name)
+                     for field in dataclasses.fields(GKG)])
+
+    def to_csv(self) -> bytes:
+        self.decode_all()
+        return GKG.to_csv(typing.cast(GKG, self))
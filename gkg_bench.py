@@ -0,0 +1,160 @@
+#! /usr/bin/env python3
+"""
+Benchmarks for the GKG object model, run against a real GKG file:
+
+    python gkg_bench.py --memory /opt/gdelt/csv/2015/20150218230000.gkg.csv.zip
+    python gkg_bench.py --deserialize /opt/gdelt/csv/2015/20150218230000.gkg.csv.zip
+"""
+from __future__ import annotations
+
+import dataclasses
+import gc
+import optparse
+import sys
+import time
+import tracemalloc
+import typing
+
+import bson # type: ignore
+
+import chunk_splitter
+import gkg
+import gkg_import
+
+
+def read_rows(gkg_csv: str, limit: int) -> list[list[bytes]]:
+    rows: list[list[bytes]] = []
+    with chunk_splitter.open_zip_member(gkg_csv) as member:
+        for line in chunk_splitter.split_stream_to_chunks(member):
+            vec = line.split(b'\t')
+            if len(vec) != 27:
+                continue
+            rows.append(vec)
+            if 0 < limit <= len(rows):
+                break
+    return rows
+
+
+def parse_rows(rows: list[list[bytes]], gkg_csv: str) -> list[gkg.GKG]:
+    return [gkg_import.makeGKGfromColumns(vec, gkg_csv, i, lambda msg: None)
+            for i, vec in enumerate(rows, 1)]
+
+
+def measure(build: typing.Callable[[], list[typing.Any]]) -> int:
+    """Returns the bytes still allocated by what build() returns."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        retained = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del retained
+    return size
+
+
+# Dict-backed twins of the value classes, i.e. what they were before they
+# got slots=True, to compare against.
+DICT_BACKED: dict[type, type] = {
+    class_: dataclasses.make_dataclass(
+        class_.__name__,
+        [(field.name, field.type) for field in dataclasses.fields(class_)],
+        bases=(gkg.GdeltObject,))
+    for class_ in (gkg.V1Count, gkg.V21Count, gkg.V15Tone, gkg.V21Amount,
+                   gkg.V1Location, gkg.V2EnhancedLocation,
+                   gkg.V2EnhancedTheme, gkg.V21EnhancedDate,
+                   gkg.V2EnhancedPerson, gkg.V2EnhancedOrganization,
+                   gkg.V2GCAM)
+    }
+
+def to_dict_backed(record: gkg.GKG) -> gkg.GKG:
+    for field in dataclasses.fields(record):
+        value = getattr(record, field.name)
+        if type(value) in DICT_BACKED:
+            value = DICT_BACKED[type(value)](*value.value_list())
+        elif isinstance(value, list):
+            value = [DICT_BACKED[type(v)](*v.value_list())
+                     if type(v) in DICT_BACKED else v
+                     for v in value]
+        setattr(record, field.name, value)
+    return record
+
+
+def bench_memory(gkg_csv: str, limit: int) -> None:
+    rows = read_rows(gkg_csv, limit)
+    if not rows:
+        print (f"No records in {gkg_csv}")
+        return
+    dict_backed = measure(
+        lambda: [to_dict_backed(r) for r in parse_rows(rows, gkg_csv)])
+    slotted = measure(lambda: parse_rows(rows, gkg_csv))
+    print (f"{len(rows)} records from {gkg_csv}")
+    print (f"dict-backed: {dict_backed / len(rows):12.0f} bytes/record")
+    print (f"slotted:     {slotted / len(rows):12.0f} bytes/record")
+    print (f"ratio:       {slotted / dict_backed:12.2f}")
+
+
+def timed(f: typing.Callable[[], typing.Any], repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_deserialize(gkg_csv: str, limit: int, field: str) -> None:
+    rows = read_rows(gkg_csv, limit)
+    if not rows:
+        print (f"No records in {gkg_csv}")
+        return
+    encode = gkg_import.compile_bson_encoder()
+    docs = [encode(vec, gkg_csv, i, lambda msg: None).raw
+            for i, vec in enumerate(rows, 1)]
+    son_options = bson.CodecOptions(document_class=bson.SON)
+    # Sort by size so that the large records can be reported apart.
+    docs.sort(key=len)
+    large = docs[-max(1, len(docs) // 10):]
+    print (f"{len(docs)} records from {gkg_csv}, "
+           f"largest {len(docs[-1])} bytes")
+    for label, subset in (('all', docs), ('largest 10%', large)):
+        full = timed(lambda: [getattr(gkg.GKG.deserialize(
+                                  bson.decode(raw, son_options)), field)
+                              for raw in subset])
+        lazy = timed(lambda: [getattr(gkg.LazyGKG(raw), field)
+                              for raw in subset])
+        full_csv = timed(lambda: [gkg.GKG.deserialize(
+                                      bson.decode(raw, son_options)).to_csv()
+                                  for raw in subset])
+        lazy_csv = timed(lambda: [gkg.LazyGKG(raw).to_csv()
+                                  for raw in subset])
+        per_record = 1e6 / len(subset)
+        print (f"{label}: reading {field}: full {full * per_record:9.1f}us "
+               f"lazy {lazy * per_record:9.1f}us; "
+               f"to_csv: full {full_csv * per_record:9.1f}us "
+               f"lazy {lazy_csv * per_record:9.1f}us per record")
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(
+        usage="%prog --memory|--deserialize [--limit N] GKG_ZIP...")
+    parser.add_option('-m', '--memory', action='store_true', default=False,
+                      help='per-record memory of parsed GKG objects')
+    parser.add_option('-d', '--deserialize', action='store_true',
+                      default=False,
+                      help='full vs lazy deserialization of stored records')
+    parser.add_option('-f', '--field', type=str, default='v15_tone',
+                      help='field read in the --deserialize run [%default]')
+    parser.add_option('-n', '--limit', type=int, default=0,
+                      help='records to use from each file [all]')
+    opts, args = parser.parse_args()
+
+    if not (opts.memory or opts.deserialize) or not args:
+        parser.print_help()
+        sys.exit(1)
+    for gkg_csv in args:
+        if opts.memory:
+            bench_memory(gkg_csv, opts.limit)
+        if opts.deserialize:
+            bench_deserialize(gkg_csv, opts.limit, opts.field)
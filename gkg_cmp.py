@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import collections
+import dataclasses
 import datetime
 import json
 import math
@@ -14,13 +16,15 @@ import zipfile
 
 import pymongo
 import bson # type: ignore
+from bson.raw_bson import RawBSONDocument
 
+import chunk_splitter
 import import_util
 import options
 
 from mymongo import with_mongo
 
-from gkg import GKG, SourceCollectionID, V1Count, V21Count, V15Tone
+from gkg import GKG, LazyGKG, SourceCollectionID, V1Count, V21Count, V15Tone
 
 
 def remove_bad_locations(row: list[bytes]) -> None:
@@ -39,79 +43,165 @@ def remove_insane_ints(row: list[bytes]) -> None:
     row[24] = b';'.join(ok_blocks)
 
 
-def do_main(mongo_conn:pymongo.MongoClient,
-            csvgz_path: str,
-            opts:options.GkgOptions,
-            ) -> None:
-    with zipfile.ZipFile(csvgz_path, 'r') as archive:
-        base_name = os.path.basename(csvgz_path)[:-4] # name without '.zip'
-        blob = archive.read(base_name)
-
-    pos, gkg_count, line_count = 0, 0, 0
-    while pos < len(blob):
-        eol_pos = blob.find(b'\n', pos)
-        if eol_pos < 0:
-            break
-        line_count += 1
-
-        break_flag = False
-        while blob[eol_pos-13:eol_pos] != b'</PAGE_TITLE>':
-            eol_pos = blob.find(b'\n', eol_pos + 1)
-            if eol_pos < 0:
-                print(f"Found dangling line. {line_count}@{csvgz_path}")
-                break_flag = True
-                break
-            print(f"Joining line {line_count}@{csvgz_path}")
-            line_count += 1
-        if break_flag:
-            break
-        line = blob[pos:eol_pos]
-        pos = eol_pos + 1
+# Mismatching records kept per file to show what went wrong.
+MAX_EXAMPLES_PER_FILE:int = 3
+
+GKG_COLUMN_NAMES = [field.name for field in dataclasses.fields(GKG)]
+
+
+@dataclasses.dataclass
+class VerifyReport:
+    files: int = 0
+    records: int = 0
+    matched: int = 0
+    mismatched: int = 0
+    missing: int = 0
+    partial: int = 0
+    short_lines: int = 0
+    # column index -> number of records whose column differs
+    column_mismatches: collections.Counter[int] = dataclasses.field(
+        default_factory=collections.Counter)
+    # (csv path, line number, record id, mismatching column indices)
+    examples: list[tuple[str, int, bytes, list[int]]] = dataclasses.field(
+        default_factory=list)
+
+    def merge(self, other: VerifyReport) -> None:
+        self.files += other.files
+        self.records += other.records
+        self.matched += other.matched
+        self.mismatched += other.mismatched
+        self.missing += other.missing
+        self.partial += other.partial
+        self.short_lines += other.short_lines
+        self.column_mismatches.update(other.column_mismatches)
+        self.examples.extend(other.examples)
+
+    @property
+    def ok(self) -> bool:
+        return self.mismatched == 0 and self.missing == 0
+
+    def print(self) -> None:
+        print (f"files: {self.files} records: {self.records} "
+               f"matched: {self.matched} mismatched: {self.mismatched} "
+               f"missing: {self.missing} partial: {self.partial} "
+               f"short lines: {self.short_lines}")
+        for index, count in sorted(self.column_mismatches.items()):
+            print (f"  column {index:2} {GKG_COLUMN_NAMES[index]:<32} "
+                   f"{count:10} mismatches")
+        for csvgz_path, line_count, record_id, columns in self.examples:
+            print (f"  e.g. {record_id!r} {line_count}@{csvgz_path}: "
+                   f"columns {columns}")
+
+
+def compare_batch(collection: pymongo.collection.Collection,
+                  csvgz_path: str,
+                  batch: list[tuple[int, list[bytes]]],
+                  report: VerifyReport,
+                  ) -> None:
+    record_ids = [src_columns[0] for _, src_columns in batch]
+    stored = {gkg.gkg_record_id: gkg for gkg
+              in map(LazyGKG, collection.find(
+                  {'gkg_record_id': {'$in': record_ids}}))}
+    for line_count, src_columns in batch:
+        report.records += 1
+        gkg = stored.get(src_columns[0])
+        if gkg is None:
+            report.missing += 1
+            continue
+        if gkg.is_partial:
+            report.partial += 1
+            continue
+        dst_columns = gkg.to_csv().split(b'\t')
+        mismatched = [i for i, (src, dst)
+                      in enumerate(zip(src_columns, dst_columns))
+                      if src != dst]
+        if not mismatched:
+            report.matched += 1
+            continue
+        report.mismatched += 1
+        report.column_mismatches.update(mismatched)
+        if len(report.examples) < MAX_EXAMPLES_PER_FILE:
+            report.examples.append(
+                (csvgz_path, line_count, src_columns[0], mismatched))
+
+
+def do_compare(mongo_conn:pymongo.MongoClient,
+               csvgz_path: str,
+               records: typing.Iterable[bytes],
+               opts:options.GkgOptions,
+               ) -> VerifyReport:
+    """Checks every record of a GKG file against what is stored for it,
+    fetching the stored records --batch-size at a time."""
+    collection = mongo_conn.gdelt[opts.collection].with_options(
+        codec_options=bson.CodecOptions(document_class=RawBSONDocument))
+    report = VerifyReport(files=1)
+    batch: list[tuple[int, list[bytes]]] = []
+    line_count = 0
+    for line in records:
+        line_count += line.count(b'\n') + 1
         src_columns = line.rstrip().split(b'\t')
         if len(src_columns) != 27:
-            print (f"Short line {line_count}@{csvgz_path}:[{line!r}]")
+            if opts.verbose:
+                print (f"Short line {line_count}@{csvgz_path}:[{line!r}]")
+            report.short_lines += 1
             continue
         remove_bad_locations(src_columns)
         remove_insane_ints(src_columns)
-        gkg_son_obj = mongo_conn.gdelt.gkg.find_one(
-            {'gkg_record_id': src_columns[0]}
-            )
-        # print (f"{gkg_son_obj=}")
-        try:
-            assert isinstance(gkg_son_obj, bson.son.SON)
-            gkg = GKG.deserialize(gkg_son_obj)
-        except:
-            print ('OFFENDING SON:', gkg_son_obj)
-            raise
-        dst_columns = gkg.to_csv().split(b'\t')
+        batch.append((line_count, src_columns))
+        if opts.batch_size <= len(batch):
+            compare_batch(collection, csvgz_path, batch, report)
+            batch = []
+    compare_batch(collection, csvgz_path, batch, report)
+    return report
 
-        if all([src == dst for src, dst in zip(src_columns, dst_columns)]):
-            if not opts.quiet:
-                print (f"{src_columns[0]!r} OK")
-            return
-        mismatched = [(i, f"{src!r}", f"{dst!r}")
-                      for i, (src, dst)
-                      in enumerate(zip(src_columns, dst_columns))
-                      if src != dst]
-        print ("Ouch!")
-        print (f"{mismatched=}")
-        print (gkg_son_obj)
-        sys.exit(1)
 
 @with_mongo()
-def main(mongo_conn: pymongo.MongoClient,
-         args: list[str],
+def verify_file(mongo_conn:pymongo.MongoClient,
+                csvgz_path: str,
+                opts:options.GkgOptions,
+                ) -> VerifyReport:
+    with chunk_splitter.open_zip_member(csvgz_path) as member:
+        report = do_compare(mongo_conn, csvgz_path,
+                            chunk_splitter.split_stream_to_chunks(member),
+                            opts)
+    if not opts.quiet:
+        print (f"{csvgz_path}: {report.matched}/{report.records} match")
+    return report
+
+
+def verify_worker(task: tuple[str, options.GkgOptions]) -> VerifyReport:
+    csvgz_path, opts = task
+    try:
+        return verify_file(csvgz_path, opts)
+    except zipfile.BadZipFile:
+        print (f"Corrupt zip file? [{csvgz_path}]")
+        return VerifyReport()
+
+
+def main(csv_paths: typing.Iterable[str],
          opts: options.GkgOptions
-         ) -> None:
-    for csv_path in args:
-        do_main(mongo_conn, csv_path, opts)
+         ) -> VerifyReport:
+    report = VerifyReport()
+    with multiprocessing.Pool(opts.num_workers) as pool:
+        tasks = ((csv_path, opts) for csv_path in csv_paths)
+        for file_report in pool.imap_unordered(verify_worker, tasks):
+            report.merge(file_report)
+    return report
 
 if __name__ == '__main__':
 
-    parser = optparse.OptionParser(usage="How to use %p!")
+    parser = optparse.OptionParser(
+        usage="%prog [options] [GKG_ZIP...]\n\n"
+        "Checks stored GKG records against the files they came from. "
+        "Without files, checks the files in the masterfile between "
+        "--lower-limit and --upper-limit.")
     parser.add_option('-v', '--verbose', action='store_true', default=False)
     parser.add_option('-q', '--quiet', action='store_true', default=False)
     parser.add_option('-w', '--num-workers', type=int, default=2)
+    parser.add_option('-b', '--batch-size', type=int, default=1000,
+                      help='number of GKG records fetched per query')
+    parser.add_option('-C', '--collection', type=str, default='gkg',
+                      help='collection in the gdelt database to check')
     parser.add_option('-m', '--masterfile', type=str,
                       default='/opt/gdelt/csv/masterfilelist.txt')
     parser.add_option('-l', '--lower-limit', type=str,
@@ -136,12 +226,11 @@ if __name__ == '__main__':
         opts.upper_limit,
         opts.dry_run,
         opts.no_store,
+        opts.batch_size,
+        collection=opts.collection,
         )
 
-    if len(args) == 0:
-        # args = ['./gdelttools/20230701000000.gkg.csv']
-        targets = ['/opt/gdelt/csv/20230701000000.gkg.csv.zip']
-    else:
-        targets = sys.argv[1:]
-
-    main(targets, typed_opts)
+    report = main(import_util.make_csv_path_generator(args, typed_opts),
+                  typed_opts)
+    report.print()
+    sys.exit(0 if report.ok else 1)
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import collections
+import dataclasses
 import datetime
+import functools
+import itertools
 import json
 import math
 import multiprocessing
@@ -8,17 +12,23 @@ import optparse
 import os
 import pathlib
 import re
+import shutil
 import sys
+import tempfile
+import time
 import traceback
 import typing
 import zipfile
 
+import bson # type: ignore
 import pymongo
 
 import chunk_splitter
+import import_ledger
 import import_util
 import options
 
+import mymongo
 from mymongo import with_mongo
 
 from gkg import (GKG, SourceCollectionID, V15Tone, V1Count, V21Amount,
@@ -41,93 +51,6 @@ def convert_to_source_collection_identifier(
 def write_to_stderr(s:str) -> None:
     print (s, file=sys.stderr)
 
-def double_split(
-    first_level_delim:bytes,
-    second_level_delim:bytes,
-    column_value: bytes,
-    converters: tuple[typing.Callable[[bytes], typing.Any],...] = (),
-    csvgz_path: str | None = None,
-    line_number: int | None = None,
-    warn_out: typing.Callable[[str], None] | None = None,
-) -> list[typing.Any]:
-    
-    if column_value.strip() == b'':
-        return []
-    chunks_list = [
-        block.split(second_level_delim) for block
-        in column_value.strip(first_level_delim).split(first_level_delim)]
-    try:
-        f: typing.Callable[[bytes], typing.Any] = bytes
-        len_diff = len(chunks_list[0]) - len(converters)
-        if 0 < len_diff:
-            conververs = converters + (bytes,) * len_diff
-        elif len_diff < 0:
-            raise ValueError(f"There are more converters than data chunks.")
-        L = []
-        for chunks in chunks_list:
-            if len(chunks) != len(converters):
-                if chunks[:4] != [b'0', b'Georgia, , Georgia', b'GG', b'GG']:
-                    out = warn_out or write_to_stderr
-                    out("The number of converters and elements does not match "
-                        f"at {line_number}:{csvgz_path}. Ignoring the offending entry.")
-                    out(f"{converters=}")
-                    out(f"{chunks=}")
-                continue
-            try:
-                L.append([f(x) for f, x in zip(converters, chunks, strict=True)])
-            except ValueError:
-                print(f"{converters=}")
-                print(f"{chunks=}")
-                raise
-    except (KeyboardInterrupt, SystemExit):
-        raise
-    except:
-        print (f"{converters=}")
-        print (f"{chunks_list=}")
-        raise
-    return L
-
-# def double_split_debug(
-#     first_level_delim:bytes,
-#     second_level_delim:bytes,
-#     column_value: bytes,
-#     converters: tuple[typing.Callable[[bytes], typing.Any]] = (bytes,),
-# ) -> list[typing.Any]:
-
-#     if column_value.strip() == b'':
-#         return []
-#     chunks_list = [
-#         block.split(second_level_delim) for block
-#         in column_value.strip(first_level_delim).split(first_level_delim)]
-#     try:
-#         num_chunks = len(chunks_list[0])
-#         if len(converters) < num_chunks:
-#             converters = converters + [bytes] * (num_chunks - len(converters))
-#         return [[f(x) for f, x in zip(converters, chunks, strict=True)]
-#                 for chunks in chunks_list]
-#     except (KeyboardInterrupt, SystemExit):
-#         raise
-#     except:
-#         print (f"{converters=}")
-#         print (f"{chunks_list=}")
-#         raise
-
-
-def single_split(
-    delim:bytes,
-    column_value:bytes,
-    converters: tuple[typing.Callable[[bytes], typing.Any],...] = (),
-    ) -> list[typing.Any]:
-    chunks = column_value.rstrip(delim).split(delim)
-    len_diff = len(chunks) - len(converters)
-    if 0 < len_diff:
-        converters = converters + (as_is,) * len_diff
-    try:
-        return [f(x) for f, x in zip(converters, chunks, strict=True)]
-    except ValueError:
-        print(f"{converters=}")
-        print(f"{chunks=}")
-        raise
 
 URL_DELIMITER = re.compile(b';https?:')
 def url_split(column_value:bytes) -> list[bytes]:
@@ -253,13 +176,262 @@ def convert_amount_in_v21amount_to_numeric_if_possible(
         out.append(row)
     return out
 
-def is_valid_v1_location_args(args, warn_out):
-    if len(args) != 7:
-        msg = f"Bad V1Location args: ({args})"
-        print (msg)
-        warn_out(msg)
-        return False
-    return True
+# Compiled parse plans
+#
+# Each column of a GKG record has a parser, built once at import time from
+# its delimiters and per-field converters. makeGKGfromColumns() runs them
+# in column order.
+
+ColumnParser = typing.Callable[[bytes, str, int, typing.Any], typing.Any]
+
+IDENTITY_CONVERTERS = (bytes, as_is)
+
+GEORGIA_PREFIX = [b'0', b'Georgia, , Georgia', b'GG', b'GG']
+
+
+def compile_double_split(
+    first_level_delim:bytes,
+    second_level_delim:bytes,
+    converters: tuple[typing.Callable[[bytes], typing.Any],...],
+    warn_with_context: bool = False,
+) -> ColumnParser:
+    """Returns a parser for a column of 'first_level_delim' separated
+    entries, each of 'second_level_delim' separated fields, giving a list
+    of field lists with 'converters' applied in order. An empty column
+    gives []. Entries with the wrong number of fields are skipped with a
+    warning, except for the known 'Georgia, , Georgia' location. If
+    'warn_with_context' is set, warnings go to 'warn_out' with the file
+    and line; otherwise they go to stderr."""
+    n = len(converters)
+    conversions = tuple((i, f) for i, f in enumerate(converters)
+                        if f not in IDENTITY_CONVERTERS)
+
+    fast: typing.Callable[[list[list[bytes]]], list[list[typing.Any]]] | None
+    if n == 2 and conversions == ((1, int),):
+        def fast(chunks_list):
+            return [[a, int(b)] for a, b in chunks_list]
+    elif n == 2 and conversions == ((1, int_or_float),):
+        def fast(chunks_list):
+            return [[a, int(b) if b.isdigit() else int_or_float(b)]
+                    for a, b in chunks_list]
+    else:
+        fast = None
+
+    def parse(column_value: bytes,
+              csvgz_path: str,
+              line_number: int,
+              warn_out: typing.Any,
+              ) -> list[typing.Any]:
+        if column_value.strip() == b'':
+            return []
+        chunks_list = [
+            block.split(second_level_delim) for block
+            in column_value.strip(first_level_delim).split(first_level_delim)]
+        if len(chunks_list[0]) < n:
+            print (f"{converters=}")
+            print (f"{chunks_list=}")
+            raise ValueError(f"There are more converters than data chunks.")
+        if fast is not None:
+            try:
+                return fast(chunks_list)
+            except ValueError:
+                # A malformed entry. The generic loop below skips or
+                # reports it.
+                pass
+        L = []
+        for chunks in chunks_list:
+            if len(chunks) != n:
+                if chunks[:4] != GEORGIA_PREFIX:
+                    if warn_with_context:
+                        out = warn_out or write_to_stderr
+                    else:
+                        out, csvgz_path, line_number = write_to_stderr, None, None
+                    out("The number of converters and elements does not match "
+                        f"at {line_number}:{csvgz_path}. Ignoring the offending entry.")
+                    out(f"{converters=}")
+                    out(f"{chunks=}")
+                continue
+            try:
+                for i, f in conversions:
+                    chunks[i] = f(chunks[i])
+            except ValueError:
+                print(f"{converters=}")
+                print(f"{chunks=}")
+                raise
+            L.append(chunks)
+        return L
+    return parse
+
+
+def compile_single_split(
+    delim:bytes,
+    converters: tuple[typing.Callable[[bytes], typing.Any],...],
+) -> ColumnParser:
+    """Returns a parser for a column of 'delim' separated fields, giving
+    their list with 'converters' applied to the leading ones. A trailing
+    'delim' is ignored, and a column with fewer fields than converters is
+    a ValueError."""
+    n = len(converters)
+    conversions = tuple((i, f) for i, f in enumerate(converters)
+                        if f not in IDENTITY_CONVERTERS)
+
+    def parse(column_value: bytes,
+              csvgz_path: str,
+              line_number: int,
+              warn_out: typing.Any,
+              ) -> list[typing.Any]:
+        chunks = column_value.rstrip(delim).split(delim)
+        try:
+            if len(chunks) < n:
+                raise ValueError(f"Expected at least {n} elements.")
+            for i, f in conversions:
+                chunks[i] = f(chunks[i])
+        except ValueError:
+            print(f"{converters=}")
+            print(f"{chunks=}")
+            raise
+        return chunks
+    return parse
+
+
+def parse_gkg_date(column_value: bytes) -> datetime.datetime:
+    """Decodes a YYYYMMDDhhmmss timestamp. Anything that is not a valid
+    14-digit timestamp goes through strptime() as it always did."""
+    if len(column_value) == 14 and column_value.isdigit():
+        try:
+            return datetime.datetime(
+                int(column_value[0:4]), int(column_value[4:6]),
+                int(column_value[6:8]), int(column_value[8:10]),
+                int(column_value[10:12]), int(column_value[12:14]))
+        except ValueError:
+            pass
+    return datetime.datetime.strptime(str(column_value, 'utf-8'),
+                                      '%Y%m%d%H%M%S')
+
+
+def value_only(f: typing.Callable[[bytes], typing.Any]) -> ColumnParser:
+    def parse(column_value: bytes,
+              csvgz_path: str,
+              line_number: int,
+              warn_out: typing.Any,
+              ) -> typing.Any:
+        return f(column_value)
+    return parse
+
+
+parse_v21_amount_blocks = compile_double_split(b';', b',', (as_is, as_is, int))
+
+def parse_v21_amounts(column_value: bytes,
+                      csvgz_path: str,
+                      line_number: int,
+                      warn_out: typing.Any,
+                      ) -> list[list[typing.Any]]:
+    return convert_amount_in_v21amount_to_numeric_if_possible(
+        parse_v21_amount_blocks(column_value, csvgz_path, line_number,
+                                warn_out),
+        csvgz_path,
+        line_number,
+        warn_out)
+
+
+class ColumnPlan(typing.NamedTuple):
+    name: str
+    parse: ColumnParser
+    # When set, the parsed value holds the constructor arguments of
+    # 'object_class': a list of argument lists, or a single one if not
+    # 'many'.
+    object_class: type | None = None
+    many: bool = True
+
+
+GKG_COLUMN_PLANS: tuple[ColumnPlan, ...] = (
+    ColumnPlan('gkg_record_id', value_only(as_is)),
+    ColumnPlan('v1_date', value_only(parse_gkg_date)),
+    ColumnPlan('v2_source_collection_identifier',
+               value_only(convert_to_source_collection_identifier)),
+    ColumnPlan('v2_source_common_name', value_only(as_is)),
+    ColumnPlan('v2_document_identifier', value_only(as_is)),
+    ColumnPlan('v1_counts',
+               compile_double_split(b";", b"#",
+                                    (bytes, bytes, bytes, bytes, bytes,
+                                     bytes, bytes, int_float_or_none,
+                                     int_float_or_none, bytes)),
+               V1Count),
+    ColumnPlan('v21_counts',
+               compile_double_split(b";", b"#",
+                                    (bytes, bytes, bytes, int, bytes,
+                                     bytes, bytes, int_float_or_none,
+                                     int_float_or_none, int_or_str, int)),
+               V21Count),
+    ColumnPlan('v1_themes', compile_double_split(b';', b',', (bytes,))),
+    ColumnPlan('v2_enhanced_themes',
+               compile_double_split(b';', b',', (bytes, int)),
+               V2EnhancedTheme),
+    # Entries of the wrong length are dropped by the split itself.
+    ColumnPlan('v1_locations',
+               compile_double_split(b';', b'#',
+                                    (int, bytes, bytes, bytes,
+                                     int_float_or_none, int_float_or_none,
+                                     int_float_or_bytes),
+                                    warn_with_context=True),
+               V1Location),
+    ColumnPlan('v2_enhanced_locations',
+               compile_double_split(b';', b'#',
+                                    (int, bytes, bytes, bytes, bytes,
+                                     float_or_none, float_or_none,
+                                     int_float_or_bytes, int),
+                                    warn_with_context=True),
+               V2EnhancedLocation),
+    ColumnPlan('v1_persons', compile_single_split(b';', (as_is,))),
+    ColumnPlan('v2_enhanced_persons',
+               compile_double_split(b';', b',', (bytes, int)),
+               V2EnhancedPerson),
+    ColumnPlan('v1_organizations', compile_single_split(b';', (as_is,))),
+    ColumnPlan('v2_enhanced_organizations',
+               compile_double_split(b';', b',', (bytes, int)),
+               V2EnhancedOrganization),
+    ColumnPlan('v15_tone',
+               compile_single_split(b',',
+                                    (int_or_float, int_or_float, int_or_float,
+                                     int_or_float, int_or_float, int_or_float,
+                                     int)),
+               V15Tone, many=False),
+    ColumnPlan('v21_enhanced_dates',
+               compile_double_split(b';', b'#', (int, bytes, bytes, bytes, int)),
+               V21EnhancedDate),
+    ColumnPlan('v2_gcams',
+               compile_double_split(b',', b':', (bytes, int_or_float)),
+               V2GCAM),
+    ColumnPlan('v2_sharing_image', value_only(as_is)),
+    ColumnPlan('v21_related_images', value_only(url_split)),
+    ColumnPlan('v21_social_image_embeds', value_only(url_split)),
+    ColumnPlan('v21_social_video_embeds', value_only(url_split)),
+    ColumnPlan('v21_quotations',
+               compile_double_split(b'#', b'|', (int, int, bytes, bytes))),
+    ColumnPlan('v21_all_names', compile_double_split(b';', b',', (bytes, int))),
+    ColumnPlan('v21_amounts', parse_v21_amounts, V21Amount),
+    ColumnPlan('v21_translation_info',
+               compile_double_split(b';', b',', (int_or_float, as_is))),
+    ColumnPlan('v2_extras_xml', value_only(as_is)),
+    )
+
+assert [plan.name for plan in GKG_COLUMN_PLANS] == \
+    [field.name for field in dataclasses.fields(GKG)]
+
+GKG_COLUMN_NAMES: tuple[str, ...] = tuple(
+    plan.name for plan in GKG_COLUMN_PLANS)
+
+
+def projected_columns(opts: options.GkgOptions) -> list[str] | None:
+    """Returns the names of the columns to store, in GKG field order, or
+    None when all of them are. 'gkg_record_id' is always stored."""
+    if not opts.columns:
+        return None
+    selected = set(opts.columns.split(',')) | {'gkg_record_id'}
+    unknown = selected.difference(GKG_COLUMN_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown GKG columns: {sorted(unknown)}")
+    return [name for name in GKG_COLUMN_NAMES if name in selected]
 
 
 def makeGKGfromColumns(vec: list[bytes],
@@ -267,149 +439,310 @@ def makeGKGfromColumns(vec: list[bytes],
                        line_count: int,
                        warn_out: typing.Any,
                        ) -> GKG:
-    gkg = GKG(
-        # gkg-record-id
-        vec[0],
-
-        # v1_date
-        datetime.datetime.strptime(str(vec[1], 'utf-8'), '%Y%m%d%H%M%S'),
-
-        # v2_source_collection_identifier
-        convert_to_source_collection_identifier(vec[2]),
-
-        # v2_source_common_name
-        vec[3],
-
-        # v2_document_identifier
-        vec[4],
-
-        # v1_counts
-        [V1Count(*args) for args
-         in double_split(b";", b"#", vec[5],
-                         (bytes,   # Count Type
-                          # 'Count' can't be 'int' due to '081'
-                          # in '20230701000000-562'
-                          bytes,   # Count
-                          bytes,   # Object Type
-                          bytes,   # Location Type
-                          bytes,   # Location FullName
-                          bytes,   # Location CountryCode
-                          bytes,   # Location ADM1Code
-                          int_float_or_none, # Location Latitude
-                          int_float_or_none, # Location Longitude
-                          bytes,   # Location FeatureID
-                          ))],
-
-        # v21_counts
-        [V21Count(*args) for args
-         in double_split(b";", b"#", vec[6],
-                         (bytes,   # Count Type
-                          # 'Count' can't be 'int' due to '081'
-                          # in '20230701000000-562'
-                          bytes,   # Count
-                          bytes,   # Object Type
-                          int,   # Location Type
-                          bytes,   # Location FullName
-                          bytes,   # Location CountryCode
-                          bytes,   # Location ADM1Code
-                          int_float_or_none, # Location Latitude
-                          int_float_or_none, # Location Longitude
-                          int_or_str,   # Location FeatureID
-                          int,   # Location Offset in document
-                          ))],
-
-        # v1_themes
-        double_split(b';', b',', vec[7], (bytes,)),
-
-        # v2_enhanced_themes
-        [V2EnhancedTheme(*args) for args
-         in double_split(b';', b',', vec[8], (bytes, int))],
-
-        # v1_locations
-        [V1Location(*args) for args
-         in double_split(b';', b'#', vec[9],
-                         (int, bytes, bytes, bytes,
-                          int_float_or_none, int_float_or_none,
-                          int_float_or_bytes),
-                         csvgz_path=gkg_csv,
-                         line_number=line_count,
-                         warn_out=warn_out)
-         if is_valid_v1_location_args(args, warn_out)],
-
-        # v2_enhanced_locations
-        [V2EnhancedLocation(*args) for args
-        in double_split(b';', b'#', vec[10],
-                        (int, bytes, bytes, bytes, bytes,
-                         float_or_none, float_or_none, int_float_or_bytes, int),
-                        csvgz_path=gkg_csv,
-                        line_number=line_count,
-                        warn_out=warn_out)],
-
-        # v1_persons
-        single_split(b';', vec[11], (as_is,)),
-
-        # v2_enhanced_persons
-        [V2EnhancedPerson(*args) for args
-        in double_split(b';', b',', vec[12], (bytes, int))],
-
-        # v1_organizations
-        single_split(b';', vec[13], (as_is,)),
-
-        # v2_enhanced_organizations
-        [V2EnhancedOrganization(*args) for args
-        in double_split(b';', b',', vec[14], (bytes, int))],
-
-        # v1.5_tone
-        V15Tone(*single_split(b',', vec[15],
-                              (int_or_float, int_or_float, int_or_float,
-                               int_or_float, int_or_float, int_or_float,
-                               int))),
-
-        # v2.1_enhanced_dates
-        [V21EnhancedDate(*args) for args
-         in double_split(b';', b'#', vec[16],
-                         (int, bytes, bytes, bytes, int))],
-
-        # v2_gcam
-        [V2GCAM(*args) for args
-         in double_split(b',', b':', vec[17],
-                         (bytes, int_or_float))],
-
-        # v2_sharing_image
-        vec[18],
-
-        # v21_related_images
-        url_split(vec[19]),
-
-        # v21_social_image_embeds
-        url_split(vec[20]),
-
-        # v21_social_video_embeds
-        url_split(vec[21]),
-
-        # v21_quotations
-        double_split(b'#', b'|', vec[22], (int, int, bytes, bytes)),
-
-        # v21_all_names
-        double_split(b';', b',', vec[23], (bytes, int)),
-
-        # v21_amounts
-        # The first converter is 'bytes' to preserve '00000' in '00000488'
-        [V21Amount(*args) for args
-         in convert_amount_in_v21amount_to_numeric_if_possible(
-              double_split(b';', b',', vec[24], (as_is, as_is, int)),
-              gkg_csv,
-              line_count,
-              warn_out
-              )],
-
-        # v21_translation_info
-        double_split(b';', b',', vec[25], (int_or_float, as_is)),
-
-        # v2_extras_xml
-        vec[26],
-    )
-    return gkg
+    values = []
+    for (_, parse, object_class, many), column_value \
+            in zip(GKG_COLUMN_PLANS, vec):
+        value = parse(column_value, gkg_csv, line_count, warn_out)
+        if object_class is not None:
+            if many:
+                value = [object_class(*args) for args in value]
+            else:
+                value = object_class(*value)
+        values.append(value)
+    return GKG(*values)
+
+
+BsonEncoder = typing.Callable[[list[bytes], str, int, typing.Any],
+                              bson.raw_bson.RawBSONDocument]
+
+@functools.lru_cache
+def compile_bson_encoder(columns: tuple[str, ...] | None = None
+                         ) -> BsonEncoder:
+    """Returns a function that turns split GKG columns straight into the
+    encoded document GKG.to_bson(columns) would give for the same line,
+    byte for byte, without building the GKG object tree on the way. The
+    columns are parsed by the same plans as makeGKGfromColumns()."""
+    steps = []
+    for plan in GKG_COLUMN_PLANS:
+        if columns is not None and plan.name not in columns:
+            continue
+        field_names = None
+        if plan.object_class is not None:
+            field_names = tuple(field.name for field
+                                in dataclasses.fields(plan.object_class))
+        steps.append((GKG_COLUMN_NAMES.index(plan.name), plan.name,
+                      plan.parse, field_names, plan.many))
+    date_index = GKG_COLUMN_NAMES.index('v1_date')
+    trailer: dict[str, typing.Any] = {'__version__': 1}
+    if columns is not None:
+        trailer['__columns__'] = [step[1] for step in steps]
+
+    def encode(vec: list[bytes],
+               gkg_csv: str,
+               line_count: int,
+               warn_out: typing.Any,
+               ) -> bson.raw_bson.RawBSONDocument:
+        doc: dict[str, typing.Any] = {}
+        for index, name, parse, field_names, many in steps:
+            value = parse(vec[index], gkg_csv, line_count, warn_out)
+            if field_names is not None:
+                if many:
+                    value = [dict(zip(field_names, args, strict=True))
+                             for args in value]
+                else:
+                    value = dict(zip(field_names, value, strict=True))
+            elif index == date_index:
+                value = value.isoformat()
+            doc[name] = value
+        doc.update(trailer)
+        return bson.raw_bson.RawBSONDocument(bson.encode(doc))
+    return encode
+
+
+record_id_index_checked = False
+
+def ensure_record_id_index(collection: pymongo.collection.Collection) -> None:
+    """Make sure 'gkg_record_id' is indexed so that the existence checks
+    in store_missing_records() do not scan the collection. An index that
+    is already there (unique or not) is left alone."""
+    global record_id_index_checked
+    if record_id_index_checked:
+        return
+    for info in collection.index_information().values():
+        if info['key'] == [('gkg_record_id', 1)]:
+            break
+    else:
+        collection.create_index('gkg_record_id')
+    record_id_index_checked = True
+
+
+def find_stored_ids(collection: pymongo.collection.Collection,
+                    record_ids: list[bytes]) -> set[bytes]:
+    return {doc['gkg_record_id'] for doc
+            in collection.find({'gkg_record_id': {'$in': record_ids}},
+                               {'gkg_record_id': 1, '_id': 0})}
+
+
+def split_records(records: typing.Iterable[bytes],
+                  gkg_csv: str,
+                  warn_out: typing.Any,
+                  line_count: int = 0,
+                  ) -> typing.Generator[tuple[int, list[bytes]], None, None]:
+    """Yields (line number, columns) for each record in 'records', counting
+    lines on from 'line_count'. Records too long to be real or without the
+    27 GKG columns are passed to 'warn_out' and skipped."""
+    for line in records:
+        if 16 * 1024 * 1024 <= len(line):
+            warn_out('Line too long: ' + str(line[:32]) + '...')
+            continue
+        line_count += line.count(b'\n') + 1
+        vec = line.split(b'\t')
+        if len(vec) != 27:
+            warn_out(f"Short line {line_count}@{gkg_csv}:[{line!r}]")
+            continue
+        yield line_count, vec
+
+
+def encode_record(encode: BsonEncoder,
+                  vec: list[bytes],
+                  gkg_csv: str,
+                  line_count: int,
+                  warn_out: typing.Any,
+                  ) -> bson.raw_bson.RawBSONDocument:
+    try:
+        return encode(vec, gkg_csv, line_count, warn_out)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        print (f"Offending row:{vec[0]!r}")
+        raise
+
+
+def store_missing_records(collection: pymongo.collection.Collection,
+                          writer: import_util.BulkInserter,
+                          pending: list[tuple[bytes, typing.Any]],
+                          queued_ids: set[bytes],
+                          gkg_csv: str,
+                          opts: options.GkgOptions,
+                          to_document: typing.Callable[
+                              [typing.Any], bson.raw_bson.RawBSONDocument],
+                          dedupe: bool = True,
+                          ) -> int:
+    """Queue the records in 'pending', (record id, record) pairs, that are
+    neither stored yet nor already queued from this file, each turned into
+    its document by 'to_document'. Existence is checked with a single $in
+    query for the whole of 'pending', unless 'dedupe' is off because
+    nothing of the file can be stored yet. Returns the number of records
+    the writer inserted meanwhile."""
+    if not pending:
+        return 0
+    existing: set[bytes] = set()
+    if dedupe:
+        existing = find_stored_ids(
+            collection, [record_id for record_id, _ in pending])
+    gkg_count = 0
+    for record_id, record in pending:
+        if record_id in existing or record_id in queued_ids:
+            continue
+        queued_ids.add(record_id)
+        document = to_document(record)
+        if opts.no_store:
+            continue
+        try:
+            gkg_count += writer.add(document)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            print (f'Offending batch ending at {record_id!r}@{gkg_csv}',
+                   file=sys.stderr)
+            raise
+    return gkg_count
+
+
+def flush_records(writer: import_util.BulkInserter, gkg_csv: str) -> int:
+    try:
+        return writer.flush()
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        print (f'Offending last batch of {gkg_csv}', file=sys.stderr)
+        raise
+
+
+def import_records(mongo_conn:pymongo.MongoClient,
+                   gkg_csv:str,
+                   records:typing.Iterable[bytes],
+                   opts:options.GkgOptions,
+                   warn_out: typing.Any,
+                   dedupe: bool = True,
+                   ) -> int:
+    collection = mongo_conn.gdelt[opts.collection]
+    columns = projected_columns(opts)
+    encode = compile_bson_encoder(None if columns is None else tuple(columns))
+    ensure_record_id_index(collection)
+    writer = import_util.BulkInserter(collection, opts.batch_size)
+
+    def to_document(record: tuple[int, list[bytes]]
+                    ) -> bson.raw_bson.RawBSONDocument:
+        line_count, vec = record
+        return encode_record(encode, vec, gkg_csv, line_count, warn_out)
+
+    pending: list[tuple[bytes, tuple[int, list[bytes]]]] = []
+    queued_ids: set[bytes] = set()
+    gkg_count = 0
+    for line_count, vec in split_records(records, gkg_csv, warn_out):
+        pending.append((vec[0], (line_count, vec)))
+        if opts.batch_size <= len(pending):
+            gkg_count += store_missing_records(
+                collection, writer, pending, queued_ids,
+                gkg_csv, opts, to_document, dedupe)
+            pending = []
+    gkg_count += store_missing_records(
+        collection, writer, pending, queued_ids,
+        gkg_csv, opts, to_document, dedupe)
+    return gkg_count + flush_records(writer, gkg_csv)
+
+
+def encode_range(csv_path: str,
+                 start: int,
+                 end: int,
+                 newlines_before: int,
+                 gkg_csv: str,
+                 columns: tuple[str, ...] | None,
+                 ) -> tuple[list[tuple[bytes, bytes]], list[str]]:
+    """Encodes the records in bytes [start, end) of the decompressed
+    'csv_path' as import_records() would, numbering lines from
+    'newlines_before'. Returns (record id, BSON) pairs and the warnings,
+    which are passed back rather than written from the pool process."""
+    encode = compile_bson_encoder(columns)
+    warnings: list[str] = []
+    with open(csv_path, 'rb') as fp:
+        fp.seek(start)
+        blob = fp.read(end - start)
+    records = split_records(chunk_splitter.split_to_chunks(blob),
+                            gkg_csv, warnings.append, newlines_before)
+    encoded = [(vec[0], encode_record(encode, vec, gkg_csv, line_count,
+                                      warnings.append).raw)
+               for line_count, vec in records]
+    return encoded, warnings
+
+
+# Largest byte range of a split file encoded as one task. With a bounded
+# number of tasks in flight, this bounds the encoded records held at once
+# whatever the size of the file.
+SPLIT_RANGE_BYTES:int = 32 * 1024 * 1024
+
+def split_processes(opts: options.GkgOptions) -> int:
+    """--split-workers, or else an equal share of the CPUs for each of the
+    --num-workers importers, which may all be splitting a file at once."""
+    return opts.split_workers or max(1, (os.cpu_count() or 1)
+                                     // opts.num_workers)
+
+
+def import_records_in_parallel(mongo_conn:pymongo.MongoClient,
+                               gkg_csv:str,
+                               csv_path:str,
+                               opts:options.GkgOptions,
+                               warn_out: typing.Any,
+                               dedupe: bool = True,
+                               ) -> int:
+    """import_records() for one large decompressed file: its records are
+    split into ranges at record headers and encoded on a pool of
+    processes, then stored from here in file order."""
+    processes = split_processes(opts)
+    with open(csv_path, 'rb') as fp:
+        # At least a range per process, and none over SPLIT_RANGE_BYTES
+        parts = max(processes, -(-os.fstat(fp.fileno()).st_size
+                                 // SPLIT_RANGE_BYTES))
+        ranges = chunk_splitter.find_record_ranges(fp, parts)
+    columns = projected_columns(opts)
+    columns_key = None if columns is None else tuple(columns)
+    collection = mongo_conn.gdelt[opts.collection]
+    ensure_record_id_index(collection)
+    writer = import_util.BulkInserter(collection, opts.batch_size)
+    queued_ids: set[bytes] = set()
+    gkg_count = 0
+    with multiprocessing.Pool(processes) as pool:
+        # Keep a bounded number of ranges encoded ahead of the inserts
+        window = processes * 2
+        results: collections.deque = collections.deque()
+        pending_ranges = iter(ranges)
+        while True:
+            for start, end, newlines_before in itertools.islice(
+                    pending_ranges, window - len(results)):
+                results.append(pool.apply_async(
+                    encode_range, (csv_path, start, end, newlines_before,
+                                   gkg_csv, columns_key)))
+            if not results:
+                break
+            encoded, warnings = results.popleft().get()
+            for msg in warnings:
+                warn_out(msg)
+            for i in range(0, len(encoded), opts.batch_size):
+                gkg_count += store_missing_records(
+                    collection, writer, encoded[i:i + opts.batch_size],
+                    queued_ids, gkg_csv, opts,
+                    bson.raw_bson.RawBSONDocument, dedupe)
+    return gkg_count + flush_records(writer, gkg_csv)
+
+
+def import_large_gkg(mongo_conn:pymongo.MongoClient,
+                     gkg_csv:str,
+                     opts:options.GkgOptions,
+                     warn_out: typing.Any,
+                     dedupe: bool = True,
+                     ) -> int:
+    """Decompresses 'gkg_csv' next to it, so that the pool processes can
+    each read their byte ranges, and imports it in parallel."""
+    with tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(gkg_csv))) as work_dir:
+        csv_path = os.path.join(work_dir,
+                                os.path.basename(gkg_csv)[:-4])
+        with chunk_splitter.open_zip_member(gkg_csv) as member, \
+             open(csv_path, 'wb') as fp:
+            shutil.copyfileobj(member, fp, chunk_splitter.READ_SIZE)
+        return import_records_in_parallel(mongo_conn, gkg_csv, csv_path,
+                                          opts, warn_out, dedupe)
 
 
 @with_mongo()
@@ -425,52 +758,37 @@ def import_gkg(mongo_conn:pymongo.MongoClient,
     if do_reporting:
         print (f"Processing {gkg_csv}...")
     # print (mongo_conn.gdelt.list_collection_names())
+    ledger: import_ledger.ImportLedger | None = None
+    dedupe = True
+    if opts.ledger and not opts.no_store:
+        ledger = import_ledger.ImportLedger(
+            mongo_conn.gdelt[import_ledger.LEDGER_COLLECTION],
+            opts.collection)
+        # A file no earlier run has started has no records stored yet
+        dedupe = ledger.begin(gkg_csv)
     try:
-        with zipfile.ZipFile(gkg_csv, 'r') as archive:
-            base_name = os.path.basename(gkg_csv)[:-4] # name without '.zip'
-            blob = archive.read(base_name)
+        if (0 < opts.split_mb and opts.split_mb * 1024 * 1024
+                <= chunk_splitter.zip_member_size(gkg_csv)):
+            gkg_count = import_large_gkg(mongo_conn, gkg_csv, opts,
+                                         warn_out, dedupe)
+        else:
+            with chunk_splitter.open_zip_member(gkg_csv) as member:
+                gkg_count = import_records(
+                    mongo_conn, gkg_csv,
+                    chunk_splitter.split_stream_to_chunks(member),
+                    opts, warn_out, dedupe)
     except zipfile.BadZipFile:
         print (f"Corrupt zip file? [{gkg_csv}]")
         warn_out(f"Corrupt zip file? [{gkg_csv}]")
+        if ledger is not None:
+            ledger.fail(gkg_csv, 'corrupt zip file')
         return
-    pos, gkg_count, line_count = 0, 0, 0
-    for line in chunk_splitter.split_to_chunks(blob):
-        if 16 * 1024 * 1024 <= len(line):
-            warn_out('Line too long: ' + str(line[:32]) + '...')
-            continue
-        line_count += line.count(b'\n') + 1
-        vec = line.split(b'\t')
-        if len(vec) != 27:
-            warn_out(f"Short line {line_count}@{gkg_csv}:[{line!r}]")
-            continue
-        # run_non_empty_check(vec, columns_found_nonempty)
-        #if vec[0] != b'20230701000000-66':
-        #    continue
-        # print (f"{vec[0]=} {vec[9]=}")
-        try:
-            x = mongo_conn.gdelt.gkg.find_one({'gkg_record_id':vec[0]})
-            if x is None:
-                gkg = makeGKGfromColumns(vec, gkg_csv, line_count, warn_out)
-            else:
-                gkg = None
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except:
-            print (f"Offending row:{vec[0]!r}")
-            raise
-        if gkg is not None and not opts.no_store:
-            try:
-                mongo_conn.gdelt.gkg.insert_one(gkg.to_bson())
-            except (KeyboardInterrupt, SystemExit):
-                raise
-            except:
-                print ('Offending GKG:', gkg, file=sys.stderr)
-                raise
-                
-            gkg_count += 1
-        # value_list = list(mongo_conn.gdelt.gkg.find({}))
-        # gkg = GKG.deserialize(value_list[0])
-        # print (value_list[0]['_id'])
+    except Exception as e:
+        if ledger is not None:
+            ledger.fail(gkg_csv, repr(e))
+        raise
+    if ledger is not None:
+        ledger.complete(gkg_csv, gkg_count)
     if do_reporting:
         print (f"Inserted {gkg_count} gkg objects");
 
@@ -500,10 +818,17 @@ def importer(queue: multiprocessing.Queue[str|None],
              opts:options.GkgOptions
              ) -> None:
     columns_found_nonempty:set[int] = set()
+    # Time spent idle for want of a file; it should be small if the
+    # downloads keep ahead.
+    waited, files = 0.0, 0
     while True:
+        start = time.perf_counter()
         gzfile_path: str | None = queue.get()
         if gzfile_path is None:
+            # Waiting for the end of the input isn't waiting for a file
             break
+        waited += time.perf_counter() - start
+        files += 1
         year_month_part = os.path.basename(gzfile_path)[:6]
         def warn_out(msg:str):
             logging_queue.put((year_month_part, msg))
@@ -511,6 +836,11 @@ def importer(queue: multiprocessing.Queue[str|None],
                    columns_found_nonempty,
                    opts,
                    warn_out)
+    if not opts.quiet:
+        print (f"Worker {os.getpid()}: {files} files, "
+               f"waited {waited:.1f}s for input")
+    # Worker processes leave through os._exit(), which skips atexit.
+    mymongo.close_clients()
 
 
 def main(nextrow_g:typing.Generator, opts:options.GkgOptions) -> None:
@@ -555,6 +885,13 @@ if __name__ == '__main__':
     parser.add_option('-v', '--verbose', action='store_true', default=False)
     parser.add_option('-q', '--quiet', action='store_true', default=False)
     parser.add_option('-w', '--num-workers', type=int, default=2)
+    parser.add_option('-b', '--batch-size', type=int, default=1000,
+                      help='number of GKG records per bulk insert')
+    parser.add_option('-c', '--columns', type=str, default='',
+                      help='comma separated GKG fields to parse and store, '
+                      'e.g. v2_enhanced_themes,v15_tone [all]')
+    parser.add_option('-C', '--collection', type=str, default='gkg',
+                      help='collection in the gdelt database to store to')
     parser.add_option('-m', '--masterfile', type=str,
                       default='/opt/gdelt/csv/masterfilelist.txt')
     parser.add_option('-l', '--lower-limit', type=str,
@@ -565,6 +902,22 @@ if __name__ == '__main__':
     parser.add_option('-n', '--no-store', default=False, action='store_true')
     parser.add_option('-x', '--bailout-on-exception', default=False,
                       action='store_true')
+    parser.add_option('-p', '--prefetch', type=int, default=4,
+                      help='files downloaded ahead of the importers')
+    parser.add_option('-P', '--prefetch-mb', type=int, default=1024,
+                      help='megabytes the files downloaded ahead may take '
+                      'until they are put on the import queue, which holds '
+                      'up to two files per worker besides')
+    parser.add_option('-s', '--split-mb', type=int, default=256,
+                      help='files decompressing to this many megabytes or '
+                      'more are parsed on several processes; 0 for never')
+    parser.add_option('-S', '--split-workers', type=int, default=0,
+                      help='processes parsing a split file '
+                      '[CPUs / --num-workers]')
+    parser.add_option('-L', '--no-ledger', dest='ledger', default=True,
+                      action='store_false',
+                      help='neither skip files the import ledger has as '
+                      'complete nor record them there')
     
     opts, args = parser.parse_args()
     print (opts)
@@ -580,10 +933,24 @@ if __name__ == '__main__':
         opts.upper_limit,
         opts.dry_run,
         opts.no_store,
+        opts.batch_size,
+        opts.columns,
+        opts.collection,
+        opts.ledger,
+        opts.prefetch,
+        opts.prefetch_mb,
+        opts.split_mb,
+        opts.split_workers,
         )
+    try:
+        projected_columns(typed_opts)
+    except ValueError as e:
+        parser.error(str(e))
 
     make_csv_storage_dir(opts)
 
-    main(import_util.make_csv_path_generator(args, typed_opts),
+    ledger = (import_ledger.get_ledger(typed_opts.collection)
+              if typed_opts.ledger and not typed_opts.no_store else None)
+    main(import_util.make_csv_path_generator(args, typed_opts, ledger),
          typed_opts)
 
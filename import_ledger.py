@@ -0,0 +1,98 @@
+"""
+A ledger of the source files imported into each collection, kept in the
+'import_ledger' collection of the gdelt database with one document per
+file:
+
+    {'_id': 'gkg/20150218230000.gkg.csv.zip', 'collection': 'gkg',
+     'file': '20150218230000.gkg.csv.zip', 'md5': ..., 'status': ...,
+     'attempts': 1, 'records': 1234, 'rejected': 0,
+     'queued_at': ..., 'started_at': ..., 'completed_at': ...}
+
+A file is 'queued' by the walk over the masterfile, 'started' by the
+importer that opens it and 'complete' once its last record is stored, or
+'failed'. Every change is a single-document update, so a file is never
+complete without its counts. A rerun skips complete files whose md5 still
+matches the masterfile, and a file that was never started before can be
+stored without checking for records of it already in the collection.
+"""
+from __future__ import annotations
+
+import datetime
+import os
+
+import pymongo
+
+from mymongo import with_mongo
+
+LEDGER_COLLECTION:str = 'import_ledger'
+
+QUEUED:str = 'queued'
+STARTED:str = 'started'
+COMPLETE:str = 'complete'
+FAILED:str = 'failed'
+
+
+def now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class ImportLedger:
+    """The ledger entries of the files imported into 'collection_name'."""
+
+    def __init__(self,
+                 ledger:pymongo.collection.Collection,
+                 collection_name:str) -> None:
+        self.ledger = ledger
+        self.collection_name = collection_name
+
+    def key(self, path:str) -> str:
+        return f'{self.collection_name}/{os.path.basename(path)}'
+
+    def completed(self, lower:str, upper:str) -> dict[str, str | None]:
+        """The md5 of each complete file whose name sorts between lower
+        and upper, e.g. the YYYYMMDDHHMMSS limits of an import, in one
+        query over the _id index."""
+        cursor = self.ledger.find(
+            {'_id': {'$gte': self.key(lower), '$lt': self.key(upper)},
+             'status': COMPLETE},
+            {'file': 1, 'md5': 1})
+        return {doc['file']: doc.get('md5') for doc in cursor}
+
+    def enqueue(self, path:str, md5:str) -> None:
+        self.ledger.update_one(
+            {'_id': self.key(path)},
+            {'$set': {'collection': self.collection_name,
+                      'file': os.path.basename(path),
+                      'md5': md5, 'status': QUEUED, 'queued_at': now()}},
+            upsert=True)
+
+    def begin(self, path:str) -> bool:
+        """Marks path started and returns whether an earlier attempt may
+        have stored some of its records already."""
+        before = self.ledger.find_one_and_update(
+            {'_id': self.key(path)},
+            {'$set': {'collection': self.collection_name,
+                      'file': os.path.basename(path),
+                      'status': STARTED, 'started_at': now()},
+             '$inc': {'attempts': 1}},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.BEFORE)
+        return before is not None and 0 < before.get('attempts', 0)
+
+    def complete(self, path:str, records:int, rejected:int = 0) -> None:
+        self.ledger.update_one(
+            {'_id': self.key(path)},
+            {'$set': {'status': COMPLETE, 'records': records,
+                      'rejected': rejected, 'completed_at': now()}})
+
+    def fail(self, path:str, reason:str) -> None:
+        self.ledger.update_one(
+            {'_id': self.key(path)},
+            {'$set': {'status': FAILED, 'error': reason,
+                      'completed_at': now()}})
+
+
+@with_mongo()
+def get_ledger(mongo_conn:pymongo.MongoClient,
+               collection_name:str) -> ImportLedger:
+    return ImportLedger(mongo_conn.gdelt[LEDGER_COLLECTION], collection_name)
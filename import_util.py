@@ -1,14 +1,27 @@
 from __future__ import annotations
 
+import collections
+from concurrent import futures
+import hashlib
 import multiprocessing
 import math
 import os
 import typing
 
+import bson # type: ignore
+import pymongo
 import requests
 
+from gdelttools import masterindex, web
+import import_ledger
 import options
 
+# Stay well below the server's 48MB message limit; pymongo would split
+# larger batches anyway, but at the cost of an extra encoding pass.
+MAX_BATCH_BYTES:int = 16 * 1024 * 1024
+
+DUPLICATE_KEY_ERROR:int = 11000
+
 max_8byte_int = int(math.pow(2, 63)) - 1
 min_8byte_int = -int(math.pow(2, 63))
 
@@ -23,9 +36,78 @@ def is_valid_amount(amount:bytes) -> bool:
     except ValueError:
         return False
 
+class BulkInserter:
+    """Buffers documents and writes them with unordered bulk inserts.
+
+    A batch is flushed when it holds 'max_count' documents or when the next
+    document would push the encoded size of the batch past 'max_bytes'.
+    Documents are BSON-encoded once here and handed to pymongo as
+    RawBSONDocument so that they are not encoded a second time.
+    Duplicate key errors are tolerated so that a unique index can be used
+    to reject records that are already stored.
+    """
+
+    def __init__(self,
+                 collection: pymongo.collection.Collection,
+                 max_count: int,
+                 max_bytes: int = MAX_BATCH_BYTES,
+                 ) -> None:
+        assert 0 < max_count, f"Bad batch size {max_count}"
+        self.collection = collection
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.pending: list[pymongo.InsertOne] = []
+        self.pending_bytes = 0
+
+    def add(self, document: typing.Mapping[str, typing.Any]) -> int:
+        """Queue 'document' and return the number of documents inserted
+        by the flush it triggered, if any."""
+        if not isinstance(document, bson.raw_bson.RawBSONDocument):
+            document = bson.raw_bson.RawBSONDocument(bson.encode(document))
+        size = len(document.raw)
+        inserted = 0
+        if self.pending and self.max_bytes < self.pending_bytes + size:
+            inserted = self.flush()
+        self.pending.append(pymongo.InsertOne(document))
+        self.pending_bytes += size
+        if self.max_count <= len(self.pending):
+            inserted += self.flush()
+        return inserted
+
+    def flush(self) -> int:
+        if not self.pending:
+            return 0
+        requests_, self.pending, self.pending_bytes = self.pending, [], 0
+        return write_unordered(self.collection, requests_)
+
+
+def write_unordered(collection: pymongo.collection.Collection,
+                    requests_: list[pymongo.InsertOne],
+                    ) -> int:
+    """Writes 'requests_' with one unordered bulk write and returns the
+    number of documents inserted. Duplicate key errors are tolerated, as
+    they only mean a document was stored already; any other error is
+    raised."""
+    try:
+        result = collection.bulk_write(requests_, ordered=False)
+    except pymongo.errors.BulkWriteError as e:
+        if any(error['code'] != DUPLICATE_KEY_ERROR
+               for error in e.details['writeErrors']):
+            raise
+        if e.details['writeConcernErrors']:
+            raise
+        return e.details['nInserted']
+    return result.inserted_count
+
+
 def make_csv_path_generator(args:list[str],
                             opts:options.GkgOptions,
+                            ledger:import_ledger.ImportLedger|None = None,
                             ) -> typing.Generator:
+    """The paths of the files in 'args', or else of those the masterfile
+    lists for the date range of 'opts'. Only an importer should pass a
+    'ledger': files it has as complete are skipped and the rest are
+    marked queued."""
     if 0 < len(args):
         def nextrow_g() -> typing.Generator:
             for gzfile_path in args:
@@ -37,7 +119,7 @@ def make_csv_path_generator(args:list[str],
                     print (msg)
                     print (msg, file=fp)
                 for gzfile_path in walk_on_csv_rows(
-                    ".gkg.csv.zip", error_out, opts):
+                    ".gkg.csv.zip", error_out, opts, ledger):
                     yield gzfile_path
     return nextrow_g()
 
@@ -49,67 +131,129 @@ def make_csv_path_generator(args:list[str],
 #         queue.put(line)
 
 
+def fetch_verified(url:str, path:str, size:int, md5:str) -> str:
+    """
+    Downloads url to path through web.WebDownload, i.e. resuming an
+    interrupted download and checking the masterfile size and MD5 before
+    path appears.
+    """
+    return web.WebDownload().download_url(url, path, hasher=hashlib.md5(),
+                                          expected_digest=md5,
+                                          expected_size=size)
+
+
+def select_csv_files(ending_key:str,
+                     msgout:typing.Callable[[str], None],
+                     opts: options.GkgOptions,
+                     ledger: import_ledger.ImportLedger | None = None,
+                     ) -> typing.Iterator[tuple[masterindex.MasterfileEntry, str]]:
+    """The masterfile entries to import and the paths they are stored at,
+    whether they are there yet or not, in time order."""
+    # The index finds the date range by binary search, and only reads
+    # the masterfile lines added since it was last brought up to date.
+    index = masterindex.open_index(opts.masterfile,
+                                   None if opts.quiet else msgout)
+    completed = ({} if ledger is None else
+                 ledger.completed(opts.lower_limit_ymdhms,
+                                  opts.upper_limit_ymdhms))
+    for entry in index.select(opts.lower_limit_ymdhms,
+                              opts.upper_limit_ymdhms, ending_key):
+        zip_name = entry.url.rsplit('/', 1)[1]
+        if completed.get(zip_name) == entry.md5:
+            if opts.verbose:
+                print (f'Skipping {zip_name}, imported already')
+            continue
+        year = zip_name[:4]
+        gzcsv_path = f'/opt/gdelt/csv/{year}/{zip_name}'
+        if not os.path.exists(gzcsv_path):
+            if opts.dry_run:
+                msgout(f"Not fetching {entry.url} in dry-run.")
+                continue
+        else:
+            if opts.verbose:
+                print (f'Loading from {zip_name}')
+            if opts.dry_run:
+                continue
+        yield entry, gzcsv_path
+
+
+def prefetch_csv_files(files: typing.Iterable[tuple[masterindex.MasterfileEntry, str]],
+                       msgout:typing.Callable[[str], None],
+                       ahead:int,
+                       max_bytes:int,
+                       quiet:bool = False,
+                       ) -> typing.Iterator[tuple[masterindex.MasterfileEntry, str]]:
+    """Passes 'files' on in order, once each is on disk, with up to
+    'ahead' of the next ones downloading on threads meanwhile, as long as
+    the files downloaded and not passed on yet come to at most 'max_bytes'
+    (by masterfile size). One file is always let through, however large.
+    A file that fails to download is reported to msgout and left out."""
+    def fetch(entry:masterindex.MasterfileEntry, gzcsv_path:str) -> None:
+        if os.path.exists(gzcsv_path):
+            return
+        if not quiet:
+            print (f'Fetching from {entry.url}')
+        fetch_verified(entry.url, gzcsv_path, entry.size, entry.md5)
+
+    source = iter(files)
+    pending: collections.deque = collections.deque()
+    held = 0
+    upcoming = next(source, None)
+
+    def fill() -> None:
+        nonlocal held, upcoming
+        while upcoming is not None and len(pending) < max(1, ahead):
+            entry, gzcsv_path = upcoming
+            size = 0 if os.path.exists(gzcsv_path) else entry.size
+            if pending and max_bytes < held + size:
+                return
+            held += size
+            pending.append((upcoming, size,
+                            pool.submit(fetch, entry, gzcsv_path)))
+            upcoming = next(source, None)
+
+    with futures.ThreadPoolExecutor(max(1, ahead)) as pool:
+        try:
+            fill()
+            while pending:
+                item, size, future = pending[0]
+                try:
+                    future.result()
+                except (requests.exceptions.RequestException,
+                        web.DownloadVerificationError) as e:
+                    msgout(f"Failed to fetch {item[0].url}: {e}")
+                    item = None
+                pending.popleft()
+                held -= size
+                # Top up before handing over, so that the downloads go on
+                # while the file is imported.
+                fill()
+                if item is not None:
+                    yield item
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+
 def walk_on_csv_rows(ending_key:str,
                      msgout:typing.Callable[[str], None],
-                     opts: options.GkgOptions) -> typing.Generator:
-    i:int = 0
-    line: str|None = None
+                     opts: options.GkgOptions,
+                     ledger: import_ledger.ImportLedger | None = None,
+                     ) -> typing.Generator:
+    last_url: str|None = None
     try:
-        with open(opts.masterfile, 'r') as fp:
-            while 1:
-                last_line = line
-                line = fp.readline()
-                i += 1
-                if not line:
-                    break
-                vec = line.rstrip().split(' ')
-                if len(vec) != 3:
-                    if not opts.quiet:
-                        msgout(f"ill-formed line: '{line.rstrip()} @ {i}'")
-                    continue
-                assert len(vec)==3, f"Bad format '{line}'."
-                size, hash, url = vec
-                if not url.endswith(ending_key):
-                    continue
-                zip_name = url.rsplit('/', 1)[1]
-                timestamp_part = zip_name[:14]
-                # print ('L', timestamp_part, opts.lower_limit)
-                if timestamp_part < opts.lower_limit_ymdhms:
-                    #if opts.verbose:
-                    #    print (f'Ignoring {zip_name} because it\'s too old.')
-                    continue
-                if opts.upper_limit_ymdhms <= timestamp_part:
-                    if opts.verbose:
-                        print (f'Found {zip_name} which is newer than ' +
-                               opts.upper_limit_ymdhms + '. Exiting')
-                        break
-                    continue
-                year = timestamp_part[:4]
-                gzcsv_path = f'/opt/gdelt/csv/{year}/{zip_name}'
-                if not os.path.exists(gzcsv_path):
-                    if opts.dry_run:
-                        msgout("Not fetching {url} in dry-run.")
-                        continue
-                    if not opts.quiet:
-                        print (f'Fetching from {url}')
-                    with requests.get(url) as r:
-                        if r.status_code == 200:
-                            with open(gzcsv_path+'.tmp', 'wb') as wfp:
-                                wfp.write(r.content)
-                            os.rename(gzcsv_path+'.tmp', gzcsv_path)
-                        else:
-                            msgout(f"Bad HTTP-STATUS '{r.status_code}' from {url}")
-                            continue
-                else:
-                    if opts.verbose:
-                        print (f'Loading from {zip_name}')
-                    if opts.dry_run:
-                        continue
-
-                yield gzcsv_path
+        # Downloads run ahead on threads, so that the importers aren't
+        # kept waiting on HTTP between files.
+        for entry, gzcsv_path in prefetch_csv_files(
+                select_csv_files(ending_key, msgout, opts, ledger), msgout,
+                opts.prefetch, opts.prefetch_mb * 1024 * 1024, opts.quiet):
+            last_url = entry.url
+            if ledger is not None:
+                ledger.enqueue(gzcsv_path, entry.md5)
+            yield gzcsv_path
 
         if not opts.quiet:
             print ('pushed all csv files!')
-            print ('The last-line seen was: ', last_line)
+            print ('The last file seen was: ', last_url)
     except KeyboardInterrupt:
         pass
@@ -0,0 +1,59 @@
+#! /usr/local/bin/python3
+"""
+Imports GDELT 2.0 mentions (*.mentions.CSV.zip) into gdelt.mentions with
+the same pipelines as events_import, then indexes GLOBALEVENTID so that
+mentions can be joined to their events.
+
+    python mentions_import.py -w 4 -l 2015-02-18T00-00-00
+"""
+from __future__ import annotations
+
+import pymongo
+
+from gdelttools import bulkimport
+import events_import
+from mymongo import with_mongo
+import options
+
+MENTION_FIELDS = bulkimport.read_field_file(bulkimport.MENTIONS_FIELD_FILE)
+
+# GDELT fills in every numeric column of a mention; an offset that isn't
+# known is -1, not blank.
+REQUIRED_MENTION_FIELDS = frozenset(
+    name for name, convert in MENTION_FIELDS if convert is not None)
+
+# An event is mentioned once per article
+MENTIONS = events_import.RecordKind('.mentions.CSV.zip', 'mentions',
+                                    MENTION_FIELDS, REQUIRED_MENTION_FIELDS,
+                                    ('GLOBALEVENTID', 'MentionIdentifier'))
+
+EVENT_ID_KEY = 'GLOBALEVENTID'
+
+
+@with_mongo()
+def create_event_id_index(mongo_conn:pymongo.MongoClient) -> str:
+    """Built once the files are in, rather than maintained on every insert
+    of the load."""
+    return mongo_conn.gdelt[MENTIONS.collection].create_index(EVENT_ID_KEY)
+
+
+def index_event_ids(opts:options.EventOptions) -> None:
+    if opts.dry_run or opts.no_store:
+        return
+    if not opts.quiet:
+        print (f'Indexing {MENTIONS.collection}.{EVENT_ID_KEY}')
+    create_event_id_index()
+
+
+def main(args:list[str], opts:options.EventOptions) -> None:
+    events_import.main(args, opts, MENTIONS)
+    index_event_ids(opts)
+
+
+def import_files(paths:list[str], opts:options.EventOptions) -> None:
+    events_import.import_files(paths, opts, MENTIONS)
+    index_event_ids(opts)
+
+
+if __name__ == '__main__':
+    main(*events_import.parse_options())
@@ -1,3 +1,4 @@
+import atexit
 import functools
 import os
 import sys
@@ -12,12 +13,20 @@ You can reconfigure the names of environment variables that are used to
 get db connection info through by setting another environment variable
 'MYMONGO_ENVVAR_MAP'.
 'MONGO_DB_HOST', 'MONGO_DB_USERNAME', and 'MONGO_DB_PASSWORD' are probed
-by default.
+by default, along with 'MONGO_DB_MAX_POOL_SIZE' and 'MONGO_DB_MIN_POOL_SIZE'
+for sizing the connection pool.
+
+Clients are cached per process and keyed by their connection parameters,
+so every function wrapped by 'with_mongo' in a process shares one pooled
+client. A forked child never reuses a client created by its parent; it
+builds its own on first use. Call 'close_clients' to shut the cached
+clients down explicitly; it also runs at interpreter exit.
 """
 
 envvar_name_mapping_str = os.getenv(
     'MYMONGO_ENVVAR_MAP',
-    'host:MONGO_DB_HOST,username:MONGO_DB_USERNAME,password:MONGO_DB_PASSWORD')
+    'host:MONGO_DB_HOST,username:MONGO_DB_USERNAME,password:MONGO_DB_PASSWORD,'
+    'maxPoolSize:MONGO_DB_MAX_POOL_SIZE,minPoolSize:MONGO_DB_MIN_POOL_SIZE')
 
 envvar_name_mapping:dict[str,str] = functools.reduce(
     lambda acc, x: dict(acc, **dict([x.split(':')])),
@@ -33,6 +42,34 @@ def process_host(value:str) -> list[str]:
     return value.split(',')
     
 
+client_cache:dict[str, pymongo.MongoClient] = {}
+
+
+def forget_clients() -> None:
+    """Drop cached clients without closing them. Used in forked children,
+    where the sockets still belong to the parent process."""
+    client_cache.clear()
+
+
+def close_clients() -> None:
+    while client_cache:
+        _, conn = client_cache.popitem()
+        conn.close()
+
+
+os.register_at_fork(after_in_child=forget_clients)
+atexit.register(close_clients)
+
+
+def get_client(*args, **kw) -> pymongo.MongoClient:
+    key = repr((args, sorted(kw.items())))
+    conn = client_cache.get(key)
+    if conn is None:
+        conn = pymongo.MongoClient(*args, **kw)
+        client_cache[key] = conn
+    return conn
+
+
 def with_mongo(*args_ro, **kw_ro):
     def f(wrapee, *w_args, **w_kw):
         def g(*g_args, **g_kw):
@@ -42,17 +79,16 @@ def with_mongo(*args_ro, **kw_ro):
             # Pull connection info from env-var if not specified in 'kw_'
             for kwarg_name, processor in [('host', process_host),
                                           ('username', as_is),
-                                          ('password', as_is)]:
+                                          ('password', as_is),
+                                          ('maxPoolSize', int),
+                                          ('minPoolSize', int)]:
                 if kwarg_name not in kw:
                     env_name = envvar_name_mapping.get(kwarg_name)
                     if env_name is not None:
                         if value := os.getenv(env_name):
                             kw[kwarg_name] = processor(value)
-            conn = pymongo.MongoClient(*args_ro, **kw)
-            try:
-                wrapee(conn, *g_args, **g_kw)
-            finally:
-                conn.close()
+            conn = get_client(*args_ro, **kw)
+            return wrapee(conn, *g_args, **g_kw)
         return g
     return f
 
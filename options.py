@@ -24,6 +24,22 @@ class GkgOptions(OptionBase):
     upper_limit_ymdhms: str
     dry_run: bool
     no_store: bool
+    batch_size: int = 1000
+    # Comma separated GKG field names to store; empty for all of them.
+    columns: str = ''
+    collection: str = 'gkg'
+    # Record files in the import ledger and skip those already complete
+    ledger: bool = True
+    # Files downloaded ahead of the importers, and the megabytes they may
+    # take up on disk before being put on the import queue. The queue
+    # itself holds up to 2 * num_workers more, which are not counted.
+    prefetch: int = 4
+    prefetch_mb: int = 1024
+    # Files decompressing to split_mb or more are parsed on split_workers
+    # processes (0 to share the CPUs among the num_workers importers);
+    # split_mb 0 turns this off.
+    split_mb: int = 256
+    split_workers: int = 0
 
 
 @dataclasses.dataclass(frozen=True)
@@ -35,3 +51,11 @@ class EventOptions(OptionBase):
     upper_limit_ymdhms: str
     dry_run: bool
     no_store: bool
+    batch_size: int = 1000
+    num_workers: int = 2
+    # Seconds a partial batch may wait for more documents
+    batch_age: float = 5.0
+    # Reject lines whose required numeric columns are blank or garbled
+    validate: bool = True
+    # Record files in the import ledger and skip those already complete
+    ledger: bool = True
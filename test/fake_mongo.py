@@ -0,0 +1,109 @@
+"""
+An in-memory stand-in for the gdelt database in tests: just the
+collection methods the importers, the ledger and the verifier call.
+"""
+import copy
+import types
+
+
+def matches(doc, query):
+    for name, condition in query.items():
+        value = doc.get(name)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, operand in condition.items():
+            if op == '$in':
+                ok = value in operand
+            elif op == '$gte':
+                ok = value is not None and operand <= value
+            elif op == '$lt':
+                ok = value is not None and value < operand
+            else:
+                raise NotImplementedError(op)
+            if not ok:
+                return False
+    return True
+
+
+class FakeCollection:
+    """
+    Keeps every document in docs and, for the inserts, each batch in
+    batches. find() queries and create_index() keys are recorded, the
+    latter with the number of batches written before it.
+    """
+
+    def __init__(self):
+        self.docs = []
+        self.batches = []
+        self.queries = []
+        self.indexes = []
+
+    def with_options(self, *args, **kw):
+        return self
+
+    def insert_many(self, docs, ordered=True):
+        batch = list(docs)
+        self.batches.append(batch)
+        self.docs.extend(batch)
+        return types.SimpleNamespace(inserted_count=len(batch))
+
+    def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        return self.insert_many([r._doc for r in requests])
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return [doc for doc in self.docs if matches(doc, query)]
+
+    def find_one(self, query):
+        return next((doc for doc in self.docs if matches(doc, query)), None)
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.find_one(query)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {name: value for name, value in query.items()
+                   if not isinstance(value, dict)}
+            self.docs.append(doc)
+        doc.update(update.get('$set', {}))
+        for name, step in update.get('$inc', {}).items():
+            doc[name] = doc.get(name, 0) + step
+
+    def find_one_and_update(self, query, update, upsert=False,
+                            return_document=None):
+        # Always the document before the update, as the ledger asks for
+        before = copy.deepcopy(self.find_one(query))
+        self.update_one(query, update, upsert)
+        return before
+
+    def index_information(self):
+        return {f'{key}_1': {'key': [(key, 1)]} for key, _ in self.indexes}
+
+    def create_index(self, key):
+        self.indexes.append((key, len(self.batches)))
+        return f'{key}_1'
+
+
+class FakeClient:
+    """
+    Both the client and its gdelt database: client.gdelt[name] and
+    client.name are the same collection, made on first use.
+    """
+
+    def __init__(self):
+        self.collections = {}
+
+    @property
+    def gdelt(self):
+        return self
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
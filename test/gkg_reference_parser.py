@@ -0,0 +1,242 @@
+"""
+The column-by-column GKG parser that gkg_import.makeGKGfromColumns() grew
+out of. It resolves every converter afresh for every column of every
+record; the tests parse the same columns with both and expect the same GKG,
+the same warnings and the same stderr.
+"""
+from __future__ import annotations
+
+import datetime
+import typing
+
+from gkg import (GKG, V15Tone, V1Count, V21Amount, V21Count,
+                 V2EnhancedTheme, V1Location, V21EnhancedDate,
+                 V2EnhancedLocation, V2EnhancedPerson, V2EnhancedOrganization,
+                 V2GCAM)
+from gkg_import import (as_is, convert_amount_in_v21amount_to_numeric_if_possible,
+                        convert_to_source_collection_identifier,
+                        float_or_none, int_float_or_bytes, int_float_or_none,
+                        int_or_float, int_or_str, url_split, write_to_stderr)
+
+
+def double_split(
+    first_level_delim:bytes,
+    second_level_delim:bytes,
+    column_value: bytes,
+    converters: tuple[typing.Callable[[bytes], typing.Any],...] = (),
+    csvgz_path: str | None = None,
+    line_number: int | None = None,
+    warn_out: typing.Callable[[str], None] | None = None,
+) -> list[typing.Any]:
+    
+    if column_value.strip() == b'':
+        return []
+    chunks_list = [
+        block.split(second_level_delim) for block
+        in column_value.strip(first_level_delim).split(first_level_delim)]
+    try:
+        f: typing.Callable[[bytes], typing.Any] = bytes
+        len_diff = len(chunks_list[0]) - len(converters)
+        if 0 < len_diff:
+            conververs = converters + (bytes,) * len_diff
+        elif len_diff < 0:
+            raise ValueError(f"There are more converters than data chunks.")
+        L = []
+        for chunks in chunks_list:
+            if len(chunks) != len(converters):
+                if chunks[:4] != [b'0', b'Georgia, , Georgia', b'GG', b'GG']:
+                    out = warn_out or write_to_stderr
+                    out("The number of converters and elements does not match "
+                        f"at {line_number}:{csvgz_path}. Ignoring the offending entry.")
+                    out(f"{converters=}")
+                    out(f"{chunks=}")
+                continue
+            try:
+                L.append([f(x) for f, x in zip(converters, chunks, strict=True)])
+            except ValueError:
+                print(f"{converters=}")
+                print(f"{chunks=}")
+                raise
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        print (f"{converters=}")
+        print (f"{chunks_list=}")
+        raise
+    return L
+
+
+def single_split(
+    delim:bytes,
+    column_value:bytes,
+    converters: tuple[typing.Callable[[bytes], typing.Any],...] = (),
+    ) -> list[typing.Any]:
+    chunks = column_value.rstrip(delim).split(delim)
+    len_diff = len(chunks) - len(converters)
+    if 0 < len_diff:
+        converters = converters + (as_is,) * len_diff
+    try:
+        return [f(x) for f, x in zip(converters, chunks, strict=True)]
+    except ValueError:
+        print(f"{converters=}")
+        print(f"{chunks=}")
+        raise
+
+
+def is_valid_v1_location_args(args, warn_out):
+    if len(args) != 7:
+        msg = f"Bad V1Location args: ({args})"
+        print (msg)
+        warn_out(msg)
+        return False
+    return True
+
+
+def makeGKGfromColumns(vec: list[bytes],
+                       gkg_csv: str,
+                       line_count: int,
+                       warn_out: typing.Any,
+                       ) -> GKG:
+    gkg = GKG(
+        # gkg-record-id
+        vec[0],
+
+        # v1_date
+        datetime.datetime.strptime(str(vec[1], 'utf-8'), '%Y%m%d%H%M%S'),
+
+        # v2_source_collection_identifier
+        convert_to_source_collection_identifier(vec[2]),
+
+        # v2_source_common_name
+        vec[3],
+
+        # v2_document_identifier
+        vec[4],
+
+        # v1_counts
+        [V1Count(*args) for args
+         in double_split(b";", b"#", vec[5],
+                         (bytes,   # Count Type
+                          # 'Count' can't be 'int' due to '081'
+                          # in '20230701000000-562'
+                          bytes,   # Count
+                          bytes,   # Object Type
+                          bytes,   # Location Type
+                          bytes,   # Location FullName
+                          bytes,   # Location CountryCode
+                          bytes,   # Location ADM1Code
+                          int_float_or_none, # Location Latitude
+                          int_float_or_none, # Location Longitude
+                          bytes,   # Location FeatureID
+                          ))],
+
+        # v21_counts
+        [V21Count(*args) for args
+         in double_split(b";", b"#", vec[6],
+                         (bytes,   # Count Type
+                          # 'Count' can't be 'int' due to '081'
+                          # in '20230701000000-562'
+                          bytes,   # Count
+                          bytes,   # Object Type
+                          int,   # Location Type
+                          bytes,   # Location FullName
+                          bytes,   # Location CountryCode
+                          bytes,   # Location ADM1Code
+                          int_float_or_none, # Location Latitude
+                          int_float_or_none, # Location Longitude
+                          int_or_str,   # Location FeatureID
+                          int,   # Location Offset in document
+                          ))],
+
+        # v1_themes
+        double_split(b';', b',', vec[7], (bytes,)),
+
+        # v2_enhanced_themes
+        [V2EnhancedTheme(*args) for args
+         in double_split(b';', b',', vec[8], (bytes, int))],
+
+        # v1_locations
+        [V1Location(*args) for args
+         in double_split(b';', b'#', vec[9],
+                         (int, bytes, bytes, bytes,
+                          int_float_or_none, int_float_or_none,
+                          int_float_or_bytes),
+                         csvgz_path=gkg_csv,
+                         line_number=line_count,
+                         warn_out=warn_out)
+         if is_valid_v1_location_args(args, warn_out)],
+
+        # v2_enhanced_locations
+        [V2EnhancedLocation(*args) for args
+        in double_split(b';', b'#', vec[10],
+                        (int, bytes, bytes, bytes, bytes,
+                         float_or_none, float_or_none, int_float_or_bytes, int),
+                        csvgz_path=gkg_csv,
+                        line_number=line_count,
+                        warn_out=warn_out)],
+
+        # v1_persons
+        single_split(b';', vec[11], (as_is,)),
+
+        # v2_enhanced_persons
+        [V2EnhancedPerson(*args) for args
+        in double_split(b';', b',', vec[12], (bytes, int))],
+
+        # v1_organizations
+        single_split(b';', vec[13], (as_is,)),
+
+        # v2_enhanced_organizations
+        [V2EnhancedOrganization(*args) for args
+        in double_split(b';', b',', vec[14], (bytes, int))],
+
+        # v1.5_tone
+        V15Tone(*single_split(b',', vec[15],
+                              (int_or_float, int_or_float, int_or_float,
+                               int_or_float, int_or_float, int_or_float,
+                               int))),
+
+        # v2.1_enhanced_dates
+        [V21EnhancedDate(*args) for args
+         in double_split(b';', b'#', vec[16],
+                         (int, bytes, bytes, bytes, int))],
+
+        # v2_gcam
+        [V2GCAM(*args) for args
+         in double_split(b',', b':', vec[17],
+                         (bytes, int_or_float))],
+
+        # v2_sharing_image
+        vec[18],
+
+        # v21_related_images
+        url_split(vec[19]),
+
+        # v21_social_image_embeds
+        url_split(vec[20]),
+
+        # v21_social_video_embeds
+        url_split(vec[21]),
+
+        # v21_quotations
+        double_split(b'#', b'|', vec[22], (int, int, bytes, bytes)),
+
+        # v21_all_names
+        double_split(b';', b',', vec[23], (bytes, int)),
+
+        # v21_amounts
+        # The first converter is 'bytes' to preserve '00000' in '00000488'
+        [V21Amount(*args) for args
+         in convert_amount_in_v21amount_to_numeric_if_possible(
+              double_split(b';', b',', vec[24], (as_is, as_is, int)),
+              gkg_csv,
+              line_count,
+              warn_out
+              )],
+
+        # v21_translation_info
+        double_split(b';', b',', vec[25], (int_or_float, as_is)),
+
+        # v2_extras_xml
+        vec[26],
+    )
+    return gkg
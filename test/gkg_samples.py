@@ -0,0 +1,60 @@
+"""
+Hand-written GKG 2.1 rows shaped like the ones in the 15-minute GKG files,
+used by the tests that need GKG input without downloading any.
+"""
+
+COLUMNS = [
+    b'20150218230000-0',                                            # 0
+    b'20150218230000',
+    b'1',
+    b'example.com',
+    b'http://example.com/2015/02/18/story.html',
+    b'KILL#3#soldiers#1#Syria#SY#SY#35#38#SY;'                       # 5
+    b'WOUND#081#people#4#Damascus, Dimashq, Syria#SY#SY08#33.5#36.3#-2140196;',
+    b'KILL#3#soldiers#1#Syria#SY#SY#35#38#SY#120;'
+    b'WOUND#081#people#4#Damascus, Dimashq, Syria#SY#SY08#33.5#36.3#-2140196#410;',
+    b'TAX_FNCACT;TAX_FNCACT_SOLDIERS;',
+    b'TAX_FNCACT,100;TAX_FNCACT_SOLDIERS,105;',
+    b'1#Syria#SY#SY#35#38#SY;'
+    b'4#Damascus, Dimashq, Syria#SY#SY08#33.5#36.3#-2140196',
+    b'1#Syria#SY#SY##35#38#SY#130;'                                 # 10
+    b'4#Damascus, Dimashq, Syria#SY#SY08#30000#33.5#36.3#-2140196#200',
+    b'barack obama;john kerry',
+    b'Barack Obama,50;John Kerry,80',
+    b'united nations',
+    b'United Nations,300',
+    b'-3.50877192982456,1.2,4.70877192982456,5.9,20.1,0.5,300',      # 15
+    b'1#0#0#2015#500',
+    b'wc:300,c1.2:3,c12.1:10,v10.1:0.5,v19.1:-2.25',
+    b'http://example.com/img.jpg',
+    b'http://example.com/1.jpg;https://example.com/2.jpg',
+    b'',                                                            # 20
+    b'https://youtube.com/watch?v=x;',
+    b'495|67|said|quote text#700|30||another',
+    b'Barack Obama,50;United Nations,300',
+    b'3,soldiers,120;00000488,dollars,220;',
+    b'',                                                            # 25
+    b'<PAGE_TITLE>Title</PAGE_TITLE>',
+    ]
+
+
+def make_columns(n: int) -> list[bytes]:
+    """Returns COLUMNS for the n-th record of the file, with some of the
+    variations real files have: empty columns, extra blocks and an
+    embedded newline in the extras."""
+    columns = list(COLUMNS)
+    columns[0] = b'20150218230000-%d' % n
+    if n % 3 == 1:
+        for i in (5, 6, 9, 10, 16, 22, 24):
+            columns[i] = b''
+        columns[15] = b'0,0,0,0,0,0,12'
+    if n % 4 == 2:
+        columns[17] = b','.join(b'c%d.%d:%d' % (n, i, i) for i in range(50))
+    if n % 5 == 3:
+        columns[26] = b'<PAGE_TITLE>Multi\nline</PAGE_TITLE>'
+    return columns
+
+
+def make_blob(count: int) -> bytes:
+    return b'\n'.join(b'\t'.join(make_columns(n))
+                      for n in range(count)) + b'\n'
@@ -0,0 +1,110 @@
+"""
+A local HTTP server standing in for data.gdeltproject.org in tests.
+"""
+import functools
+import http.server
+import os
+import threading
+import time
+
+
+class StandInHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves a directory, honouring Range requests. Faults are injected
+    through the class attributes: delay slows every request down, the
+    first len(statuses) requests get those statuses instead of the file,
+    and the next drops requests are cut off after drop_after bytes.
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive
+    lock = threading.Lock()
+    delay = 0.0
+    ranges = True
+    statuses: list = []
+    drops = 0
+    drop_after = 0
+    range_headers: list = []
+    active = 0
+    peak = 0
+    requests = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            if cls.delay:
+                time.sleep(cls.delay)
+            self.send_file()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def send_file(self):
+        cls = type(self)
+        with cls.lock:
+            status = cls.statuses.pop(0) if cls.statuses else None
+            range_header = self.headers.get("Range")
+            cls.range_headers.append(range_header)
+        if status is not None:
+            self.send_error(status)
+            return
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+
+        start = 0
+        if range_header and cls.ranges:
+            start = int(range_header[len("bytes="):].rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        with cls.lock:
+            drop = cls.drops > 0
+            if drop:
+                cls.drops -= 1
+        if drop:
+            self.wfile.write(body[start:start + cls.drop_after])
+            self.close_connection = True
+        else:
+            self.wfile.write(body[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer:
+
+    def __init__(self, directory, delay=0.0):
+        # A handler class per server so that the counters aren't shared
+        self.handler = type("Handler", (StandInHandler,),
+                            {"delay": delay, "statuses": [], "range_headers": []})
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), functools.partial(self.handler, directory=directory))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
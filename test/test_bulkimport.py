@@ -0,0 +1,95 @@
+import unittest
+import os
+import tempfile
+import zipfile
+
+from gdelttools.bulkimport import LoadStats, RowError, compile_row_parser, read_field_file, \
+    read_lines
+
+EVENT = (b"977166878\t20200330\t202003\t2020\t2020.2466\t\t\t\t\t\t\t\t\t\t\t"
+         b"AFG\tAFGHANISTAN\tAFG\t\t\t\t\t\t\t\t0\t042\t042\t04\t1\t1.9\t2\t1\t2\t"
+         b"-6.44910644910645\t0\t\t\t\t\t\t\t\t4\tKabul, Kabol, Afghanistan\tAF\t"
+         b"AF13\t3580\t34.5167\t69.1833\t-3378435\t4\tSussex, East Sussex, United Kingdom\t"
+         b"UK\tUKE2\t40137\t50.9167\t-0.083333\t-2609142\t20210330024500\t"
+         b"https://dissidentvoice.org/2021/03/will-drones-really-protect-us/\n")
+
+
+class TestFieldFile(unittest.TestCase):
+
+    def test_mongoimport_format(self):
+        fields = read_field_file()
+        self.assertEqual(61, len(fields))
+        self.assertEqual(("GlobalEventId", int), fields[0])
+        self.assertEqual(("FractionDate", float), fields[4])
+        self.assertEqual(("Actor1Code", None), fields[5])
+
+    def test_ini_format(self):
+        top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        fields = read_field_file(os.path.join(top, "GDELT.ff"))
+        self.assertEqual(61, len(fields))
+        self.assertEqual(("_id", int), fields[0])
+        self.assertEqual(("GoldsteinScale", float), fields[30])
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = read_field_file()
+
+    def test_row(self):
+        doc = compile_row_parser(self.fields)(EVENT.rstrip(b"\n").split(b"\t"))
+        self.assertEqual(977166878, doc["GlobalEventId"])
+        self.assertEqual(1.9, doc["GoldsteinScale"])
+        self.assertEqual("042", doc["EventCode"])
+        self.assertEqual("", doc["Actor1Code"])
+        self.assertEqual("34.5167", doc["Actor2Geo_Lat"])
+        self.assertEqual("50.9167", doc["ActionGeo_Lat"])
+        self.assertEqual(self.fields[-1][0], list(doc)[-1])
+
+    def test_skip_bad_typed_values(self):
+        vec = EVENT.rstrip(b"\n").split(b"\t")
+        vec[30] = b""
+        vec[31] = b"many"
+        doc = compile_row_parser(self.fields)(vec)
+        self.assertNotIn("GoldsteinScale", doc)
+        self.assertNotIn("NumMentions", doc)
+        self.assertEqual(1, doc["NumSources"])
+
+    def test_required(self):
+        parse = compile_row_parser(self.fields, {"GoldsteinScale", "NumMentions"})
+        vec = EVENT.rstrip(b"\n").split(b"\t")
+        self.assertEqual(compile_row_parser(self.fields)(vec), parse(vec))
+        with self.assertRaisesRegex(RowError, "empty GoldsteinScale"):
+            parse(vec[:30] + [b""] + vec[31:])
+        with self.assertRaisesRegex(RowError, "bad NumMentions 'x'"):
+            parse(vec[:31] + [b"x"] + vec[32:])
+        # Not required, so skipped as before
+        self.assertNotIn("NumSources", parse(vec[:32] + [b""] + vec[33:]))
+
+    def test_stats_add(self):
+        total = LoadStats("all")
+        total.add(LoadStats("a", 3, 2, 1, 100, 1.0))
+        total.add(LoadStats("b", 5, 5, 0, 200, 2.0))
+        self.assertEqual(LoadStats("all", 8, 7, 1, 300, 3.0), total)
+
+
+class TestReadLines(unittest.TestCase):
+
+    def setUp(self):
+        self._work = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self._work.name, "20150218230000.export.CSV")
+        with open(self.csv, "wb") as f:
+            f.write(EVENT * 3)
+        with zipfile.ZipFile(self.csv + ".zip", "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.write(self.csv, os.path.basename(self.csv))
+
+    def tearDown(self):
+        self._work.cleanup()
+
+    def test_csv_and_zip(self):
+        self.assertEqual([EVENT] * 3, list(read_lines(self.csv)))
+        self.assertEqual([EVENT] * 3, list(read_lines(self.csv + ".zip")))
+
+
+if __name__ == '__main__':
+    unittest.main()
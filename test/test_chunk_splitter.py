@@ -0,0 +1,61 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+import chunk_splitter
+import gkg_samples
+
+
+class TestChunkSplitter(unittest.TestCase):
+
+    def test_stream_matches_split_to_chunks(self):
+        blob = gkg_samples.make_blob(40)
+        expected = list(chunk_splitter.split_to_chunks(blob))
+        self.assertEqual(len(expected), 40)
+        for read_size in (1, 7, 64, 1000, len(blob), len(blob) * 2):
+            chunks = list(chunk_splitter.split_stream_to_chunks(
+                io.BytesIO(blob), read_size))
+            self.assertEqual(expected, chunks, f"{read_size=}")
+
+    def test_stream_to_lines(self):
+        blob = b'a\tb\n\nc\td\ne'
+        for read_size in (1, 3, 100):
+            lines = list(chunk_splitter.split_stream_to_lines(
+                io.BytesIO(blob), read_size))
+            self.assertEqual([b'a\tb', b'', b'c\td', b'e'], lines)
+            lines = list(chunk_splitter.split_stream_to_lines(
+                io.BytesIO(blob + b'\n'), read_size))
+            self.assertEqual([b'a\tb', b'', b'c\td', b'e'], lines)
+
+    def test_open_zip_member(self):
+        blob = gkg_samples.make_blob(10)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            zip_path = os.path.join(tmpdir, '20150218230000.gkg.csv.zip')
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('20150218230000.gkg.csv', blob)
+            with chunk_splitter.open_zip_member(zip_path) as member:
+                chunks = list(chunk_splitter.split_stream_to_chunks(member,
+                                                                    100))
+        self.assertEqual(list(chunk_splitter.split_to_chunks(blob)), chunks)
+
+    def test_record_ranges(self):
+        blob = gkg_samples.make_blob(40)
+        expected = list(chunk_splitter.split_to_chunks(blob))
+        for parts in (1, 2, 3, 7, 40, 100):
+            ranges = chunk_splitter.find_record_ranges(io.BytesIO(blob),
+                                                       parts, 64)
+            self.assertLessEqual(len(ranges), parts)
+            self.assertEqual((0, len(blob)), (ranges[0][0], ranges[-1][1]))
+            chunks = []
+            for start, end, newlines in ranges:
+                self.assertEqual(blob[:start].count(b'\n'), newlines)
+                chunks += chunk_splitter.split_to_chunks(blob[start:end])
+            self.assertEqual(expected, chunks, f"{parts=}")
+        self.assertEqual(40, len(chunk_splitter.find_record_ranges(
+            io.BytesIO(blob), 100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import contextlib
+import io
+import os
+import queue
+import tempfile
+import threading
+import time
+import zipfile
+
+import events_import
+import mymongo
+import options
+
+from fake_mongo import FakeClient
+from test_bulkimport import EVENT
+
+
+class EventsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._work = tempfile.TemporaryDirectory()
+        self.client = FakeClient()
+        self._get_client = mymongo.get_client
+        mymongo.get_client = lambda *args, **kw: self.client
+        self.opts = self.make_opts()
+
+    def tearDown(self):
+        mymongo.get_client = self._get_client
+        self._work.cleanup()
+
+    def make_opts(self, **kw):
+        kw.setdefault("quiet", True)
+        kw.setdefault("batch_size", 100)
+        return options.EventOptions(verbose=False, masterfile="masterfile.txt",
+                                    lower_limit_ymdhms="19800101000000",
+                                    upper_limit_ymdhms="20500101000000",
+                                    dry_run=False, no_store=False, **kw)
+
+    def make_zip(self, timestamp, lines):
+        name = f"{timestamp}.export.CSV"
+        path = os.path.join(self._work.name, name + ".zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(name, b"".join(lines))
+        return path
+
+    def inserted(self):
+        return [doc for batch in self.client.eventscsv.batches for doc in batch]
+
+
+class TestImporter(EventsTestCase):
+
+    def run_importer(self, paths):
+        q = queue.Queue()
+        for path in paths:
+            q.put(path)
+        q.put(None)
+        events_import.importer(q, self.opts)
+
+    def test_batches_span_files(self):
+        self.run_importer([self.make_zip("20150218230000", [EVENT] * 250),
+                           self.make_zip("20150218231500", [EVENT] * 10)])
+        self.assertEqual(260, len(self.inserted()))
+        self.assertEqual([100, 100, 60],
+                         [len(b) for b in self.client.eventscsv.batches])
+
+    def test_import_files(self):
+        paths = [self.make_zip("20150218230000", [EVENT] * 150),
+                 self.make_zip("20150218231500", [EVENT] * 10)]
+        # Threads for worker processes, so that they store to self.client
+        process = events_import.Process
+        events_import.Process = threading.Thread
+        try:
+            events_import.import_files(paths, self.opts)
+        finally:
+            events_import.Process = process
+        self.assertEqual(160, len(self.inserted()))
+        self.assertEqual(["complete", "complete"],
+                         [doc["status"] for doc in self.client.import_ledger.docs])
+
+    def test_report_per_file(self):
+        self.opts = self.make_opts(quiet=False)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.run_importer([self.make_zip("20150218230000", [EVENT] * 250),
+                               self.make_zip("20150218231500", [EVENT] * 10 + [b"bad\n"]),
+                               self.make_zip("20150218233000", [EVENT] * 20)])
+        report = out.getvalue().splitlines()
+        self.assertEqual(3, len(report))
+        self.assertIn("20150218230000.export.CSV.zip: 250 inserted, 0 rejected of 250 lines", report[0])
+        self.assertIn("20150218231500.export.CSV.zip: 10 inserted, 1 rejected of 11 lines", report[1])
+        self.assertIn("20150218233000.export.CSV.zip: 20 inserted", report[2])
+
+    def test_batch_age(self):
+        self.opts = self.make_opts(batch_age=0.05)
+        q = queue.Queue()
+        consumer = threading.Thread(target=events_import.importer, args=(q, self.opts))
+        consumer.start()
+        try:
+            q.put(self.make_zip("20150218230000", [EVENT] * 10))
+            deadline = time.monotonic() + 5
+            while not self.client.eventscsv.batches and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # Flushed for its age, with the importer still waiting for work
+            self.assertEqual([10], [len(b) for b in self.client.eventscsv.batches])
+            self.assertTrue(consumer.is_alive())
+        finally:
+            q.put(None)
+            consumer.join()
+
+    def test_blocks_when_idle(self):
+        pipeline = events_import.EventPipeline(self.client.eventscsv, self.opts)
+        self.assertIsNone(pipeline.time_left())
+        pipeline.add_file(self.make_zip("20150218230000", [EVENT] * 10))
+        self.assertLessEqual(pipeline.time_left(), self.opts.batch_age)
+        pipeline.flush()
+        self.assertIsNone(pipeline.time_left())
+
+class TestValidation(EventsTestCase):
+
+    def bad_lines(self):
+        vec = EVENT.rstrip(b"\n").split(b"\t")
+        no_goldstein = vec[:30] + [b""] + vec[31:]
+        bad_mentions = vec[:31] + [b"lots"] + vec[32:]
+        no_location = vec[:56] + [b"", b""] + vec[58:]
+        return [b"\t".join(v) + b"\n" for v in (no_goldstein, bad_mentions, no_location)]
+
+    def run_pipeline(self, lines):
+        warnings = []
+        pipeline = events_import.EventPipeline(self.client.eventscsv, self.opts,
+                                               warnings.append)
+        pipeline.add_file(self.make_zip("20150218230000", lines))
+        pipeline.flush()
+        return warnings
+
+    def test_required_fields(self):
+        self.assertIn("GoldsteinScale", events_import.REQUIRED_EVENT_FIELDS)
+        self.assertIn("GlobalEventId", events_import.REQUIRED_EVENT_FIELDS)
+        self.assertIn("Actor2Geo_Type", events_import.REQUIRED_EVENT_FIELDS)
+        self.assertNotIn("ActionGeo_Lat", events_import.REQUIRED_EVENT_FIELDS)
+        self.assertNotIn("SOURCEURL", events_import.REQUIRED_EVENT_FIELDS)
+
+    def test_rejects_with_line_numbers(self):
+        no_goldstein, bad_mentions, no_location = self.bad_lines()
+        warnings = self.run_pipeline([EVENT, no_goldstein, EVENT, bad_mentions,
+                                      b"short\n", no_location])
+        path = os.path.join(self._work.name, "20150218230000.export.CSV.zip")
+        self.assertEqual([f"{path}:2: rejected, empty GoldsteinScale",
+                          f"{path}:4: rejected, bad NumMentions 'lots'",
+                          f"{path}:5: rejected, 1 columns, expected 61"],
+                         warnings)
+        docs = self.inserted()
+        self.assertEqual(3, len(docs))
+        self.assertEqual("", docs[2]["ActionGeo_Lat"])
+
+    def test_no_validate(self):
+        self.opts = self.make_opts(validate=False)
+        warnings = self.run_pipeline([EVENT] + self.bad_lines())
+        self.assertEqual([], warnings)
+        docs = self.inserted()
+        self.assertEqual(4, len(docs))
+        self.assertNotIn("GoldsteinScale", docs[1])
+        self.assertNotIn("NumMentions", docs[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
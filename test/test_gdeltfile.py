@@ -1,8 +1,14 @@
 import unittest
+import hashlib
 import os
+import tempfile
+import tracemalloc
 import zipfile
 
-from gdelttools.gdeltfile import GDELTFile, GDELTFilter, download_gdelt_files
+from gdelttools.gdeltfile import GDELTFile, GDELTFilter, GDELTChecksumError, \
+    download_gdelt_files, fetch_gdelt_files, select_gdelt_files
+
+from http_stand_in import StandInServer
 
 
 class TestGDeltFile(unittest.TestCase):
@@ -85,5 +91,138 @@ class TestGDeltFile(unittest.TestCase):
         os.unlink("threefiles.txt")
 
 
+class TestConcurrentDownload(unittest.TestCase):
+    names = ["20150218230000.export.CSV", "20150218230000.mentions.CSV",
+             "20150218230000.gkg.csv", "20150218231500.export.CSV",
+             "20150218231500.mentions.CSV", "20150218231500.gkg.csv"]
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._served = tempfile.TemporaryDirectory()
+        self._work = tempfile.TemporaryDirectory()
+        lines = []
+        for i, name in enumerate(self.names):
+            zip_path = os.path.join(self._served.name, f"{name}.zip")
+            with zipfile.ZipFile(zip_path, "w") as archive:
+                archive.writestr(name, f"{i}\trow\n" * 1000)
+            with open(zip_path, "rb") as f:
+                md5 = hashlib.md5(f.read()).hexdigest()
+            lines.append((os.path.getsize(zip_path), md5, f"{name}.zip"))
+        self._server = StandInServer(self._served.name, delay=0.05)
+        os.chdir(self._work.name)
+        self.masterfile = "masterfile.txt"
+        with open(self.masterfile, "w") as f:
+            for size, md5, zip_name in lines:
+                f.write(f"{size} {md5} {self._server.url(zip_name)}\n")
+        self.urls = [self._server.url(zip_name) for _, _, zip_name in lines]
+        self.max_size = max(size for size, _, _ in lines)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._server.close()
+        self._served.cleanup()
+        self._work.cleanup()
+
+    def test_masterfile_order(self):
+        csv_files = download_gdelt_files([self.masterfile], overwrite=True, workers=4)
+        self.assertEqual(self.names, csv_files)
+        self.assertGreater(self._server.handler.peak, 1)
+        for name in self.names:
+            self.assertTrue(os.path.isfile(name))
+
+    def test_unordered(self):
+        gdelt_files = select_gdelt_files([self.masterfile])
+        results = list(fetch_gdelt_files(gdelt_files, overwrite=True,
+                                         workers=4, ordered=False))
+        self.assertCountEqual(self.names, [r.filename for r in results])
+
+    def test_filter(self):
+        gdelt_files = select_gdelt_files([self.masterfile], filter=GDELTFilter.gkg)
+        self.assertEqual([u for u in self.urls if "gkg" in u],
+                         [f.url for f in gdelt_files])
+
+    def test_inflight_cap(self):
+        gdelt_files = select_gdelt_files([self.masterfile])
+        results = list(fetch_gdelt_files(gdelt_files, overwrite=True, workers=4,
+                                         max_inflight_bytes=self.max_size))
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(1, self._server.handler.peak)
+
+    def test_errors_per_file(self):
+        with open(self.masterfile) as f:
+            lines = f.readlines()
+        size, md5, url = lines[1].split()
+        lines[1] = f"{size} {'0' * 32} {url}\n"
+        size, md5, url = lines[3].split()
+        lines[3] = f"{size} {md5} {url}.missing\n"
+        with open(self.masterfile, "w") as f:
+            f.writelines(lines)
+
+        gdelt_files = select_gdelt_files([self.masterfile])
+        results = list(fetch_gdelt_files(gdelt_files, overwrite=True, workers=3))
+        self.assertEqual([f.url for f in gdelt_files],
+                         [r.gdelt_file.url for r in results])
+        self.assertIsInstance(results[1].error, GDELTChecksumError)
+        self.assertIsNotNone(results[3].error)
+        self.assertEqual([True, False, True, False, True, True],
+                         [r.ok for r in results])
+
+        failed = []
+        csv_files = download_gdelt_files([self.masterfile], overwrite=True, workers=3,
+                                         on_error=failed.append)
+        self.assertEqual([n for i, n in enumerate(self.names) if i not in (1, 3)],
+                         csv_files)
+        self.assertEqual([gdelt_files[1].url, gdelt_files[3].url],
+                         [r.gdelt_file.url for r in failed])
+
+    def test_no_extract(self):
+        zip_files = download_gdelt_files([self.masterfile], overwrite=True,
+                                         workers=2, extract=False)
+        self.assertEqual([f"{name}.zip" for name in self.names], zip_files)
+        self.assertEqual(sorted(zip_files + [self.masterfile]), sorted(os.listdir()))
+        # And again, finding the zips already there
+        self.assertEqual(zip_files, download_gdelt_files([self.masterfile], extract=False))
+
+
+class TestUnzip(unittest.TestCase):
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._work = tempfile.TemporaryDirectory()
+        os.chdir(self._work.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._work.cleanup()
+
+    def test_streamed(self):
+        member_size = 64 * 1024 * 1024
+        row = b"20150218230000\tsome\tgdelt\trow\n"
+        with zipfile.ZipFile("big.CSV.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+            with archive.open("big.CSV", "w") as member:
+                for _ in range(member_size // len(row)):
+                    member.write(row)
+        tracemalloc.start()
+        try:
+            self.assertEqual("big.CSV", GDELTFile.unzip("big.CSV.zip"))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 8 * 1024 * 1024)
+        self.assertEqual(member_size - member_size % len(row), os.path.getsize("big.CSV"))
+        self.assertEqual(["big.CSV", "big.CSV.zip"], sorted(os.listdir()))
+
+    def test_bad_member(self):
+        with zipfile.ZipFile("bad.CSV.zip", "w") as archive:
+            archive.writestr("bad.CSV", b"x" * 1000)
+        with open("bad.CSV.zip", "r+b") as f:
+            data = f.read()
+            f.seek(data.index(b"x" * 1000))
+            f.write(b"y")  # the CRC no longer matches
+        with self.assertRaises(zipfile.BadZipfile):
+            GDELTFile.unzip("bad.CSV.zip")
+        self.assertEqual(["bad.CSV.zip"], os.listdir())
+
+
 if __name__ == '__main__':
     unittest.main()
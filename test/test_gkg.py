@@ -0,0 +1,56 @@
+import unittest
+
+import bson
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+
+import gkg_import
+import gkg_samples
+from gkg import GKG, LazyGKG, index_bson_elements
+
+SON_OPTIONS = bson.CodecOptions(document_class=bson.SON)
+
+
+def stored_document(n, columns=None):
+    encode = gkg_import.compile_bson_encoder(columns)
+    doc = bson.decode(encode(gkg_samples.make_columns(n), 'x', n, print).raw,
+                      SON_OPTIONS)
+    doc['_id'] = ObjectId()     # as added by the server
+    return RawBSONDocument(bson.encode(doc))
+
+
+class TestLazyGKG(unittest.TestCase):
+
+    def test_index_bson_elements(self):
+        raw = bson.encode({'a': 1, 'b': b'xy', 'c': [1.5, None],
+                           'd': {'e': 'f'}, 'g': True})
+        spans = index_bson_elements(raw)
+        self.assertEqual(['a', 'b', 'c', 'd', 'g'], list(spans))
+        self.assertEqual(len(raw) - 1, spans['g'][1])
+
+    def test_same_as_deserialize(self):
+        for n in range(20):
+            raw = stored_document(n)
+            full = GKG.deserialize(bson.decode(raw.raw, SON_OPTIONS))
+            lazy = LazyGKG(raw)
+            self.assertEqual(repr(full), repr(lazy.to_gkg()))
+            self.assertEqual(full.to_csv(), LazyGKG(raw).to_csv())
+
+    def test_decodes_on_first_access(self):
+        lazy = LazyGKG(stored_document(2))
+        self.assertNotIn('v2_gcams', vars(lazy))
+        gcams = lazy.v2_gcams
+        self.assertEqual(50, len(gcams))
+        self.assertIs(gcams, lazy.v2_gcams)
+        self.assertNotIn('v1_counts', vars(lazy))
+        self.assertRaises(AttributeError, getattr, lazy, 'no_such_field')
+
+    def test_partial_document(self):
+        lazy = LazyGKG(stored_document(0, ('gkg_record_id', 'v15_tone')))
+        self.assertTrue(lazy.is_partial)
+        self.assertEqual(300, lazy.v15_tone.word_count)
+        self.assertIsNone(lazy.v2_gcams)
+
+
+if __name__ == '__main__':
+    unittest.main()
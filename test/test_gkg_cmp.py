@@ -0,0 +1,184 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+import gkg_cmp
+import gkg_import
+import gkg_samples
+import mymongo
+import options
+from fake_mongo import FakeClient, FakeCollection
+
+
+def sample(n):
+    """gkg_samples.make_columns(n) without the columns that do not come
+    back from GKG.to_csv() as they were read: the V2 persons, written back
+    with '#' before the offset, the trailing ';' of the embeds and amounts,
+    and whole-number coordinates, written back as floats."""
+    columns = gkg_samples.make_columns(n)
+    for i in (12, 21, 24):
+        columns[i] = b''
+    columns[10] = columns[10].replace(b'#35#38#', b'#35.0#38.0#')
+    return columns
+
+
+def store(collection, columns_list):
+    encode = gkg_import.compile_bson_encoder()
+    collection.insert_many(encode(list(columns), 'test.gkg.csv.zip', n,
+                                  lambda msg: None)
+                           for n, columns in enumerate(columns_list))
+
+
+def cleaned(columns):
+    columns = list(columns)
+    gkg_cmp.remove_bad_locations(columns)
+    gkg_cmp.remove_insane_ints(columns)
+    return columns
+
+
+class TestVerifyReport(unittest.TestCase):
+
+    def test_merge(self):
+        report = gkg_cmp.VerifyReport()
+        first = gkg_cmp.VerifyReport(files=1, records=3, matched=2,
+                                     mismatched=1, short_lines=1)
+        first.column_mismatches.update([17])
+        first.examples.append(('a.gkg.csv.zip', 2, b'a-1', [17]))
+        second = gkg_cmp.VerifyReport(files=1, records=4, matched=2,
+                                      mismatched=1, missing=1, partial=2)
+        second.column_mismatches.update([17, 26])
+        second.examples.append(('b.gkg.csv.zip', 5, b'b-3', [17, 26]))
+        report.merge(first)
+        report.merge(second)
+        self.assertEqual(2, report.files)
+        self.assertEqual(7, report.records)
+        self.assertEqual(4, report.matched)
+        self.assertEqual(2, report.mismatched)
+        self.assertEqual(1, report.missing)
+        self.assertEqual(2, report.partial)
+        self.assertEqual(1, report.short_lines)
+        self.assertEqual({17: 2, 26: 1}, dict(report.column_mismatches))
+        self.assertEqual(['a.gkg.csv.zip', 'b.gkg.csv.zip'],
+                         [example[0] for example in report.examples])
+        self.assertFalse(report.ok)
+        self.assertTrue(gkg_cmp.VerifyReport(files=1, matched=3).ok)
+
+
+class TestCompareBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.source = [cleaned(sample(n)) for n in range(6)]
+
+    def compare(self, batch):
+        report = gkg_cmp.VerifyReport(files=1)
+        gkg_cmp.compare_batch(self.collection, 'test.gkg.csv.zip',
+                              batch, report)
+        return report
+
+    def test_matching_records(self):
+        store(self.collection, self.source)
+        report = self.compare(list(enumerate(self.source, 1)))
+        self.assertEqual(6, report.records)
+        self.assertEqual(6, report.matched)
+        self.assertEqual(0, report.mismatched)
+        self.assertTrue(report.ok)
+        self.assertEqual([], report.examples)
+        self.assertEqual(1, len(self.collection.queries))
+
+    def test_column_mismatches(self):
+        stored = [list(columns) for columns in self.source]
+        for columns in stored[:2]:
+            columns[3] = b'elsewhere.com'
+        stored[1][23] = b'Someone Else,10'
+        store(self.collection, stored)
+        report = self.compare(list(enumerate(self.source, 1)))
+        self.assertEqual(4, report.matched)
+        self.assertEqual(2, report.mismatched)
+        self.assertEqual({3: 2, 23: 1}, dict(report.column_mismatches))
+        self.assertEqual([('test.gkg.csv.zip', 1, b'20150218230000-0', [3]),
+                          ('test.gkg.csv.zip', 2, b'20150218230000-1', [3, 23])],
+                         report.examples)
+        self.assertFalse(report.ok)
+
+    def test_missing_record(self):
+        store(self.collection, self.source[:2] + self.source[3:])
+        report = self.compare(list(enumerate(self.source, 1)))
+        self.assertEqual(6, report.records)
+        self.assertEqual(5, report.matched)
+        self.assertEqual(1, report.missing)
+        self.assertEqual([], report.examples)
+        self.assertFalse(report.ok)
+
+    def test_examples_are_capped(self):
+        stored = [list(columns) for columns in self.source]
+        for columns in stored:
+            columns[3] = b'elsewhere.com'
+        store(self.collection, stored)
+        report = self.compare(list(enumerate(self.source, 1)))
+        self.assertEqual(6, report.mismatched)
+        self.assertEqual(gkg_cmp.MAX_EXAMPLES_PER_FILE, len(report.examples))
+
+
+class TestVerifyFiles(unittest.TestCase):
+
+    def setUp(self):
+        self._work = tempfile.TemporaryDirectory()
+        self.client = FakeClient()
+        self._get_client = mymongo.get_client
+        mymongo.get_client = lambda *args, **kw: self.client
+        self.opts = options.GkgOptions(True, False, 2, 'masterfilelist.txt',
+                                       '19800101000000', '20500101000000',
+                                       False, False, batch_size=4)
+
+    def tearDown(self):
+        mymongo.get_client = self._get_client
+        self._work.cleanup()
+
+    def write_gkg(self, name, records):
+        path = os.path.join(self._work.name, name)
+        blob = b'\n'.join(b'\t'.join(columns) for columns in records) + b'\n'
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(name[:-len('.zip')], blob)
+        return path
+
+    def test_verify_file(self):
+        source = [sample(n) for n in range(10)]
+        store(self.client.gkg, source[:9])
+        short = [b'20150218230000-99', b'20150218230000', b'1', b'short']
+        path = self.write_gkg('20150218230000.gkg.csv.zip',
+                              source[:5] + [short] + source[5:])
+        report = gkg_cmp.verify_file(path, self.opts)
+        self.assertEqual(1, report.files)
+        self.assertEqual(10, report.records)
+        self.assertEqual(9, report.matched)
+        self.assertEqual(1, report.missing)
+        self.assertEqual(1, report.short_lines)
+        # 10 records, --batch-size at a time
+        self.assertEqual(3, len(self.client.gkg.queries))
+
+    def test_main_merges_files(self):
+        first = [sample(n) for n in range(5)]
+        second = [sample(n) for n in range(5, 12)]
+        stored = [list(columns) for columns in first + second]
+        stored[6][3] = b'elsewhere.com'
+        store(self.client.gkg, stored)
+        paths = [self.write_gkg('20150218230000.gkg.csv.zip', first),
+                 self.write_gkg('20150218231500.gkg.csv.zip', second),
+                 os.path.join(self._work.name, '20150218233000.gkg.csv.zip')]
+        with open(paths[-1], 'wb') as corrupt:
+            corrupt.write(b'not a zip file')
+        # The corrupt file is reported by its worker and counts for nothing
+        report = gkg_cmp.main(paths, self.opts)
+        self.assertEqual(2, report.files)
+        self.assertEqual(12, report.records)
+        self.assertEqual(11, report.matched)
+        self.assertEqual(1, report.mismatched)
+        self.assertEqual({3: 1}, dict(report.column_mismatches))
+        self.assertEqual([(paths[1], 2, b'20150218230000-6', [3])],
+                         report.examples)
+
+
+if __name__ == '__main__':
+    unittest.main()
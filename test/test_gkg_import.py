@@ -0,0 +1,214 @@
+import contextlib
+import dataclasses
+import io
+import itertools
+import os
+import tempfile
+import unittest
+import zipfile
+
+import bson
+
+import chunk_splitter
+import gkg_import
+import gkg_reference_parser
+import gkg_samples
+import options
+from fake_mongo import FakeClient
+from gkg import GKG
+
+
+def parse_both(columns):
+    results = []
+    for parser in (gkg_reference_parser.makeGKGfromColumns,
+                   gkg_import.makeGKGfromColumns):
+        warnings = []
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            gkg = parser(list(columns), 'test.gkg.csv.zip', 7,
+                         warnings.append)
+        results.append((gkg, warnings, stderr.getvalue()))
+    return results
+
+
+class TestParsePlan(unittest.TestCase):
+
+    def assertSameParse(self, columns):
+        (gkg0, warnings0, stderr0), (gkg1, warnings1, stderr1) = \
+            parse_both(columns)
+        # Compare encoded BSON too, since 1 == 1.0 for dataclass equality.
+        self.assertEqual(gkg0, gkg1)
+        self.assertEqual(repr(gkg0), repr(gkg1))
+        self.assertEqual(bson.encode(gkg0.to_bson()),
+                         bson.encode(gkg1.to_bson()))
+        self.assertEqual(warnings0, warnings1)
+        self.assertEqual(stderr0, stderr1)
+        return gkg1, warnings1, stderr1
+
+    def test_parity_on_samples(self):
+        for n in range(30):
+            self.assertSameParse(gkg_samples.make_columns(n))
+
+    def test_parity_on_malformed_entries(self):
+        columns = gkg_samples.make_columns(0)
+        columns[8] = b'TAX_FNCACT,100;BROKEN;TAX_X,7,8;'
+        columns[10] = columns[10] + b';1#Nowhere#XX'
+        columns[9] = columns[9] + b';0#Georgia, , Georgia#GG#GG'
+        columns[17] = b'wc:300,c1.2:3.5,c1.3,c9.9:-1'
+        gkg, warnings, stderr = self.assertSameParse(columns)
+        self.assertEqual(1, len(gkg.v2_enhanced_themes))
+        self.assertEqual(3, len(gkg.v2_gcams))
+        self.assertIn('at 7:test.gkg.csv.zip', warnings[0])
+        self.assertIn('at None:None', stderr)
+
+    def test_bad_values_raise(self):
+        columns = gkg_samples.make_columns(0)
+        columns[8] = b'TAX_FNCACT,abc;'
+        with contextlib.redirect_stdout(io.StringIO()):
+            for parser in (gkg_reference_parser.makeGKGfromColumns,
+                           gkg_import.makeGKGfromColumns):
+                self.assertRaises(ValueError, parser, columns, 'x', 1, print)
+
+    def test_parse_gkg_date(self):
+        import datetime
+        self.assertEqual(datetime.datetime(2015, 2, 18, 23, 0, 5),
+                         gkg_import.parse_gkg_date(b'20150218230005'))
+        self.assertRaises(ValueError, gkg_import.parse_gkg_date,
+                          b'20151318230000')
+
+
+class TestBsonEncoder(unittest.TestCase):
+
+    def test_same_bytes_as_to_bson(self):
+        encode = gkg_import.compile_bson_encoder()
+        for n in range(30):
+            columns = gkg_samples.make_columns(n)
+            gkg = gkg_import.makeGKGfromColumns(columns, 'x', n, print)
+            self.assertEqual(bson.encode(gkg.to_bson()),
+                             encode(columns, 'x', n, print).raw)
+
+    def test_same_bytes_as_partial_to_bson(self):
+        columns = ('gkg_record_id', 'v1_date', 'v2_enhanced_locations')
+        encode = gkg_import.compile_bson_encoder(columns)
+        source = gkg_samples.make_columns(0)
+        gkg = gkg_import.makeGKGfromColumns(source, 'x', 1, print)
+        self.assertEqual(bson.encode(gkg.to_bson(columns)),
+                         encode(source, 'x', 1, print).raw)
+
+
+class TestColumnProjection(unittest.TestCase):
+
+    def test_partial_document_round_trip(self):
+        opts = options.GkgOptions(True, False, 1, 'masterfilelist.txt',
+                                  '19800101000000', '20500101000000',
+                                  False, False, columns='v15_tone,v2_gcams')
+        columns = gkg_import.projected_columns(opts)
+        self.assertEqual(['gkg_record_id', 'v15_tone', 'v2_gcams'], columns)
+        encode = gkg_import.compile_bson_encoder(tuple(columns))
+        source = gkg_samples.make_columns(0)
+        source[10] = b'not#a#location'     # not stored, so never split
+        stored = bson.decode(encode(source, 'x', 1, print).raw,
+                             bson.CodecOptions(document_class=bson.SON))
+        self.assertEqual(columns + ['__version__', '__columns__'],
+                         list(stored.keys()))
+        restored = GKG.deserialize(stored)
+        full = gkg_import.makeGKGfromColumns(gkg_samples.make_columns(0),
+                                             'x', 1, print)
+        self.assertEqual(full.v15_tone, restored.v15_tone)
+        self.assertEqual(full.v2_gcams, restored.v2_gcams)
+        self.assertIsNone(restored.v1_date)
+        self.assertIsNone(restored.v2_enhanced_locations)
+
+    def test_unknown_column(self):
+        opts = options.GkgOptions(True, False, 1, 'masterfilelist.txt',
+                                  '19800101000000', '20500101000000',
+                                  False, False, columns='v15_tones')
+        self.assertRaises(ValueError, gkg_import.projected_columns, opts)
+
+
+class TestParallelImport(unittest.TestCase):
+
+    def setUp(self):
+        self._work = tempfile.TemporaryDirectory()
+        records = gkg_samples.make_blob(30).split(b'\n20')
+        # A short record, to be warned about with its line number
+        records.insert(17, b'150218230000-999\t20150218230000\t1\tshort')
+        self.blob = b'\n20'.join(records)
+        self.gkg_csv = os.path.join(self._work.name, '20150218230000.gkg.csv.zip')
+        with zipfile.ZipFile(self.gkg_csv, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('20150218230000.gkg.csv', self.blob)
+        self.opts = options.GkgOptions(True, False, 1, 'masterfilelist.txt',
+                                       '19800101000000', '20500101000000',
+                                       False, False, batch_size=7,
+                                       split_mb=0, split_workers=3)
+
+    def tearDown(self):
+        self._work.cleanup()
+
+    def import_with(self, import_function):
+        client = FakeClient()
+        warnings = []
+        count = import_function(client, warnings)
+        return count, client.gkg.docs, warnings
+
+    def serial(self, client, warnings):
+        with chunk_splitter.open_zip_member(self.gkg_csv) as member:
+            return gkg_import.import_records(
+                client, self.gkg_csv,
+                chunk_splitter.split_stream_to_chunks(member),
+                self.opts, warnings.append)
+
+    def parallel(self, client, warnings):
+        return gkg_import.import_large_gkg(client, self.gkg_csv, self.opts,
+                                           warnings.append)
+
+    def test_same_as_serial(self):
+        count, docs, warnings = self.import_with(self.serial)
+        self.assertEqual(30, count)
+        line = self.blob[:self.blob.index(b'-999\t')].count(b'\n') + 1
+        self.assertEqual(1, len(warnings))
+        self.assertTrue(warnings[0].startswith(f'Short line {line}@'), warnings[0])
+        self.assertEqual((count, docs, warnings), self.import_with(self.parallel))
+        # Nothing left beside the zip
+        self.assertEqual([os.path.basename(self.gkg_csv)], os.listdir(self._work.name))
+
+    def test_ranges_bounded_by_bytes(self):
+        expected = self.import_with(self.serial)
+        split_range_bytes = gkg_import.SPLIT_RANGE_BYTES
+        ranges = []
+        find_record_ranges = chunk_splitter.find_record_ranges
+        def record_ranges(fp, parts):
+            ranges.extend(find_record_ranges(fp, parts))
+            return ranges
+        gkg_import.SPLIT_RANGE_BYTES = 4096
+        chunk_splitter.find_record_ranges = record_ranges
+        try:
+            self.assertEqual(expected, self.import_with(self.parallel))
+        finally:
+            gkg_import.SPLIT_RANGE_BYTES = split_range_bytes
+            chunk_splitter.find_record_ranges = find_record_ranges
+        self.assertLess(len(self.blob) // 4096, len(ranges))
+        self.assertLess(3, len(ranges))
+
+    def test_split_processes(self):
+        self.assertEqual(3, gkg_import.split_processes(self.opts))
+        opts = dataclasses.replace(self.opts, num_workers=2, split_workers=0)
+        cpus = os.cpu_count() or 1
+        self.assertEqual(max(1, cpus // 2), gkg_import.split_processes(opts))
+        opts = dataclasses.replace(opts, num_workers=cpus + 1)
+        self.assertEqual(1, gkg_import.split_processes(opts))
+
+    def test_skips_stored_records(self):
+        client = FakeClient()
+        with chunk_splitter.open_zip_member(self.gkg_csv) as member:
+            gkg_import.import_records(
+                client, self.gkg_csv,
+                itertools.islice(chunk_splitter.split_stream_to_chunks(member), 10),
+                self.opts, print)
+        self.assertEqual(20, gkg_import.import_large_gkg(
+            client, self.gkg_csv, self.opts, lambda msg: None))
+        self.assertEqual(30, len(client.gkg.docs))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import os
+import queue
+import tempfile
+
+import events_import
+import import_ledger
+import import_util
+import options
+
+from fake_mongo import FakeCollection
+from test_bulkimport import EVENT
+from test_events_import import EventsTestCase
+
+
+class TestImportLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.ledger = import_ledger.ImportLedger(self.collection, 'gkg')
+        self.path = '/opt/gdelt/csv/2015/20150218230000.gkg.csv.zip'
+
+    def entry(self):
+        return self.collection.find_one({'_id': 'gkg/20150218230000.gkg.csv.zip'})
+
+    def test_life_of_a_file(self):
+        self.ledger.enqueue(self.path, 'ab' * 16)
+        self.assertEqual('queued', self.entry()['status'])
+        self.assertFalse(self.ledger.begin(self.path))
+        self.assertEqual(('started', 1), (self.entry()['status'], self.entry()['attempts']))
+        self.ledger.complete(self.path, 1500, 2)
+        entry = self.entry()
+        self.assertEqual(('complete', 1500, 2, 'ab' * 16),
+                         (entry['status'], entry['records'], entry['rejected'], entry['md5']))
+        self.assertEqual({'20150218230000.gkg.csv.zip': 'ab' * 16},
+                         self.ledger.completed('20150218000000', '20150219000000'))
+        self.assertEqual({}, self.ledger.completed('20150219000000', '20150220000000'))
+        self.assertEqual({}, import_ledger.ImportLedger(self.collection, 'other')
+                         .completed('20150218000000', '20150219000000'))
+
+    def test_retry_dedupes(self):
+        self.assertFalse(self.ledger.begin(self.path))
+        self.ledger.fail(self.path, 'corrupt zip file')
+        self.assertEqual('failed', self.entry()['status'])
+        self.assertTrue(self.ledger.begin(self.path))
+        self.assertEqual(2, self.entry()['attempts'])
+
+    def test_walk_skips_complete_files(self):
+        work = tempfile.TemporaryDirectory()
+        self.addCleanup(work.cleanup)
+        masterfile = os.path.join(work.name, 'masterfilelist.txt')
+        with open(masterfile, 'w') as f:
+            for ts in ('20150218230000', '20150218231500'):
+                f.write(f'100 {"ab" * 16} http://127.0.0.1:9/{ts}.gkg.csv.zip\n')
+        for ts in ('20150218230000', '20150218231500'):
+            path = f'{ts}.gkg.csv.zip'
+            self.ledger.enqueue(path, 'ab' * 16)
+            self.ledger.begin(path)
+            self.ledger.complete(path, 10)
+        opts = options.GkgOptions(True, False, 1, masterfile,
+                                  '20150218000000', '20150219000000',
+                                  False, False)
+        messages = []
+        # Nothing is fetched, let alone opened
+        self.assertEqual([], list(import_util.walk_on_csv_rows(
+            '.gkg.csv.zip', messages.append, opts, self.ledger)))
+        self.assertEqual([], messages)
+
+
+class TestEventsLedger(EventsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ledger = import_ledger.ImportLedger(self.client.import_ledger, 'eventscsv')
+
+    def run_pipeline(self, path):
+        pipeline = events_import.EventPipeline(self.client.eventscsv, self.opts,
+                                               ledger=self.ledger)
+        pipeline.add_file(path)
+        pipeline.flush()
+
+    def event(self, event_id):
+        return EVENT.replace(b'977166878', str(event_id).encode(), 1)
+
+    def test_complete_with_counts(self):
+        path = self.make_zip('20150218230000', [self.event(i) for i in range(150)])
+        self.run_pipeline(path)
+        entry = self.client.import_ledger.find_one(
+            {'_id': 'eventscsv/20150218230000.export.CSV.zip'})
+        self.assertEqual(('complete', 150, 0), (entry['status'], entry['records'], entry['rejected']))
+        # A first attempt goes straight in
+        self.assertEqual([], self.client.eventscsv.queries)
+
+    def test_retry_skips_stored_events(self):
+        path = self.make_zip('20150218230000', [self.event(i) for i in range(150)])
+        self.ledger.begin(path)
+        # The first attempt got as far as 120 events
+        self.client.eventscsv.insert_many(
+            [{'GlobalEventId': i} for i in range(120)])
+        self.run_pipeline(path)
+        docs = self.inserted()[120:]
+        self.assertEqual(list(range(120, 150)), [d['GlobalEventId'] for d in docs])
+        entry = self.client.import_ledger.find_one(
+            {'_id': 'eventscsv/20150218230000.export.CSV.zip'})
+        self.assertEqual((30, 120), (entry['records'], entry['rejected']))
+        # Indexed once, before the first dedupe query
+        self.assertEqual([('GlobalEventId', 1)], self.client.eventscsv.indexes)
+        self.assertEqual(2, len(self.client.eventscsv.queries))
+
+    def test_importer_records_files(self):
+        q = queue.Queue()
+        q.put(self.make_zip('20150218230000', [EVENT] * 10))
+        q.put(None)
+        events_import.importer(q, self.opts)
+        self.assertEqual('complete', self.client.import_ledger.find_one(
+            {'_id': 'eventscsv/20150218230000.export.CSV.zip'})['status'])
+
+
+if __name__ == '__main__':
+    unittest.main()
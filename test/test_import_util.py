@@ -0,0 +1,116 @@
+import unittest
+import hashlib
+import os
+import tempfile
+import time
+
+import pymongo
+
+import import_util
+from gdelttools.masterindex import MasterfileEntry
+
+from http_stand_in import StandInServer
+
+
+class RejectingCollection:
+    """Fails every bulk write with the given write error codes, after
+    inserting the other documents."""
+
+    def __init__(self, codes):
+        self.codes = codes
+
+    def bulk_write(self, requests, ordered=True):
+        raise pymongo.errors.BulkWriteError({
+            "writeErrors": [{"index": i, "code": code}
+                            for i, code in enumerate(self.codes)],
+            "writeConcernErrors": [],
+            "nInserted": len(requests) - len(self.codes)})
+
+
+class TestWriteUnordered(unittest.TestCase):
+
+    def requests(self, count):
+        return [pymongo.InsertOne({"n": n}) for n in range(count)]
+
+    def test_duplicates_tolerated(self):
+        collection = RejectingCollection([import_util.DUPLICATE_KEY_ERROR] * 2)
+        self.assertEqual(3, import_util.write_unordered(collection, self.requests(5)))
+        inserter = import_util.BulkInserter(collection, 5)
+        self.assertEqual(0, sum(inserter.add({"n": n}) for n in range(4)))
+        self.assertEqual(3, inserter.add({"n": 4}))
+
+    def test_other_errors_raised(self):
+        collection = RejectingCollection([import_util.DUPLICATE_KEY_ERROR, 121])
+        self.assertRaises(pymongo.errors.BulkWriteError,
+                          import_util.write_unordered, collection, self.requests(5))
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self._served = tempfile.TemporaryDirectory()
+        self._work = tempfile.TemporaryDirectory()
+        self._server = StandInServer(self._served.name, delay=0.1)
+        self.files = []
+        for i in range(6):
+            name = f"2015021823{i:02d}00.gkg.csv.zip"
+            body = f"{i}\n".encode() * 1000
+            with open(os.path.join(self._served.name, name), "wb") as f:
+                f.write(body)
+            entry = MasterfileEntry(int(name[:14]), 3, len(body),
+                                    hashlib.md5(body).hexdigest(), 0,
+                                    self._server.url(name))
+            self.files.append((entry, os.path.join(self._work.name, name)))
+
+    def tearDown(self):
+        self._server.close()
+        self._served.cleanup()
+        self._work.cleanup()
+
+    def prefetch(self, ahead, max_bytes=1 << 30, messages=None):
+        return import_util.prefetch_csv_files(
+            self.files, ([] if messages is None else messages).append, ahead, max_bytes,
+            quiet=True)
+
+    def test_in_order_and_ahead(self):
+        fetched = []
+        for entry, path in self.prefetch(ahead=4):
+            self.assertTrue(os.path.isfile(path))
+            fetched.append(path)
+        self.assertEqual([path for _, path in self.files], fetched)
+        self.assertGreater(self._server.handler.peak, 1)
+
+    def test_overlaps_with_the_consumer(self):
+        files = self.prefetch(ahead=3)
+        next(files)
+        # While the first file is being imported, the next ones download
+        time.sleep(0.5)
+        self.assertTrue(all(os.path.isfile(path) for _, path in self.files[1:4]))
+        self.assertFalse(os.path.isfile(self.files[4][1]))
+        self.assertEqual(5, len(list(files)))
+
+    def test_byte_cap(self):
+        size = self.files[0][0].size
+        self.assertEqual(6, len(list(self.prefetch(ahead=4, max_bytes=2 * size))))
+        self.assertLessEqual(self._server.handler.peak, 2)
+
+    def test_present_files_not_fetched(self):
+        entry, path = self.files[2]
+        with open(path, "wb") as f:
+            f.write(b"already here")
+        self.assertEqual(6, len(list(self.prefetch(ahead=2))))
+        self.assertEqual(5, self._server.handler.requests)
+
+    def test_failure_left_out(self):
+        entry, path = self.files[1]
+        self.files[1] = (entry._replace(url=entry.url + ".missing"), path)
+        messages = []
+        fetched = [path for _, path in self.prefetch(ahead=2, messages=messages)]
+        self.assertEqual(5, len(fetched))
+        self.assertNotIn(path, fetched)
+        self.assertEqual(1, len(messages))
+        self.assertIn("Failed to fetch", messages[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
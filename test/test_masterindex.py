@@ -0,0 +1,189 @@
+import unittest
+import datetime
+import os
+import tempfile
+
+from gdelttools.gdeltfile import GDELTFile
+from gdelttools.gdeltwebdata import GDELTWebData
+from gdelttools.masterindex import MasterfileIndex, open_index
+
+from http_stand_in import StandInServer
+
+URL = "http://data.gdeltproject.org/gdeltv2/"
+
+
+def masterfile_lines(start, count):
+    """Lines of count 15 minute sets, each an export, mentions and gkg file."""
+    lines = []
+    for i in range(start, start + count):
+        ts = (datetime.datetime(2015, 2, 18, 23) + datetime.timedelta(minutes=15 * i)).strftime("%Y%m%d%H%M%S")
+        for n, suffix in enumerate(("export.CSV.zip", "mentions.CSV.zip", "gkg.csv.zip")):
+            lines.append(f"{1000 + i * 3 + n} {i * 3 + n:032x} {URL}{ts}.{suffix}\n")
+    return lines
+
+
+class TestMasterfileIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._work = tempfile.TemporaryDirectory()
+        self.masterfile = os.path.join(self._work.name, "masterfilelist.txt")
+        self.write(masterfile_lines(0, 100))
+
+    def tearDown(self):
+        self._work.cleanup()
+
+    def write(self, lines, mode="w"):
+        with open(self.masterfile, mode) as f:
+            f.writelines(lines)
+
+    def test_select(self):
+        index = open_index(self.masterfile)
+        self.assertEqual(300, len(index))
+        entries = list(index.select("20150219000000", "20150219010000"))
+        self.assertEqual(12, len(entries))
+        self.assertEqual(20150219000000, entries[0].timestamp)
+        self.assertEqual(20150219004500, entries[-1].timestamp)
+        self.assertEqual(masterfile_lines(4, 1)[0], entries[0].line)
+        gkg = list(index.select("20150219000000", "20150219010000", ".gkg.csv.zip"))
+        self.assertEqual([e for e in entries if e.url.endswith(".gkg.csv.zip")], gkg)
+        self.assertEqual([], list(index.select("20160101000000", "20170101000000")))
+        self.assertEqual(300, len(list(index.select())))
+
+    def test_incremental(self):
+        index = open_index(self.masterfile)
+        self.assertEqual(0, index.update())
+        self.write(masterfile_lines(100, 2) + ["not a line\n", "12 34"], "a")
+        messages = []
+        self.assertEqual(6, index.update(messages.append))
+        self.assertEqual(1, len(messages))
+        # The partial last line waits for the rest of it
+        self.assertEqual(os.path.getsize(self.masterfile) - 5, index.indexed_bytes)
+        reopened = MasterfileIndex(self.masterfile)
+        self.assertEqual(306, len(reopened))
+        self.assertEqual(6, len(list(reopened.select("20150220000000"))))
+
+    def test_out_of_order_append(self):
+        lines = masterfile_lines(0, 100)
+        self.write(lines[:150] + lines[-30:])
+        index = open_index(self.masterfile)
+        self.write(lines[150:-30], "a")
+        self.assertEqual(120, index.update())
+        self.assertEqual(lines,
+                         [e.line for e in index.select()])
+
+    def test_replaced_masterfile(self):
+        open_index(self.masterfile)
+        self.write(masterfile_lines(200, 10))
+        index = open_index(self.masterfile)
+        self.assertEqual(30, len(index))
+
+    def test_last(self):
+        index = open_index(self.masterfile)
+        self.assertEqual(masterfile_lines(98, 2), [e.line for e in index.last(6)])
+        self.assertEqual(masterfile_lines(98, 2), GDELTFile.get_input_files(self.masterfile, 2))
+        gkg = index.last(2, ".gkg.csv.zip")
+        self.assertEqual([masterfile_lines(98, 1)[2], masterfile_lines(99, 1)[2]],
+                         [e.line for e in gkg])
+
+    def test_hour_reads_only_its_records(self):
+        self.write(masterfile_lines(100, 100000), "a")
+        index = open_index(self.masterfile)
+        read = []
+        records = index._records
+
+        def counted_records(start, stop):
+            read.append(stop - start)
+            return records(start, stop)
+        index._records = counted_records
+        entries = list(index.select("20170101000000", "20170101010000", ".export.CSV.zip"))
+        self.assertEqual(4, len(entries))
+        # The four 15 minute sets of the hour, of three files each
+        self.assertEqual([12], read)
+
+    def test_stale_instance_updates(self):
+        first = MasterfileIndex(self.masterfile)
+        second = MasterfileIndex(self.masterfile)
+        self.assertEqual(300, first.update())
+        self.write(masterfile_lines(100, 10), "a")
+        # Picks up what the first instance indexed rather than starting over
+        self.assertEqual(30, second.update())
+        self.assertEqual(330, len(second))
+        self.assertEqual(sorted(["masterfilelist.txt", "masterfilelist.txt.idx",
+                                 "masterfilelist.txt.idx.lock"]),
+                         sorted(os.listdir(self._work.name)))
+
+
+class TestSyncMasterList(unittest.TestCase):
+
+    def setUp(self):
+        self._served = tempfile.TemporaryDirectory()
+        self._work = tempfile.TemporaryDirectory()
+        self._server = StandInServer(self._served.name)
+        self._master_url = GDELTWebData.master_url
+        GDELTWebData.master_url = self._server.url("masterfilelist.txt")
+        self.remote = os.path.join(self._served.name, "masterfilelist.txt")
+        self.local = os.path.join(self._work.name, "masterfilelist.txt")
+        self.publish(masterfile_lines(0, 100))
+
+    def tearDown(self):
+        GDELTWebData.master_url = self._master_url
+        self._server.close()
+        self._served.cleanup()
+        self._work.cleanup()
+
+    def publish(self, lines, mode="w"):
+        with open(self.remote, mode) as f:
+            f.writelines(lines)
+
+    def read_local(self):
+        with open(self.local) as f:
+            return f.read()
+
+    def test_first_sync_downloads(self):
+        filename, appended = GDELTWebData.sync_master_list(self.local)
+        self.assertEqual(self.local, filename)
+        self.assertEqual(os.path.getsize(self.remote), appended)
+        self.assertEqual(300, len(MasterfileIndex(self.local)))
+
+    def test_fetches_only_the_tail(self):
+        GDELTWebData.sync_master_list(self.local)
+        size = os.path.getsize(self.local)
+        new_lines = masterfile_lines(100, 1)
+        self.publish(new_lines, "a")
+        filename, appended = GDELTWebData.sync_master_list(self.local)
+        self.assertEqual(len("".join(new_lines)), appended)
+        self.assertEqual("".join(masterfile_lines(0, 101)), self.read_local())
+        start = size - GDELTWebData.sync_overlap
+        self.assertEqual(f"bytes={start}-", self._server.handler.range_headers[-1])
+        index = MasterfileIndex(self.local)
+        self.assertEqual(303, len(index))
+        self.assertEqual(os.path.getsize(self.local), index.indexed_bytes)
+
+    def test_up_to_date(self):
+        GDELTWebData.sync_master_list(self.local)
+        self.assertEqual((self.local, 0), GDELTWebData.sync_master_list(self.local))
+        self.assertEqual("".join(masterfile_lines(0, 100)), self.read_local())
+
+    def test_rewritten_remote(self):
+        GDELTWebData.sync_master_list(self.local)
+        self.publish(masterfile_lines(500, 50))
+        filename, appended = GDELTWebData.sync_master_list(self.local)
+        self.assertEqual("".join(masterfile_lines(500, 50)), self.read_local())
+        self.assertEqual(os.path.getsize(self.local), appended)
+        self.assertEqual(150, len(MasterfileIndex(self.local)))
+
+    def test_rewritten_remote_with_leftover_tmp(self):
+        GDELTWebData.sync_master_list(self.local)
+        with open(self.local + ".tmp", "w") as f:
+            f.writelines(masterfile_lines(0, 20))
+        self.publish(masterfile_lines(500, 50))
+        GDELTWebData.sync_master_list(self.local)
+        self.assertEqual("".join(masterfile_lines(500, 50)), self.read_local())
+        self.assertFalse(os.path.exists(self.local + ".tmp"))
+        index = MasterfileIndex(self.local)
+        self.assertEqual(150, len(index))
+        self.assertEqual(masterfile_lines(500, 1), [e.line for e in index.select()][:3])
+
+
+if __name__ == '__main__':
+    unittest.main()
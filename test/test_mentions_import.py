@@ -0,0 +1,75 @@
+import unittest
+import os
+import queue
+import zipfile
+
+import events_import
+import import_ledger
+import mentions_import
+
+from test_events_import import EventsTestCase
+
+MENTION = (b"410412347\t20150218230000\t20150218231500\t1\tyahoo.com\t"
+           b"http://news.yahoo.com/some-story-0001.html\t4\t-1\t1306\t1352\t"
+           b"1\t100\t2913\t-2.6004728132388\t\t\n")
+
+
+class TestMentionsImport(EventsTestCase):
+
+    def make_mentions_zip(self, timestamp, lines):
+        name = f"{timestamp}.mentions.CSV"
+        path = os.path.join(self._work.name, name + ".zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(name, b"".join(lines))
+        return path
+
+    def test_typed_columns(self):
+        fields = dict(mentions_import.MENTION_FIELDS)
+        self.assertEqual(16, len(fields))
+        self.assertIs(int, fields["GLOBALEVENTID"])
+        self.assertIs(float, fields["MentionDocTone"])
+        self.assertIsNone(fields["MentionIdentifier"])
+        self.assertIn("Actor1CharOffset", mentions_import.REQUIRED_MENTION_FIELDS)
+        self.assertNotIn("MentionSourceName", mentions_import.REQUIRED_MENTION_FIELDS)
+
+    def test_import_then_index(self):
+        q = queue.Queue()
+        q.put(self.make_mentions_zip("20150218230000", [MENTION] * 150))
+        q.put(self.make_mentions_zip("20150218231500", [MENTION] * 30 + [b"short\n"]))
+        q.put(None)
+        events_import.importer(q, self.opts, mentions_import.MENTIONS)
+        mentions_import.create_event_id_index()
+        mentions = self.client.mentions
+        docs = [doc for batch in mentions.batches for doc in batch]
+        self.assertEqual(180, len(docs))
+        self.assertEqual(410412347, docs[0]["GLOBALEVENTID"])
+        self.assertEqual(-1, docs[0]["Actor1CharOffset"])
+        self.assertEqual(-2.6004728132388, docs[0]["MentionDocTone"])
+        self.assertEqual([], self.client.eventscsv.batches)
+        # Built once, after every batch was in
+        self.assertEqual([("GLOBALEVENTID", len(mentions.batches))], mentions.indexes)
+
+    def test_retry_matches_whole_key(self):
+        path = self.make_mentions_zip("20150218230000", [
+            MENTION.replace(b"news.yahoo.com/some-story-0001.html", b"example.com/%d" % i)
+            for i in range(5)])
+        ledger = import_ledger.ImportLedger(self.client.import_ledger, "mentions")
+        ledger.begin(path)
+        # The same event mentioned by another article isn't a duplicate
+        self.client.mentions.insert_many([
+            {"GLOBALEVENTID": 410412347, "MentionIdentifier": "http://example.com/0"},
+            {"GLOBALEVENTID": 410412347, "MentionIdentifier": "http://other.org/"}])
+        pipeline = events_import.EventPipeline(self.client.mentions, self.opts,
+                                               kind=mentions_import.MENTIONS,
+                                               ledger=ledger)
+        pipeline.add_file(path)
+        pipeline.flush()
+        stored = [doc["MentionIdentifier"] for doc in self.client.mentions.batches[-1]]
+        self.assertEqual([f"http://example.com/{i}" for i in range(1, 5)], stored)
+        self.assertEqual([{"GLOBALEVENTID": {"$in": [410412347]}}],
+                         self.client.mentions.queries)
+        self.assertEqual("GLOBALEVENTID", self.client.mentions.indexes[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
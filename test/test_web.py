@@ -1,6 +1,14 @@
 import unittest
+import hashlib
+import multiprocessing
 import os
-from gdelttools.web import WebDownload, local_path
+import tempfile
+
+import requests
+from gdelttools import web
+from gdelttools.web import WebDownload, DownloadVerificationError, local_path
+
+from http_stand_in import StandInServer
 
 
 class TestDownload(unittest.TestCase):
@@ -42,5 +50,203 @@ class TestDownload(unittest.TestCase):
         self.assertEqual(url_size, line_size)
         os.unlink(self.text_filename+"1")
 
+
+class TestVerifiedDownload(unittest.TestCase):
+
+    payload = b"".join(b"%d\tsome gdelt row\n" % i for i in range(100000))
+
+    def setUp(self):
+        self._served = tempfile.TemporaryDirectory()
+        self._work = tempfile.TemporaryDirectory()
+        with open(os.path.join(self._served.name, "data.zip"), "wb") as f:
+            f.write(self.payload)
+        self._server = StandInServer(self._served.name)
+        self.url = self._server.url("data.zip")
+        self.target = os.path.join(self._work.name, "data.zip")
+        self._wd = WebDownload(chunksize=64 * 1024)
+
+    def tearDown(self):
+        self._server.close()
+        self._served.cleanup()
+        self._work.cleanup()
+
+    def test_verified(self):
+        hasher = hashlib.md5()
+        filename = self._wd.download_url(self.url, self.target, hasher=hasher,
+                                         expected_digest=hashlib.md5(self.payload).hexdigest(),
+                                         expected_size=len(self.payload))
+        self.assertEqual(self.target, filename)
+        self.assertEqual(hashlib.md5(self.payload).hexdigest(), hasher.hexdigest())
+        with open(filename, "rb") as f:
+            self.assertEqual(self.payload, f.read())
+        self.assertEqual(["data.zip"], os.listdir(self._work.name))
+
+    def test_bad_digest(self):
+        with self.assertRaises(DownloadVerificationError):
+            self._wd.download_url(self.url, self.target, hasher=hashlib.md5(),
+                                  expected_digest="0" * 32)
+        self.assertEqual([], os.listdir(self._work.name))
+
+    def test_digest_without_hasher(self):
+        self._wd.download_url(self.url, self.target,
+                              expected_digest=hashlib.md5(self.payload).hexdigest())
+        with self.assertRaises(DownloadVerificationError):
+            self._wd.download_url(self.url, self.target, expected_digest="0" * 32)
+
+    def test_bad_size(self):
+        with self.assertRaises(DownloadVerificationError):
+            self._wd.download_url(self.url, self.target,
+                                  expected_size=len(self.payload) + 1)
+        self.assertEqual([], os.listdir(self._work.name))
+
+    def test_stale_tmp_without_verification(self):
+        for stale in (b"OLD partial", self.payload + b"OLD and longer"):
+            with open(self.target + ".tmp", "wb") as f:
+                f.write(stale)
+            self._wd.download_url(self.url, self.target)
+            with open(self.target, "rb") as f:
+                self.assertEqual(self.payload, f.read())
+            self.assertEqual(["data.zip"], os.listdir(self._work.name))
+
+    def test_failed_request(self):
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self._wd.download_url(self._server.url("missing.zip"), self.target)
+        self.assertEqual([], os.listdir(self._work.name))
+
+
+class TestResumableDownload(TestVerifiedDownload):
+
+    # Only whole chunks reach the file, so the drops fall on chunk boundaries
+    chunk = 64 * 1024
+
+    def setUp(self):
+        super().setUp()
+        self._wd = WebDownload(chunksize=self.chunk, retries=3, backoff=0)
+        self.handler = self._server.handler
+        self.md5 = hashlib.md5(self.payload).hexdigest()
+
+    def download(self, wd=None):
+        return (wd or self._wd).download_url(self.url, self.target, hasher=hashlib.md5(),
+                                             expected_digest=self.md5,
+                                             expected_size=len(self.payload))
+
+    def assert_downloaded(self):
+        with open(self.target, "rb") as f:
+            self.assertEqual(self.payload, f.read())
+        self.assertEqual(["data.zip"], os.listdir(self._work.name))
+
+    def test_resume_after_drop(self):
+        self.handler.drops = 2
+        self.handler.drop_after = 2 * self.chunk
+        self.download()
+        self.assert_downloaded()
+        self.assertEqual([None, f"bytes={2 * self.chunk}-", f"bytes={4 * self.chunk}-"],
+                         self.handler.range_headers)
+
+    def test_resume_without_range_support(self):
+        self.handler.ranges = False
+        self.handler.drops = 1
+        self.handler.drop_after = self.chunk + 1000
+        self.download()
+        self.assert_downloaded()
+        self.assertEqual(2, self.handler.requests)
+
+    def test_retry_status(self):
+        self.handler.statuses.extend([503, 503])
+        self.download()
+        self.assert_downloaded()
+        self.assertEqual(3, self.handler.requests)
+
+    def test_no_retry_on_refusal(self):
+        self.handler.statuses.append(403)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.download()
+        self.assertEqual(1, self.handler.requests)
+
+    def test_keep_partial_for_next_run(self):
+        self.handler.drops = 1
+        self.handler.drop_after = self.chunk
+        with self.assertRaises(requests.exceptions.RequestException):
+            self.download(WebDownload(chunksize=self.chunk, retries=0))
+        self.assertEqual(self.chunk, os.path.getsize(self.target + ".tmp"))
+
+        self.download()
+        self.assert_downloaded()
+        self.assertEqual(f"bytes={self.chunk}-", self.handler.range_headers[-1])
+
+    def test_retries_bounded(self):
+        self.handler.statuses.extend([503] * 10)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.download()
+        self.assertEqual(4, self.handler.requests)
+
+    def test_complete_partial(self):
+        with open(self.target + ".tmp", "wb") as f:
+            f.write(self.payload)
+        self.download()
+        self.assert_downloaded()
+
+    def test_download_lines(self):
+        self.handler.drops = 1
+        self.handler.drop_after = self.chunk + 1000
+        lines = list(self._wd.download_lines(self.url))
+        self.assertEqual(self.payload.decode(), "".join(lines))
+
+
+def download_in_child(url, target, results):
+    fresh = web.session is None and web.connection_stats.requests == 0
+    WebDownload().download_url(url, target)
+    results.put((fresh, web.connection_stats.requests, web.connection_stats.connections))
+
+
+class TestPooledSession(TestVerifiedDownload):
+
+    def setUp(self):
+        super().setUp()
+        web.close_session()
+        web.forget_session()
+
+    def tearDown(self):
+        web.close_session()
+        web.pool_maxsize = web.POOL_MAXSIZE
+        super().tearDown()
+
+    def test_keep_alive(self):
+        for i in range(5):
+            self._wd.download_url(self.url, f"{self.target}.{i}")
+        self.assertEqual(5, web.connection_stats.requests)
+        self.assertEqual(1, web.connection_stats.connections)
+        self.assertEqual(4, web.connection_stats.reused)
+
+    def test_reconnect_after_drop(self):
+        self._server.handler.drops = 1
+        self._server.handler.drop_after = 1000
+        WebDownload(backoff=0).download_url(self.url, self.target)
+        self.assertEqual(2, web.connection_stats.requests)
+        self.assertEqual(2, web.connection_stats.connections)
+
+    def test_worker_process(self):
+        self._wd.download_url(self.url, self.target)
+        parent_session = web.session
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        child = context.Process(target=download_in_child,
+                                args=(self.url, self.target + ".child", results))
+        child.start()
+        self.assertEqual((True, 1, 1), results.get(timeout=10))
+        child.join()
+        self.assertIs(parent_session, web.session)
+        self.assertEqual(1, web.connection_stats.requests)
+
+    def test_pool_maxsize(self):
+        session = web.get_session()
+        web.ensure_pool_maxsize(web.POOL_MAXSIZE - 1)
+        self.assertIs(session, web.get_session())
+        web.ensure_pool_maxsize(web.POOL_MAXSIZE + 8)
+        self.assertIsNot(session, web.get_session())
+        self.assertEqual(web.POOL_MAXSIZE + 8,
+                         web.get_session().get_adapter(self.url)._pool_maxsize)
+
+
 if __name__ == '__main__':
     unittest.main()